@@ -6,6 +6,8 @@ from math import pi
 import tf
 from nav_msgs.msg import Path
 import os
+import sys
+import importlib.util
 from geometry_msgs.msg import PoseStamped, TransformStamped, Quaternion, Point
 
 try:
@@ -15,29 +17,87 @@ except:
 
 from optimizations import *
 
+# import the checker modules on their own, the RigidBodyPlanners package __init__ pulls in ompl and the planner
+sys.path.insert(0, os.path.dirname(importlib.util.find_spec("RigidBodyPlanners").origin))
+from fcl_checker import Fcl_checker
+from robot_geometry import Formation_geometry
+
 # print working directory
 print("Current working directory:", os.getcwd())
 
+# radius of the corridor around the received path the thinned trajectory has to stay in,
+# None sends one polynomial piece per pose
+THINNING_CLEARANCE = 0.05
 
-def callback1(path: Path):
-    if callback1.counter == 0:
-        path_to_pol(path, 1)
-        callback1.counter += 1
+# verify every drone trajectory against the environment before it is published
+VERIFY_TRAJECTORIES = True
+# scene shared with rigidBodyPath.py through the /env_mesh parameter
+DEFAULT_ENV_MESH = "env-scene-ltu-experiment.stl"
+STL_DIRS = ["ros_ws/src/drone_path_planning/resources/stl",
+            "/home/marios/thesis_ws/src/drone_path_planning/resources/stl"]
+# a drone is checked as a sphere of DRONE_RADIUS, sampled so it moves at most VERIFY_CLEARANCE per sample
+DRONE_RADIUS = 0.15
+VERIFY_CLEARANCE = 0.02
 
 
-callback1.counter = 0
+# drones of the formation, their trajectories are published together once all of them are received
+DRONE_IDS = (1, 2)
 
+checker = None
+# cfid -> polynomial message of the drone, None when its trajectory could not be repaired
+formation = {}
 
-def callback2(path: Path):
-    if callback2.counter == 0:
-        path_to_pol(path, 2)
-        callback2.counter += 1
 
+def make_checker(env_mesh_name):
+    """
+    Collision checker of a single drone against env_mesh_name, None when verification is off.
+    """
+    if not VERIFY_TRAJECTORIES:
+        return None
+
+    for stl_dir in STL_DIRS:
+        env_mesh = os.path.join(stl_dir, env_mesh_name)
+        if os.path.isfile(env_mesh):
+            return Fcl_checker(env_mesh, Formation_geometry([[0, 0, 0]], DRONE_RADIUS))
+
+    print("Environment mesh {} not found, trajectories are not verified".format(env_mesh_name))
+    return None
+
+
+def receive_path(path: Path, cfid: int):
+    """
+    Converts the path of one drone and publishes the whole formation once every drone has a trajectory.
+    Nothing is published when the trajectory of any drone collides, the drones would fly a broken formation.
+    """
+    if cfid in formation:
+        return
+
+    formation[cfid] = path_to_pol(path, cfid)
+    if len(formation) < len(DRONE_IDS):
+        return
 
-callback2.counter = 0
+    failed = [drone for drone in DRONE_IDS if formation[drone] is None]
+    if failed:
+        print("Not publishing the formation, the trajectories of drones {} collide".format(failed))
+        return
+
+    for drone in DRONE_IDS:
+        piece_pols_pub.publish(formation[drone])
+        print("Published polynomial piece of drone {}...".format(drone))
+
+
+def callback1(path: Path):
+    receive_path(path, 1)
+
+
+def callback2(path: Path):
+    receive_path(path, 2)
 
 
 def path_to_pol(path: Path, cfid: int):
+    """
+    Polynomial message of the trajectory of drone cfid along path, None when it collides and cannot be repaired.
+    """
     print("Path received...")
     # print(len(path.poses))
 
@@ -55,7 +115,22 @@ def path_to_pol(path: Path, cfid: int):
         # TODO: set constant yaw
         traj_points.append(Point_time(Waypoint(x, y, z, yaw), t=time_step*i))
 
-    pols_coeffs, pc_pols = calculate_trajectory4D(traj_points)
+    indices = None
+    if THINNING_CLEARANCE is not None:
+        indices = thin_indices(traj_points, clearance=THINNING_CLEARANCE)
+        print("Thinned to {} of {} waypoints".format(len(indices), n))
+
+    if checker is not None:
+        # put back waypoints of the received path where the trajectory collides
+        repair = repair_trajectory(traj_points, checker, indices, clearance=VERIFY_CLEARANCE)
+        print(repair)
+        if not repair.valid:
+            return None
+        pc_pols = repair.pc_pols
+    else:
+        if indices is not None:
+            traj_points = [traj_points[i] for i in indices]
+        pols_coeffs, pc_pols = calculate_trajectory4D(traj_points)
 
     pol_to_send = TrajectoryPolynomialPieceMarios()
     pol_to_send.cf_id = cfid
@@ -86,8 +161,7 @@ def path_to_pol(path: Path, cfid: int):
     pol_to_send.poly_yaw = list(matrix[:,   24+1: 32+1].flatten())
     pol_to_send.durations = list(matrix[:, 0].flatten())
 
-    piece_pols_pub.publish(pol_to_send)
-    print("Published polynomial piece...")
+    return pol_to_send
 
 
 def listener():
@@ -99,6 +173,9 @@ def listener():
     # run simultaneously.
     rospy.init_node('drones_path_listener')
 
+    global checker
+    checker = make_checker(rospy.get_param("/env_mesh", DEFAULT_ENV_MESH))
+
     rospy.Subscriber('drone1Path',  Path, callback1)
     rospy.Subscriber('drone2Path',  Path, callback2)
 
@@ -20,6 +20,10 @@ from ompl import geometric as og
 
 print("Current working directory:", os.getcwd())
 DRONES_NUMBER = 5
+# reuse the roadmap saved by previous runs (see PlannerSepCollision.use_roadmap)
+USE_ROADMAP = False
+# scene shared with drones_pols_generator.py through the /env_mesh parameter
+DEFAULT_ENV_MESH = "env-scene-ltu-experiment.stl"
 
 
 class MeshMarker(Marker):
@@ -136,7 +140,7 @@ def calculate_path_FCL():
     # planner = RBPlanner()
     env_mesh_name = "env-scene-hole.stl"
     env_mesh_name = "env-scene-hole-narrow.stl"
-    env_mesh_name = "env-scene-ltu-experiment.stl"
+    env_mesh_name = rospy.get_param("/env_mesh", DEFAULT_ENV_MESH)
 
     robot_mesh_name = "robot-scene-triangle.stl"
     robot_mesh_name = "custom_triangle_robot.stl"
@@ -164,7 +168,10 @@ def calculate_path_FCL():
     print(goal_pose)
     print("==============================")
     planner.set_start_goal(start_pose.pose, goal_pose.pose)
-    planner.set_planner()
+    if USE_ROADMAP:
+        planner.use_roadmap()
+    else:
+        planner.set_planner()
     # planner.set_planner(og.FMT)
 
     planner.solve(timeout=40.0)
@@ -183,7 +190,8 @@ if __name__ == "__main__":
     robPub = rospy.Publisher('rb_robot',  Marker, queue_size=10)
 
     # Environment marker initialization
-    mesh = "package://drone_path_planning/resources/collada/env-scene-ltu-experiment.dae"
+    env_mesh_name = rospy.get_param("/env_mesh", DEFAULT_ENV_MESH)
+    mesh = "package://drone_path_planning/resources/collada/" + os.path.splitext(env_mesh_name)[0] + ".dae"
     env = MeshMarker(id=1, mesh_path=mesh)
     env.color.r = 1
     env.color.g = 0
@@ -6,6 +6,7 @@ from stl import mesh
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits import mplot3d
 from geometry_msgs.msg import Point, PoseStamped, Quaternion, Pose
+from nav_msgs.msg import Path as PathMsg
 import rospy
 import tf
 import numpy as np
@@ -13,24 +14,37 @@ import matplotlib.pyplot as plt
 from math import pi
 
 try:
-    from ompl import base as ob
-    from ompl import geometric as og
-except ImportError:
-    # if the ompl module is not in the PYTHONPATH assume it is installed in a
-    # subdirectory of the parent directory called "py-bindings."
-    import sys
-    from os.path import abspath, dirname, join
-    sys.path.insert(
-        0, join(dirname(dirname(abspath(__file__))), 'py-bindings'))
-    from ompl import base as ob
-    from ompl import geometric as og
-
-try:
+    from .ompl_bindings import ob, og, ou
     from .fcl_checker import Fcl_checker
+    from .motion_validator import ContinuousMotionValidator
+    from .cspace_map import Cspace_map
+    from .sdf import SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN
+    from .validity_cache import Validity_cache
+    from .thread_stats import Thread_stats
+    from .parallel_planning import race_planners, Query_pool
+    from .path_postprocessing import postprocess_path
+    from .roadmap_store import Roadmap_store
+    from .experience_library import Experience_library
+    from .samplers import Narrow_passage_sampler, acceptance_stats
+    from .corridor import Coarse_grid, Corridor, Corridor_sampler, find_corridor
 except ImportError:
+    from ompl_bindings import ob, og, ou
     from fcl_checker import Fcl_checker
+    from motion_validator import ContinuousMotionValidator
+    from cspace_map import Cspace_map
+    from sdf import SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN
+    from validity_cache import Validity_cache
+    from thread_stats import Thread_stats
+    from parallel_planning import race_planners, Query_pool
+    from path_postprocessing import postprocess_path
+    from roadmap_store import Roadmap_store
+    from experience_library import Experience_library
+    from samplers import Narrow_passage_sampler, acceptance_stats
+    from corridor import Coarse_grid, Corridor, Corridor_sampler, find_corridor
 
 import os
+import time
+from contextlib import contextmanager
 
 print("cwd:", os.getcwd())
 
@@ -38,18 +52,33 @@ print("cwd:", os.getcwd())
 SHOW_VALID_STATES_CNTR = 0
 
 
+def mesh_path(stl_dir, name):
+    # absolute paths and robot geometry objects (robot_geometry.Formation_geometry) are used as they are
+    if not isinstance(name, str) or os.path.isabs(name):
+        return name
+
+    return os.path.join(stl_dir, name)
+
+
 class PlannerSepCollision:
-    def __init__(self, env_mesh_name, robot_mesh_name) -> None:
-        self.time_sum = 0
-        self.states_tried = 0
+    def __init__(self, env_mesh_name, robot_mesh_name, continuous_motion=True) -> None:
+        """
+        env_mesh_name can be a scene_env.Fcl_scene, its obstacles are then edited with
+        add_obstacle / move_obstacle / remove_obstacle without rebuilding the planner
+
+        continuous_motion: validate edges with ContinuousMotionValidator (one call per edge),
+        otherwise discretize them at a 0.001 state validity checking resolution
+        """
+        # validity statistics, updated without locks from every planner thread
+        self.stats = Thread_stats()
+        self.env_mesh_name, self.robot_mesh_name = env_mesh_name, robot_mesh_name
         # env_mesh_name and robot_mesh_name are type of "env-scene-hole.stl"
         try:
-            env_mesh = "ros_ws/src/drone_path_planning/resources/stl/{}".format(
-                env_mesh_name)
-            robot_mesh = "ros_ws/src/drone_path_planning/resources/stl/{}".format(
-                robot_mesh_name)
+            env_mesh = mesh_path("ros_ws/src/drone_path_planning/resources/stl", env_mesh_name)
+            robot_mesh = mesh_path("ros_ws/src/drone_path_planning/resources/stl", robot_mesh_name)
 
             self.checker = Fcl_checker(env_mesh, robot_mesh)
+            self.stl_dir = "ros_ws/src/drone_path_planning/resources/stl"
 
             # try:
             #     checker = Fcl_checker(env_mesh, robot_mesh)
@@ -59,12 +88,42 @@ class PlannerSepCollision:
             #         prefix+env_mesh, prefix + robot_mesh)
         except:
             print("cwd:", os.getcwd())
-            env_mesh = r"/home/marios/thesis_ws/src/drone_path_planning/resources/stl/{}".format(
-                env_mesh_name)
-            robot_mesh = r"/home/marios/thesis_ws/src/drone_path_planning/resources/stl/{}".format(
-                robot_mesh_name)
+            env_mesh = mesh_path(r"/home/marios/thesis_ws/src/drone_path_planning/resources/stl",
+                                 env_mesh_name)
+            robot_mesh = mesh_path(r"/home/marios/thesis_ws/src/drone_path_planning/resources/stl",
+                                   robot_mesh_name)
 
             self.checker = Fcl_checker(env_mesh, robot_mesh)
+            self.stl_dir = r"/home/marios/thesis_ws/src/drone_path_planning/resources/stl"
+
+        # precomputed C-space occupancy answering most validity queries (see set_cspace_map)
+        self.cspace_map = None
+        # quantized pose -> validity cache (see enable_validity_cache)
+        self.validity_cache = None
+        # collision_backends.Collision_backend used instead of the checker (see set_collision_backend)
+        self.backend = None
+        # multi-query roadmap kept on disk between runs (see use_roadmap)
+        self.roadmap_store = None
+        self.roadmap_cost_threshold = None
+        # past solutions reused by solve_with_experience (see use_experience)
+        self.experience = None
+        # collision checks of the last solve in lazy mode (see set_lazy_planner)
+        self.lazy_stats = None
+        # acceptance counters of the narrow passage samplers (see set_valid_state_sampler)
+        self.sampler_stats = None
+        # (strategy, kwargs) of set_valid_state_sampler, None for the default sampler
+        self.valid_state_sampler = None
+        # coarse A* guide of plan_corridor
+        self.coarse_grid = None
+        self.corridor = None
+        # corridor sampling bias, None unless plan_corridor runs in "sampler" mode
+        self.corridor_bias = None
+        # (low, high) replaced by a plan_corridor in "bounds" mode
+        self.bounds_before_corridor = None
+        # warm worker processes of solve_many
+        self.query_pool = None
+        # path_postprocessing parameters used by solve instead of simplify + interpolate(50)
+        self.postprocessing = None
 
         self.space = ob.RealVectorStateSpace(4)
 
@@ -76,7 +135,11 @@ class PlannerSepCollision:
         self.ss.setStateValidityChecker(
             ob.StateValidityCheckerFn(self.isStateValid))
 
-        self.ss.getSpaceInformation().setStateValidityCheckingResolution(0.001)
+        self.motion_validator = None
+        if continuous_motion:
+            self.set_motion_validator()
+        else:
+            self.ss.getSpaceInformation().setStateValidityCheckingResolution(0.001)
         # set problem optimization objective
         self.set_optim_objective()
 
@@ -85,29 +148,298 @@ class PlannerSepCollision:
         print("Space Bounds Low:", self.space.getBounds(
         ).low[0], self.space.getBounds().low[1], self.space.getBounds().low[2])
 
+    def set_motion_validator(self, tolerance=1e-3, max_iterations=200):
+        si = self.ss.getSpaceInformation()
+        # keep a reference, the space information does not own the python object
+        self.motion_validator = ContinuousMotionValidator(
+            si, self.backend or self.checker, tolerance, max_iterations)
+        si.setMotionValidator(self.motion_validator)
+
+    def set_collision_backend(self, backend):
+        """
+        Answer state and edge queries with a collision_backends.Collision_backend
+        (e.g. the one picked by collision_backends.select_backend). Pass None to go back
+        to the planner's Fcl_checker.
+        """
+        self.backend = backend
+        if self.motion_validator is not None:
+            self.set_motion_validator(self.motion_validator.tolerance,
+                                      self.motion_validator.max_iterations)
+
+    def add_obstacle(self, name, mesh_or_geometry, T=[0, 0, 0], q=[0, 0, 0, 1]):
+        """
+        Add an STL mesh (file name) or an fcl primitive to the scene_env.Fcl_scene environment.
+        """
+        if isinstance(mesh_or_geometry, str):
+            self.checker.env.add_mesh(name, mesh_path(self.stl_dir, mesh_or_geometry), T, q)
+        else:
+            self.checker.env.add_object(name, mesh_or_geometry, T, q)
+        self.environment_changed()
+
+    def move_obstacle(self, name, T, q=[0, 0, 0, 1]):
+        self.checker.env.move_object(name, T, q)
+        self.environment_changed()
+
+    def remove_obstacle(self, name):
+        self.checker.env.remove_object(name)
+        self.environment_changed()
+
+    def environment_changed(self):
+        """
+        Forget everything that was derived from the previous scene: the planner data,
+        the cached validity answers, the SDF, the C-space map and the corridor of
+        plan_corridor (its sampler and bounds go too, call plan_corridor again to get one
+        around the new obstacles). The experience library switches to the one of the new
+        scene. The meshes, the BVHs and the planner setup are kept.
+        """
+        if self.corridor is not None or self.bounds_before_corridor is not None:
+            self.clear_corridor()
+        self.ss.clear()
+        self.coarse_grid = None
+        self.close_query_pool()
+        if self.validity_cache is not None:
+            self.validity_cache.clear()
+        if self.checker.sdf is not None and self.checker.sdf.content_hash != self.checker.env.content_hash:
+            self.checker.set_sdf(None)
+        if self.cspace_map is not None and self.cspace_map.env_hash != self.checker.env.content_hash:
+            self.cspace_map = None
+        if self.experience is not None and self.experience.env_hash != self.checker.env.content_hash:
+            self.use_experience(self.experience.max_paths, self.experience.directory)
+
+    def set_cspace_map(self, cspace_map: Cspace_map):
+        """
+        Answer state validity queries from a precomputed C-space map, fcl is only called
+        for the cells the map could not decide. Pass None to disable it.
+        """
+        if cspace_map is not None:
+            if cspace_map.env_hash != self.checker.env.content_hash:
+                raise ValueError("The C-space map was built for a different environment mesh")
+            if cspace_map.robot_hash != self.checker.robot.content_hash:
+                raise ValueError("The C-space map was built for a different robot")
+
+        self.cspace_map = cspace_map
+
+    def build_cspace_map(self, resolution=0.1, yaw_bins=16, file_name=None):
+        """
+        Build (or load from file_name when it exists and matches the scene and robot) the
+        C-space map of the planning bounds.
+        """
+        cspace_map = None
+        if file_name is not None and os.path.isfile(file_name):
+            cspace_map = Cspace_map.load(file_name)
+            if (cspace_map.env_hash, cspace_map.robot_hash) != (self.checker.env.content_hash,
+                                                                self.checker.robot.content_hash):
+                print("C-space map {} is stale, rebuilding it".format(file_name))
+                cspace_map = None
+
+        if cspace_map is None:
+            bounds = self.space.getBounds()
+            low = [bounds.low[i] for i in range(3)]
+            high = [bounds.high[i] for i in range(3)]
+            print("Building C-space map...")
+            cspace_map = Cspace_map.build(self.checker, low, high, resolution, yaw_bins)
+            if file_name is not None:
+                cspace_map.save(file_name)
+
+        self.set_cspace_map(cspace_map)
+        return cspace_map
+
+    def enable_validity_cache(self, pos_resolution=0.01, yaw_resolution=0.01, max_size=100000,
+                              conservative=False):
+        self.validity_cache = Validity_cache(
+            pos_resolution, yaw_resolution, max_size, conservative)
+
+        return self.validity_cache
+
+    def disable_validity_cache(self):
+        self.validity_cache = None
+
     def set_optim_objective(self, objective_class=ob.MechanicalWorkOptimizationObjective):
+        self.objective_class = objective_class
         self.ss.setOptimizationObjective(
             objective_class(self.ss.getSpaceInformation()))
 
-    def set_planner(self, planner_class=og.RRT):
+    @property
+    def time_sum(self):
+        return self.stats.get("time_sum")
+
+    @property
+    def states_tried(self):
+        return self.stats.get("states_tried")
+
+    def clone(self):
+        """
+        New planner on the same environment and robot objects (with their runtime obstacles)
+        and with the same bounds, objective and cost threshold, collision settings (backend,
+        SDF, C-space map, motion validator), samplers and start/goal. The validity cache
+        settings are copied but the new planner starts with an empty cache.
+
+        Used by the worker processes of race_planners and solve_many, the caller picks the
+        planner with set_planner.
+        """
+        other = type(self)(self.checker.env, self.checker.robot,
+                           continuous_motion=self.motion_validator is not None)
+        other.env_mesh_name, other.robot_mesh_name = self.env_mesh_name, self.robot_mesh_name
+
+        bounds = self.space.getBounds()
+        other.set_bounds([bounds.low[i] for i in range(3)], [bounds.high[i] for i in range(3)])
+
+        other.set_optim_objective(self.objective_class)
+        other.ss.getOptimizationObjective().setCostThreshold(
+            self.ss.getOptimizationObjective().getCostThreshold())
+
+        other.checker.set_sdf(self.checker.sdf)
+        other.set_collision_backend(self.backend)
+        other.set_cspace_map(self.cspace_map)
+        if self.motion_validator is not None:
+            other.set_motion_validator(self.motion_validator.tolerance, self.motion_validator.max_iterations)
+
+        if self.validity_cache is not None:
+            cache = self.validity_cache
+            other.enable_validity_cache(cache.pos_resolution, cache.yaw_resolution, cache.max_size,
+                                        cache.conservative)
+            other.validity_cache.boundary_margin = cache.boundary_margin
+
+        if self.valid_state_sampler is not None:
+            strategy, kwargs = self.valid_state_sampler
+            other.set_valid_state_sampler(strategy, **kwargs)
+        other.coarse_grid = self.coarse_grid
+        other.bounds_before_corridor = self.bounds_before_corridor
+        if self.corridor_bias is not None:
+            other.set_corridor_sampler(self.corridor, self.corridor_bias)
+        else:
+            other.corridor = self.corridor
+        other.postprocessing = self.postprocessing
+
+        if getattr(self, "start_state", None) is not None:
+            other.set_start_goal_states(self.start_state, self.goal_state)
+
+        return other
+
+    def set_planner(self, planner_class=og.RRT, threads=None):
+        """
+        threads: thread count of multithreaded planners (og.pRRT, og.pSBL), the collision
+        checker keeps per-thread robot objects so the validity callbacks can run concurrently
+        """
         # choose planner
         planner = planner_class(self.ss.getSpaceInformation())
+        if threads is not None and hasattr(planner, "setThreadCount"):
+            planner.setThreadCount(threads)
+        # set_lazy_planner turns lazy mode back on, use_roadmap the multi-query mode
+        self.lazy_stats = None
+        self.roadmap_store = None
 
         self.ss.setPlanner(planner)
         self.ss.setup()
 
-    def set_bounds(self):
+    def use_roadmap(self, planner_class=og.LazyPRM, store=None, cost_threshold=float("inf")):
+        """
+        Multi-query mode: plan with a roadmap planner (og.LazyPRM, og.PRM, ...) whose graph is
+        saved after every solve and reloaded by the next planner with the same environment,
+        robot and bounds, so repeated start/goal queries reuse it.
+
+        cost_threshold: the roadmap planners keep growing the graph until the objective is
+        satisfied, the default (inf) makes them return at the first solution instead of
+        running until the timeout. It only applies to the roadmap solves (see cost_threshold).
+        """
+        self.roadmap_store = store or Roadmap_store()
+        self.roadmap_planner = planner_class
+        self.roadmap_cost_threshold = cost_threshold
+
+        data = self.roadmap_store.load(self.ss.getSpaceInformation(), *self.roadmap_key())
+        planner = planner_class(data) if data is not None else planner_class(self.ss.getSpaceInformation())
+
+        self.ss.setPlanner(planner)
+        self.ss.setup()
+
+    @contextmanager
+    def cost_threshold(self, cost):
+        """
+        Set the cost threshold of the optimization objective (the planners return as soon as a
+        solution reaches it) for the duration of the with block, None keeps the current one.
+        """
+        objective = self.ss.getOptimizationObjective()
+        previous = objective.getCostThreshold().value()
+        if cost is not None:
+            objective.setCostThreshold(ob.Cost(cost))
+        try:
+            yield objective
+        finally:
+            objective.setCostThreshold(ob.Cost(previous))
+
+    def roadmap_key(self):
+        bounds = self.space.getBounds()
+        return (self.checker.env.content_hash, self.checker.robot.content_hash,
+                [[bounds.low[i] for i in range(4)], [bounds.high[i] for i in range(4)]],
+                self.roadmap_planner.__name__)
+
+    def save_roadmap(self):
+        return self.roadmap_store.save(self.ss, *self.roadmap_key())
+
+    def set_lazy_planner(self, planner_class=og.LazyRRT):
+        """
+        Lazy mode: og.LazyRRT, og.LazyPRM or og.LazyPRMstar grow their tree / roadmap without
+        collision checks and only validate the states and edges of a candidate solution,
+        the invalid ones are removed and the search goes on. After solve(), lazy_stats holds
+        the checks that were done against the size of the graph that was built.
+        """
+        self.set_planner(planner_class)
+        self.lazy_stats = {}
+
+    def motion_counts(self):
+        if self.motion_validator is None:
+            return 0, 0
+
+        return self.motion_validator.motions_checked, self.motion_validator.motions_invalid
+
+    def set_valid_state_sampler(self, strategy="bridge", **kwargs):
+        """
+        Draw the valid samples of the planner with a samplers.Narrow_passage_sampler
+        ("gaussian", "bridge" or "obstacle"), "uniform" restores the default sampler.
+        Only the planners that ask for valid samples use it (og.PRM, og.PRMstar, og.LazyPRM, ...).
+
+        kwargs: Narrow_passage_sampler parameters (stddev, yaw_stddev, batch_size, ...)
+        """
+        si = self.ss.getSpaceInformation()
+        if strategy == "uniform":
+            si.clearValidStateSamplerAllocator()
+            self.sampler_stats = None
+            self.valid_state_sampler = None
+            return
+
+        self.valid_state_sampler = (strategy, kwargs)
+
+        bounds = self.space.getBounds()
+        low = [bounds.low[i] for i in range(4)]
+        high = [bounds.high[i] for i in range(4)]
+        self.sampler_stats = Thread_stats()
+
+        # the shared_ptr handed to OMPL holds a reference to the python sampler, it lives as
+        # long as the planner that allocated it
+        def allocate(si):
+            return Narrow_passage_sampler(si, self.check_states, low, high, strategy,
+                                          stats=self.sampler_stats, **kwargs)
+
+        si.setValidStateSamplerAllocator(ob.ValidStateSamplerAllocator(allocate))
+
+    def set_bounds(self, low=None, high=None):
+        """
+        low, high: (x, y, z) limits, the default ones cover the arena. The yaw is always -pi..pi.
+        """
+        low = [-2.2, 2.8, 0.5] if low is None else low
+        high = [2.2, 5.0, 2.5] if high is None else high
+
         bounds = ob.RealVectorBounds(4)
         # set bounds for x, y, z , rotation
-        bounds.low[0] = -2.2
-        bounds.low[1] = 2.8
-        bounds.low[2] = 0.5
+        bounds.low[0] = low[0]
+        bounds.low[1] = low[1]
+        bounds.low[2] = low[2]
         bounds.low[3] = -pi
 
         # set bounds for x, y, z, rotation
-        bounds.high[0] = 2.2
-        bounds.high[1] = 5.0
-        bounds.high[2] = 2.5
+        bounds.high[0] = high[0]
+        bounds.high[1] = high[1]
+        bounds.high[2] = high[2]
         bounds.high[3] = pi
 
         # bounds.setLow(-10)
@@ -116,6 +448,75 @@ class PlannerSepCollision:
 
         return bounds
 
+    def plan_corridor(self, resolution=0.25, yaw_bins=8, dilation=1, mode="sampler", bias=0.9):
+        """
+        Two-level planning: A* on a coarse (x, y, z, yaw) grid of the bounds finds a corridor
+        from the start to the goal, the planner then focuses on it.
+
+        mode: "sampler" draws a `bias` fraction of the samples inside the corridor (complete,
+        works with every planner), "bounds" shrinks the bounds to the box around the corridor
+
+        Call after set_start_goal and before solve. Returns the Corridor, None when the coarse
+        grid has no path (the planner is left unchanged). clear_corridor restores the bounds
+        that were in force before.
+        """
+        if self.bounds_before_corridor is not None:
+            low, high = self.bounds_before_corridor
+        else:
+            bounds = self.space.getBounds()
+            low = [bounds.low[i] for i in range(3)]
+            high = [bounds.high[i] for i in range(3)]
+        grid = self.coarse_grid
+        if grid is None or grid.resolution != resolution or grid.yaw_bins != yaw_bins or \
+                list(grid.low) != low or list(grid.high) != high:
+            grid = Coarse_grid.build(self.check_states, low, high, resolution, yaw_bins)
+            self.coarse_grid = grid
+
+        cells = find_corridor(grid, self.start_state, self.goal_state)
+        if cells is None:
+            print("No corridor found on the coarse grid")
+            return None
+
+        if mode == "bounds":
+            self.corridor = Corridor(grid, cells, dilation)
+            self.bounds_before_corridor = (low, high)
+            self.set_bounds(*self.corridor.bounds())
+        elif mode == "sampler":
+            self.restore_bounds()
+            self.set_corridor_sampler(Corridor(grid, cells, dilation), bias)
+        else:
+            raise ValueError("Unknown corridor mode: {}".format(mode))
+
+        # the samplers of the previous setup are bound to the old bounds / allocator
+        self.ss.clear()
+        self.ss.setup()
+
+        return self.corridor
+
+    def set_corridor_sampler(self, corridor: Corridor, bias=0.9):
+        """
+        Draw a `bias` fraction of the state samples inside the corridor (see plan_corridor).
+        """
+        self.corridor, self.corridor_bias = corridor, bias
+
+        def allocate(space):
+            return Corridor_sampler(space, corridor, bias)
+
+        self.space.setStateSamplerAllocator(ob.StateSamplerAllocator(allocate))
+
+    def restore_bounds(self):
+        # undo the bounds of a plan_corridor in "bounds" mode
+        if self.bounds_before_corridor is not None:
+            self.set_bounds(*self.bounds_before_corridor)
+            self.bounds_before_corridor = None
+
+    def clear_corridor(self):
+        self.corridor, self.corridor_bias = None, None
+        self.space.clearStateSamplerAllocator()
+        self.restore_bounds()
+        self.ss.clear()
+        self.ss.setup()
+
     def save_path(self, file_name="path.txt"):
         # save the path
         print("Saving path to %s" % file_name)
@@ -124,22 +525,27 @@ class PlannerSepCollision:
         text_file.close()
 
     def set_start_goal(self, start_pose: Pose, goal_pose: Pose, transform=False):
+        start_yaw = tf.transformations.euler_from_quaternion(
+            [start_pose.orientation.x, start_pose.orientation.y, start_pose.orientation.z, start_pose.orientation.w])[2]
+        goal_yaw = tf.transformations.euler_from_quaternion(
+            [goal_pose.orientation.x, goal_pose.orientation.y, goal_pose.orientation.z, goal_pose.orientation.w])[2]
 
-        # define start state
-        start = ob.State(self.space)
+        return self.set_start_goal_states(
+            [start_pose.position.x, start_pose.position.y, start_pose.position.z, start_yaw],
+            [goal_pose.position.x, goal_pose.position.y, goal_pose.position.z, goal_yaw])
 
-        start[0] = start_pose.position.x
-        start[1] = start_pose.position.y
-        start[2] = start_pose.position.z
-        start[3] = tf.transformations.euler_from_quaternion(
-            [start_pose.orientation.x, start_pose.orientation.y, start_pose.orientation.z, start_pose.orientation.w])[2]
+    def set_start_goal_states(self, start_state, goal_state):
+        """
+        start_state, goal_state: (x, y, z, yaw)
+        """
+        self.start_state, self.goal_state = list(start_state), list(goal_state)
 
+        # define start state
+        start = ob.State(self.space)
         goal = ob.State(self.space)
-        goal[0] = goal_pose.position.x
-        goal[1] = goal_pose.position.y
-        goal[2] = goal_pose.position.z
-        goal[3] = tf.transformations.euler_from_quaternion(
-            [goal_pose.orientation.x, goal_pose.orientation.y, goal_pose.orientation.z, goal_pose.orientation.w])[2]
+        for i in range(4):
+            start[i] = start_state[i]
+            goal[i] = goal_state[i]
 
         print("start:", start)
         print("goal:", goal)
@@ -148,20 +554,45 @@ class PlannerSepCollision:
         # return the start & goal states
         return start, goal
 
+    def path_from_states(self, states):
+        """
+        og.PathGeometric of this planner's space through the (N, 4) states.
+        """
+        path = og.PathGeometric(self.ss.getSpaceInformation())
+        for s in states:
+            state = ob.State(self.space)
+            for i in range(4):
+                state[i] = float(s[i])
+            path.append(state())
+
+        return path
+
     def solve(self, timeout=15.0):
         #
 
         # this will automatically choose a default planner with
         # default parameters
         print(f"Solving with timeout: {timeout} sec...")
-        solved = self.ss.solve(timeout)
+        if self.roadmap_store is not None:
+            # keep the roadmap, only forget the previous start and goal
+            self.ss.getPlanner().clearQuery()
+        states_before, motions_before = self.states_tried, self.motion_counts()
+        with self.cost_threshold(self.roadmap_cost_threshold if self.roadmap_store is not None else None):
+            solved = self.ss.solve(timeout)
+        if self.lazy_stats is not None:
+            self.update_lazy_stats(states_before, motions_before)
+        if self.roadmap_store is not None:
+            self.save_roadmap()
         if solved:
             print("Found solution...")
-            # try to shorten the path
-            self.ss.simplifySolution()
-            # print the simplified path
-            path = self.ss.getSolutionPath()
-            path.interpolate(50)
+            if self.postprocessing is not None:
+                path = self.postprocess_solution()
+            else:
+                # try to shorten the path
+                self.ss.simplifySolution()
+                # print the simplified path
+                path = self.ss.getSolutionPath()
+                path.interpolate(50)
 
             self.path = path
             self.save_path()
@@ -169,9 +600,292 @@ class PlannerSepCollision:
             print("No solution found")
 
         print("Tried {} states --> average time: {} msec".format(self.states_tried,
-              self.time_sum / self.states_tried*1000))
+              self.time_sum / max(self.states_tried, 1)*1000))
+        if self.motion_validator is not None:
+            print("Checked {} motions --> {} invalid".format(self.motion_validator.motions_checked,
+                  self.motion_validator.motions_invalid))
+        if self.validity_cache is not None:
+            print("Validity cache:", self.validity_cache.stats())
+        if self.cspace_map is not None:
+            print("C-space map answered {} of {} lookups".format(self.cspace_map.hits,
+                  self.cspace_map.hits + self.cspace_map.misses))
+        if self.lazy_stats is not None:
+            print("Lazy planning:", self.lazy_stats)
+        if self.sampler_stats is not None:
+            print("Valid state sampler:", acceptance_stats(self.sampler_stats))
         return solved
 
+    def update_lazy_stats(self, states_before, motions_before):
+        data = ob.PlannerData(self.ss.getSpaceInformation())
+        self.ss.getPlannerData(data)
+
+        checked, invalid = self.motion_counts()
+        self.lazy_stats = {
+            "vertices": data.numVertices(),
+            "edges": data.numEdges(),
+            "states_checked": self.states_tried - states_before,
+            "motions_checked": checked - motions_before[0],
+            "motions_invalid": invalid - motions_before[1],
+        }
+
+    def iter_solutions(self, timeout=40.0, slice_time=1.0, min_improvement=0.01, patience=2,
+                       target_cost=None):
+        """
+        Anytime solving for asymptotically optimal planners (og.RRTstar, og.BITstar, og.PRMstar, ...):
+        the planner runs in slices of slice_time and every improved exact solution is yielded as
+        (cost, (N, 4) interpolated states, elapsed sec) as soon as it is found.
+
+        Stops at the timeout, when the cost reaches target_cost, or after `patience` slices
+        in a row that did not improve the cost by more than min_improvement (relative).
+        """
+        # target_cost lets the planner itself return as soon as the target is met,
+        # the previous threshold is restored when the generator finishes or is closed
+        with self.cost_threshold(target_cost) as objective:
+            t0 = time.time()
+            best, stale = float("inf"), 0
+            while time.time() - t0 < timeout:
+                self.ss.solve(min(slice_time, timeout - (time.time() - t0)))
+                if not self.ss.haveExactSolutionPath():
+                    continue
+
+                path = self.ss.getSolutionPath()
+                cost = path.cost(objective).value()
+                if cost < best:
+                    improved = best == float("inf") or best - cost > min_improvement * abs(best)
+                    best = cost
+
+                    copy = og.PathGeometric(path)
+                    copy.interpolate(50)
+                    yield cost, np.array([[s[i] for i in range(4)] for s in copy.getStates()]), time.time() - t0
+
+                    stale = 0 if improved else stale + 1
+                else:
+                    stale += 1
+
+                if (target_cost is not None and cost <= target_cost) or stale >= patience:
+                    return
+
+    def solve_anytime(self, timeout=40.0, callback=None, topic=None, **kwargs):
+        """
+        Run iter_solutions and hand every improved solution to callback(cost, states, elapsed)
+        and / or publish it as a nav_msgs/Path on `topic`, so trajectory generation can start
+        on the first feasible path. The final solution is simplified and saved like solve().
+
+        kwargs: iter_solutions parameters (slice_time, min_improvement, patience, target_cost)
+        """
+        publisher = rospy.Publisher(topic, PathMsg, queue_size=1, latch=True) if topic else None
+
+        found = False
+        for cost, states, elapsed in self.iter_solutions(timeout, **kwargs):
+            print("Improved solution: cost {:.4f} after {:.2f} sec".format(cost, elapsed))
+            found = True
+            if callback is not None:
+                callback(cost, states, elapsed)
+            if publisher is not None:
+                publisher.publish(self.path_msg(states))
+
+        if not found:
+            print("No solution found")
+            return False
+
+        self.ss.simplifySolution()
+        path = self.ss.getSolutionPath()
+        path.interpolate(50)
+
+        self.path = path
+        self.save_path()
+        return True
+
+    def path_msg(self, states):
+        msg = PathMsg()
+        msg.header.frame_id = "world"
+        msg.header.stamp = rospy.get_rostime()
+        for s in states:
+            pose = PoseStamped()
+            pose.header = msg.header
+            pose.pose.position = Point(s[0], s[1], s[2])
+            pose.pose.orientation = Quaternion(*tf.transformations.quaternion_from_euler(0, 0, s[3]))
+            msg.poses.append(pose)
+
+        return msg
+
+    def set_postprocessing(self, enabled=True, **kwargs):
+        """
+        Replace the simplify + interpolate(50) of solve() with path_postprocessing: shortcutting
+        with batch collision checks, then waypoints spaced by the clearance and the yaw change.
+
+        kwargs: postprocess_path parameters (resolution, min_step, max_step, clearance_gain, max_yaw_step)
+        """
+        self.postprocessing = kwargs if enabled else None
+
+    def postprocess_solution(self):
+        states = np.array([[s[i] for i in range(4)] for s in self.ss.getSolutionPath().getStates()])
+        waypoints = postprocess_path(states, self.check_states, self.clearances,
+                                     self.checker.robot_radius, **self.postprocessing)
+        print("Post-processing: {} states --> {} waypoints".format(len(states), len(waypoints)))
+
+        return self.path_from_states(waypoints)
+
+    def solve_race(self, timeout=15.0, planners=None, mode="first", seeds=None):
+        """
+        Race several planners on this problem in separate processes (see parallel_planning).
+
+        mode: "first" returns the first exact solution and cancels the others, "best" waits
+        until the deadline and returns the cheapest one
+        """
+        result = race_planners(self, timeout, planners, mode, seeds)
+        print(result)
+
+        if result.states is not None:
+            path = self.path_from_states(result.states)
+            path.interpolate(50)
+
+            self.path = path
+            self.save_path()
+
+        return result
+
+    def use_experience(self, max_paths=200, directory=None):
+        """
+        Keep the solutions of this environment and robot in an Experience_library on disk.
+        """
+        kwargs = {} if directory is None else {"directory": directory}
+        self.experience = Experience_library(self.checker.env.content_hash,
+                                             self.checker.robot.content_hash, max_paths=max_paths, **kwargs)
+
+        return self.experience
+
+    def check_states(self, states):
+        states = np.asarray(states, dtype=np.float64)
+        if self.backend is not None:
+            return self.backend.check_states(states[:, :3], states[:, 3])
+
+        return self.checker.check_collision_batch(states[:, :3], states[:, 3])
+
+    def clearances(self, positions, yaws):
+        """
+        (N,) distances between the robot and the environment, from the active backend.
+        """
+        if self.backend is not None:
+            return self.backend.distances(positions, yaws)
+
+        return self.checker.distance_batch(positions, yaws)
+
+    def plan_between(self, start_state, goal_state, timeout):
+        """
+        (N, 4) states of an exact solution from start_state to goal_state, None without one.
+        Replaces the start and goal of the planner.
+        """
+        if timeout <= 0:
+            return None
+
+        self.ss.clear()
+        self.set_start_goal_states(start_state, goal_state)
+        self.ss.solve(timeout)
+        if not self.ss.haveExactSolutionPath():
+            return None
+
+        return np.array([[s[i] for i in range(4)] for s in self.ss.getSolutionPath().getStates()])
+
+    def repair_path(self, states, timeout=1.0):
+        """
+        Make a retrieved path valid for the current environment: valid edges are kept, every
+        broken stretch is bridged by a short plan from its last valid state to the next one.
+
+        Returns the repaired (N, 4) states or None when an end point is invalid or a bridge
+        could not be planned in time.
+        """
+        states = np.asarray(states, dtype=np.float64)
+        collisions = self.check_states(states)
+        if collisions[0] or collisions[-1]:
+            return None
+
+        checker = self.backend or self.checker
+        deadline = time.time() + timeout
+        repaired = [states[0]]
+        i = 0
+        while i < len(states) - 1:
+            j = i + 1
+            if not collisions[j] and checker.check_motion(states[i], states[j])[0]:
+                repaired.append(states[j])
+                i = j
+                continue
+
+            # the last state is valid, so this stops
+            while collisions[j]:
+                j += 1
+            bridge = self.plan_between(states[i], states[j], deadline - time.time())
+            if bridge is None:
+                return None
+
+            repaired.extend(bridge[1:])
+            i = j
+
+        return np.array(repaired)
+
+    def solve_with_experience(self, timeout=15.0, repair_timeout=1.0, candidates=3):
+        """
+        Retrieve the stored paths closest to the start and goal and return the first one that
+        can be repaired, plan from scratch only when none can. New solutions are stored.
+        """
+        if self.experience is None:
+            self.use_experience()
+
+        start, goal = self.start_state, self.goal_state
+        t0 = time.time()
+        for i, states in self.experience.retrieve(start, goal, candidates):
+            remaining = timeout - (time.time() - t0)
+            repaired = self.repair_path(np.vstack([start, states, goal]), min(repair_timeout, remaining))
+            if repaired is None:
+                continue
+
+            print("Reused stored path {} ({:.3f} sec)".format(i, time.time() - t0))
+            self.experience.mark_used(i)
+            self.set_start_goal_states(start, goal)
+
+            path = self.path_from_states(repaired)
+            self.ss.getPathSimplifier().simplifyMax(path)
+            path.interpolate(50)
+
+            self.path = path
+            self.save_path()
+            return True
+
+        self.experience.misses += 1
+        self.ss.clear()
+        self.set_start_goal_states(start, goal)
+        solved = self.solve(max(timeout - (time.time() - t0), 0.1))
+        if solved and self.ss.haveExactSolutionPath():
+            self.experience.add([[s[i] for i in range(4)] for s in self.path.getStates()])
+
+        return solved
+
+    def solve_many(self, starts, goals, timeout=15.0, n_workers=None, planner_class=og.RRT):
+        """
+        Solve a batch of (x, y, z, yaw) start/goal pairs on a pool of warm worker processes
+        (see parallel_planning.Query_pool), each holding the environment once. The pool is kept
+        for the next batches until close_query_pool() or an environment change.
+
+        Returns the Query_results in the order of the queries, a failed query does not stop the others.
+        """
+        if self.query_pool is not None and self.query_pool.planner_class is not planner_class:
+            self.close_query_pool()
+        if self.query_pool is None:
+            self.query_pool = Query_pool(self, n_workers, planner_class)
+
+        results = self.query_pool.solve(starts, goals, timeout)
+        print("Solved {} of {} queries".format(sum(r.solved for r in results), len(results)))
+        for r in results:
+            if not r.solved:
+                print(r)
+
+        return results
+
+    def close_query_pool(self):
+        if self.query_pool is not None:
+            self.query_pool.close()
+            self.query_pool = None
+
     def visualize_path(self, path_file="path.txt"):
         try:
             data = np.loadtxt(path_file)
@@ -209,16 +923,35 @@ class PlannerSepCollision:
         t0 = rospy.get_time()
 
         pos = [state[0], state[1], state[2]]
-        q = tf.transformations.quaternion_from_euler(0, 0, state[3])
 
-        self.checker.set_robot_transform(pos, q)
-        no_collision = not self.checker.check_collision()
+        answer = SDF_UNKNOWN
+        if self.cspace_map is not None:
+            answer = self.cspace_map.lookup(pos[0], pos[1], pos[2], state[3])
+
+        if answer == SDF_UNKNOWN and self.validity_cache is not None:
+            cached = self.validity_cache.get(pos[0], pos[1], pos[2], state[3])
+            if cached is not None:
+                answer = SDF_FREE if cached else SDF_COLLIDING
+
+        if answer != SDF_UNKNOWN:
+            no_collision = answer == SDF_FREE
+        else:
+            if self.backend is not None:
+                no_collision = not self.backend.check_state(pos, state[3])
+            else:
+                q = tf.transformations.quaternion_from_euler(0, 0, state[3])
+
+                self.checker.set_robot_transform(pos, q)
+                no_collision = not self.checker.check_collision()
+
+            if self.validity_cache is not None:
+                self.validity_cache.put(pos[0], pos[1], pos[2], state[3], no_collision)
 
         dt = rospy.get_time()-t0
-        self.time_sum += dt
-        self.states_tried += 1
+        self.stats.add("time_sum", dt)
+        self.stats.add("states_tried")
 
-        if (SHOW_VALID_STATES_CNTR and self.states_tried % 1000) == 0:
+        if SHOW_VALID_STATES_CNTR and self.states_tried % 1000 == 0:
             print("Tried {} states --> average time: {} msec".format(self.states_tried,
                   self.time_sum / self.states_tried*1000), end="")
             print("\r", end="")
@@ -0,0 +1,265 @@
+import time
+
+import numpy as np
+
+try:
+    from .fcl_checker import Fcl_checker, quaternions_wxyz
+    from .robot_geometry import quaternion_matrix_wxyz
+    from .sdf import sample_triangles, rotate_points
+    from .mesh_cache import file_hash
+except ImportError:
+    from fcl_checker import Fcl_checker, quaternions_wxyz
+    from robot_geometry import quaternion_matrix_wxyz
+    from sdf import sample_triangles, rotate_points
+    from mesh_cache import file_hash
+
+
+class Collision_backend():
+    """
+    Common interface of the collision backends, poses are (x, y, z) positions and yaw angles.
+
+        check_state(position, yaw) -> True when the robot collides
+        check_states(positions, yaws) -> (N,) bool array
+        check_motion(start, end) -> (valid, t_free) for the straight (x, y, z, yaw) edge
+        distances(positions, yaws) -> (N,) clearance of the robot, 0 where it collides
+
+    Subclasses implement check_states and distances, the edge check defaults to checking
+    the edge discretized at motion_resolution in one batch.
+
+    robot_hash identifies the robot geometry the backend models, only backends of the same
+    robot are compared by calibrate_backends (None: unknown, always compared).
+    """
+    name = "base"
+
+    def __init__(self, motion_resolution=0.01, robot_hash=None) -> None:
+        self.motion_resolution = motion_resolution
+        self.robot_hash = robot_hash
+
+    def check_state(self, position, yaw):
+        return bool(self.check_states([position], [yaw])[0])
+
+    def check_states(self, positions, yaws):
+        raise NotImplementedError
+
+    def distances(self, positions, yaws):
+        raise NotImplementedError
+
+    def check_motion(self, start, end, tolerance=None, max_iterations=None):
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        n = max(2, int(np.ceil(np.linalg.norm(end - start) / self.motion_resolution)) + 1)
+        ts = np.linspace(0, 1, n)
+        states = start + (end - start) * ts[:, None]
+
+        collisions = self.check_states(states[:, :3], states[:, 3])
+        if not collisions.any():
+            return True, 1.0
+
+        first = int(np.argmax(collisions))
+        return False, float(ts[max(first - 1, 0)])
+
+
+class Fcl_bvh_backend(Collision_backend):
+    """
+    Fcl_checker (BVH environment, mesh or primitive robot) with conservative advancement edges.
+    """
+    name = "fcl_bvh"
+
+    def __init__(self, checker: Fcl_checker) -> None:
+        super().__init__(robot_hash=checker.robot.content_hash)
+        self.checker = checker
+
+    def check_states(self, positions, yaws):
+        return self.checker.check_collision_batch(positions, yaws)
+
+    def distances(self, positions, yaws):
+        return self.checker.distance_batch(positions, yaws)
+
+    def check_motion(self, start, end, tolerance=1e-3, max_iterations=200):
+        return self.checker.check_motion(start, end, tolerance, max_iterations)
+
+
+class Primitive_backend(Fcl_bvh_backend):
+    """
+    Fcl_checker with a robot_geometry.Formation_geometry robot. It models the drones, not the
+    robot mesh, so calibrate_backends only compares it with backends of the same formation.
+    """
+    name = "primitives"
+
+    def __init__(self, env_mesh_file, formation) -> None:
+        super().__init__(Fcl_checker(env_mesh_file, formation))
+
+
+class Trimesh_backend(Collision_backend):
+    """
+    trimesh CollisionManager, the checker of the abandoned SepCollisionChecking (needs trimesh).
+    """
+    name = "trimesh"
+
+    def __init__(self, env_mesh_file, robot_mesh_file, motion_resolution=0.01) -> None:
+        super().__init__(motion_resolution, file_hash(robot_mesh_file))
+        import trimesh
+
+        self.robot_mesh = trimesh.load_mesh(robot_mesh_file)
+        self.manager = trimesh.collision.CollisionManager()
+        self.manager.add_object("env", trimesh.load_mesh(env_mesh_file))
+
+    def check_states(self, positions, yaws):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        quats = quaternions_wxyz(yaws)
+        collisions = np.zeros(len(positions), dtype=bool)
+
+        mat = np.eye(4)
+        for i in range(len(positions)):
+            mat[:3, :3] = quaternion_matrix_wxyz(quats[i])
+            mat[:3, 3] = positions[i]
+            collisions[i] = self.manager.in_collision_single(self.robot_mesh, transform=mat)
+
+        return collisions
+
+    def distances(self, positions, yaws):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        quats = quaternions_wxyz(yaws)
+        distances = np.zeros(len(positions))
+
+        mat = np.eye(4)
+        for i in range(len(positions)):
+            mat[:3, :3] = quaternion_matrix_wxyz(quats[i])
+            mat[:3, 3] = positions[i]
+            distances[i] = self.manager.min_distance_single(self.robot_mesh, transform=mat)
+
+        return np.maximum(distances, 0.0)
+
+
+class Sdf_backend(Collision_backend):
+    """
+    Answers from the signed distance field alone: the robot collides when one of its surface
+    samples has a negative distance. No fcl fallback, so it is only as exact as the grid.
+    """
+    name = "sdf"
+
+    def __init__(self, sdf, robot_verts, robot_tris, motion_resolution=0.01, robot_hash=None) -> None:
+        super().__init__(motion_resolution, robot_hash)
+        self.sdf = sdf
+        self.points = sample_triangles(robot_verts, robot_tris, sdf.voxel_size)
+
+    def check_states(self, positions, yaws):
+        return self.min_sdf(positions, yaws) < 0
+
+    def distances(self, positions, yaws):
+        # inf outside the grid, the callers clip the clearance
+        return np.maximum(self.min_sdf(positions, yaws), 0.0)
+
+    def min_sdf(self, positions, yaws):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        pts = rotate_points(quaternions_wxyz(yaws), self.points) + positions[:, None, :]
+        d = self.sdf.query(pts.reshape(-1, 3)).reshape(len(positions), -1)
+
+        # outside the grid counts as free, the grid is padded by the robot radius
+        return np.where(np.isnan(d), np.inf, d).min(axis=1)
+
+
+class Calibration_result():
+    def __init__(self, best, table) -> None:
+        # the selected backend
+        self.best = best
+        # name -> {"time": sec per state, "agreement": fraction equal to the reference,
+        # nan for the backends of another robot}
+        self.table = table
+
+    def __repr__(self):
+        rows = ["{:>12}: {:8.2f} usec/state, {}".format(
+            name, row["time"]*1e6, "other robot" if np.isnan(row["agreement"])
+            else "agreement {:.4f}".format(row["agreement"])) for name, row in self.table.items()]
+        return "Selected backend: {}\n".format(self.best.name) + "\n".join(rows)
+
+
+def surface_states(reference, low, high, n_samples, band=0.1, rng=None, max_rounds=50):
+    """
+    Random states of the box low..high whose clearance (reference.distances) is at most band:
+    colliding states and free states close to the obstacles, the ones backends disagree on.
+    Uniform states of the box when none is found.
+
+    Returns (positions, yaws), at most n_samples of them.
+    """
+    rng = rng or np.random.default_rng()
+    positions, yaws = np.empty((0, 3)), np.empty(0)
+    for _ in range(max_rounds):
+        p = rng.uniform(low[:3], high[:3], (n_samples, 3))
+        y = rng.uniform(-np.pi, np.pi, n_samples)
+        near = np.asarray(reference.distances(p, y)) <= band
+        positions, yaws = np.concatenate([positions, p[near]]), np.concatenate([yaws, y[near]])
+        if len(positions) >= n_samples:
+            break
+
+    if len(positions) == 0:
+        print("No state within {} of an obstacle, calibrating on uniform states".format(band))
+        return p, y
+
+    return positions[:n_samples], yaws[:n_samples]
+
+
+def calibrate_backends(backends, low, high, n_samples=2000, reference=0,
+                       min_agreement=0.999, seed=0, band=0.1):
+    """
+    Benchmark the backends on states of the box low..high (x, y, z) within band of an obstacle
+    (see surface_states) and return the fastest one that agrees with backends[reference] on at
+    least min_agreement of the states. Far from the obstacles every backend is right, uniform
+    states would hide their errors.
+
+    The reference should be an exact backend (Fcl_bvh_backend), it is always eligible. Backends
+    modelling another robot than the reference (robot_hash) are timed but never selected.
+    """
+    ref_backend = backends[reference]
+    positions, yaws = surface_states(ref_backend, low, high, n_samples, band, np.random.default_rng(seed))
+
+    answers, table = {}, {}
+    for backend in backends:
+        t0 = time.perf_counter()
+        answers[backend.name] = np.asarray(backend.check_states(positions, yaws), dtype=bool)
+        table[backend.name] = {"time": (time.perf_counter() - t0) / len(positions)}
+
+    ref = answers[ref_backend.name]
+    comparable = [b for b in backends if None in (b.robot_hash, ref_backend.robot_hash)
+                  or b.robot_hash == ref_backend.robot_hash]
+    for backend in backends:
+        table[backend.name]["agreement"] = (float(np.mean(answers[backend.name] == ref))
+                                            if backend in comparable else float("nan"))
+
+    eligible = [b for b in comparable
+                if b is ref_backend or table[b.name]["agreement"] >= min_agreement]
+    best = min(eligible, key=lambda b: table[b.name]["time"])
+
+    return Calibration_result(best, table)
+
+
+def default_backends(env_mesh_file, robot_mesh_file, formation=None, sdf=None):
+    """
+    Candidate backends for a scene, the ones whose optional dependency is missing are skipped.
+    """
+    checker = Fcl_checker(env_mesh_file, robot_mesh_file)
+    backends = [Fcl_bvh_backend(checker)]
+
+    try:
+        backends.append(Trimesh_backend(env_mesh_file, robot_mesh_file))
+    except ImportError:
+        print("trimesh not available, skipping the trimesh backend")
+
+    if sdf is not None:
+        backends.append(Sdf_backend(sdf, checker.robot.verts, checker.robot.tris,
+                                    robot_hash=checker.robot.content_hash))
+    if formation is not None:
+        backends.append(Primitive_backend(env_mesh_file, formation))
+
+    return backends
+
+
+def select_backend(env_mesh_file, robot_mesh_file, low, high, formation=None, sdf=None, **kwargs):
+    """
+    Calibrate the default backends of a scene and return the Calibration_result.
+    """
+    result = calibrate_backends(default_backends(env_mesh_file, robot_mesh_file, formation, sdf),
+                                low, high, **kwargs)
+    print(result)
+
+    return result
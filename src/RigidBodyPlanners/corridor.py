@@ -0,0 +1,209 @@
+import heapq
+from itertools import product
+from math import pi, sqrt
+
+import numpy as np
+
+try:
+    from .ompl_bindings import ob, ompl_rng
+except ImportError:
+    from ompl_bindings import ob, ompl_rng
+
+# 26-connected position moves, the yaw moves are handled separately
+MOVES = [m for m in product((-1, 0, 1), repeat=3) if m != (0, 0, 0)]
+
+
+# state of a Coarse_grid cell
+CELL_UNKNOWN, CELL_COLLIDING, CELL_FREE = -1, 0, 1
+
+
+class Coarse_grid():
+    """
+    Coarse (x, y, z, yaw) voxelization of the planning bounds: cells[i, j, k, b] tells whether the
+    robot placed at the center of cell (i, j, k) with the yaw of bin b is collision free.
+
+    The cells are checked lazily, in batches, the first time the A* search of find_corridor
+    reaches them, so a query through open space only checks the cells around its path. The
+    answers are kept for the next corridors planned on the same grid.
+
+    Only the cell centers are checked, so this is a guide for the fine planner and not a
+    conservative map like Cspace_map.
+    """
+
+    def __init__(self, check_states, low, high, resolution, yaw_bins) -> None:
+        """
+        check_states: (N, 4) states -> (N,) bool, True when colliding (batch collision API)
+        """
+        self.check_states = check_states
+        self.low = np.asarray(low[:3], dtype=np.float64)
+        self.high = np.asarray(high[:3], dtype=np.float64)
+        self.resolution = resolution
+        self.shape = tuple(int(n) for n in np.maximum(np.ceil((self.high - self.low) / resolution), 1))
+        self.yaw_bins = yaw_bins
+        self.yaw_step = 2 * pi / self.yaw_bins
+
+        self.cells = np.full(self.shape + (yaw_bins,), CELL_UNKNOWN, dtype=np.int8)
+        # number of cells checked so far
+        self.checked = 0
+
+    @classmethod
+    def build(cls, check_states, low, high, resolution=0.25, yaw_bins=8):
+        """
+        Grid of the (x, y, z) bounds low, high, no cell is checked yet.
+        """
+        return cls(check_states, low, high, resolution, yaw_bins)
+
+    def classify(self, cells):
+        """
+        (N,) bool, True for the free ones of the (N, 4) integer cells. The unknown cells are
+        checked in one check_states call.
+        """
+        cells = np.asarray(cells, dtype=int).reshape(-1, 4)
+        index = tuple(cells.T)
+
+        unknown = np.unique(cells[self.cells[index] == CELL_UNKNOWN], axis=0)
+        if len(unknown):
+            colliding = np.asarray(self.check_states(self.centers(unknown)), dtype=bool)
+            self.cells[tuple(unknown.T)] = np.where(colliding, CELL_COLLIDING, CELL_FREE)
+            self.checked += len(unknown)
+
+        return self.cells[index] == CELL_FREE
+
+    def cell_of(self, state):
+        idx = np.floor((np.asarray(state[:3]) - self.low) / self.resolution).astype(int)
+        idx = np.clip(idx, 0, np.array(self.shape) - 1)
+        b = int(((state[3] + pi) % (2 * pi)) // self.yaw_step) % self.yaw_bins
+
+        return (int(idx[0]), int(idx[1]), int(idx[2]), b)
+
+    def centers(self, cells):
+        """
+        (N, 4) center states of the (N, 4) integer cells.
+        """
+        cells = np.asarray(cells, dtype=np.float64).reshape(-1, 4)
+        return np.column_stack([self.low + (cells[:, :3] + 0.5) * self.resolution,
+                                -pi + (cells[:, 3] + 0.5) * self.yaw_step])
+
+    def center(self, cell):
+        return self.centers([cell])[0]
+
+
+def find_corridor(grid: Coarse_grid, start, goal, yaw_cost=0.1):
+    """
+    A* over the free cells of the grid from the cell of start to the cell of goal (both are
+    treated as free). Position moves are 26-connected, yaw moves go to the neighbouring bin.
+    The unknown neighbours of an expanded cell are checked together (see Coarse_grid.classify).
+
+    yaw_cost: cost of one yaw bin change, in the same units as the resolution
+
+    Returns the list of (i, j, k, b) cells or None when the goal cannot be reached.
+    """
+    start_cell, goal_cell = grid.cell_of(start), grid.cell_of(goal)
+    goal_xyz = np.array(goal_cell[:3])
+
+    def heuristic(cell):
+        return grid.resolution * float(np.linalg.norm(np.array(cell[:3]) - goal_xyz))
+
+    costs = {start_cell: 0.0}
+    parents = {start_cell: None}
+    closed = set()
+    frontier = [(heuristic(start_cell), start_cell)]
+    while frontier:
+        _, cell = heapq.heappop(frontier)
+        if cell == goal_cell:
+            path = []
+            while cell is not None:
+                path.append(cell)
+                cell = parents[cell]
+            return path[::-1]
+        if cell in closed:
+            continue
+        closed.add(cell)
+
+        i, j, k, b = cell
+        neighbours = [((i + di, j + dj, k + dk, b), grid.resolution * sqrt(di*di + dj*dj + dk*dk))
+                      for di, dj, dk in MOVES]
+        neighbours += [((i, j, k, (b + db) % grid.yaw_bins), yaw_cost) for db in (-1, 1)]
+        neighbours = [(n, step) for n, step in neighbours
+                      if all(0 <= n[d] < grid.shape[d] for d in range(3)) and n not in closed]
+        if not neighbours:
+            continue
+
+        free = grid.classify([n for n, _ in neighbours])
+        for (n, step), passable in zip(neighbours, free):
+            if not passable and n != goal_cell:
+                continue
+
+            cost = costs[cell] + step
+            if cost < costs.get(n, np.inf):
+                costs[n] = cost
+                parents[n] = cell
+                heapq.heappush(frontier, (cost + heuristic(n), n))
+
+    return None
+
+
+class Corridor():
+    """
+    The cells of an A* path dilated by `dilation` cells, in (x, y, z). The yaw is not restricted.
+    """
+
+    def __init__(self, grid: Coarse_grid, cells, dilation=1) -> None:
+        self.grid = grid
+        self.cells = cells
+
+        mask = np.zeros(grid.shape, dtype=bool)
+        for c in cells:
+            mask[c[:3]] = True
+        for _ in range(dilation):
+            padded = np.pad(mask, 1)
+            mask = np.zeros_like(mask)
+            for di, dj, dk in MOVES + [(0, 0, 0)]:
+                mask |= padded[1+di:1+di+grid.shape[0], 1+dj:1+dj+grid.shape[1], 1+dk:1+dk+grid.shape[2]]
+
+        self.mask = mask
+        self.voxels = np.argwhere(mask)
+
+    def bounds(self):
+        """
+        (low, high) x, y, z box around the corridor.
+        """
+        low = self.grid.low + self.voxels.min(axis=0) * self.grid.resolution
+        high = self.grid.low + (self.voxels.max(axis=0) + 1) * self.grid.resolution
+
+        return low, np.minimum(high, self.grid.high)
+
+    def sample(self, rng, n=1):
+        """
+        (n, 3) positions drawn uniformly from the corridor voxels.
+        """
+        voxels = self.voxels[rng.integers(0, len(self.voxels), n)]
+        return self.grid.low + (voxels + rng.uniform(0, 1, (n, 3))) * self.grid.resolution
+
+
+class Corridor_sampler(ob.StateSampler):
+    """
+    State sampler that draws the position from the corridor with probability `bias`
+    and from the whole space otherwise (so the planner stays complete).
+    """
+
+    def __init__(self, space, corridor: Corridor, bias=0.9):
+        super(Corridor_sampler, self).__init__(space)
+        self.corridor = corridor
+        self.bias = bias
+        self.uniform = space.allocDefaultStateSampler()
+
+        self.rng = ompl_rng()
+
+    def sampleUniform(self, state):
+        self.uniform.sampleUniform(state)
+        if self.rng.uniform() < self.bias:
+            position = self.corridor.sample(self.rng)[0]
+            for i in range(3):
+                state[i] = position[i]
+
+    def sampleUniformNear(self, state, near, distance):
+        self.uniform.sampleUniformNear(state, near, distance)
+
+    def sampleGaussian(self, state, mean, stdDev):
+        self.uniform.sampleGaussian(state, mean, stdDev)
@@ -0,0 +1,175 @@
+from math import floor, pi, sqrt
+
+import numpy as np
+
+try:
+    from .sdf import SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN, rotate_points
+    from .fcl_checker import quaternions_wxyz
+    from .thread_stats import Thread_stats
+except ImportError:
+    from sdf import SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN, rotate_points
+    from fcl_checker import quaternions_wxyz
+    from thread_stats import Thread_stats
+
+
+class Cspace_map():
+    """
+    Precomputed occupancy of the (x, y, z, yaw) configuration space.
+
+    Yaw is split into `yaw_bins` slices and x, y, z into cubic cells of side `resolution`.
+    A (cell, slice) pair is FREE when every pose inside it is collision free, COLLIDING when
+    every pose collides and UNKNOWN otherwise (close to the C-obstacle boundary), only the
+    unknown ones need an fcl query. Both answers are stored as packed bit planes.
+
+    A pose in a cell moves any robot point at most
+        margin = resolution * sqrt(3) / 2 + robot_radius * yaw_step / 2
+    away from where it is at the (cell, slice) center, so the center is certified
+    free when its clearance exceeds the margin.
+    """
+
+    def __init__(self, low, high, resolution, yaw_bins, free_bits, colliding_bits,
+                 env_hash=None, robot_hash=None) -> None:
+        self.low = np.asarray(low, dtype=np.float64)[:3]
+        self.high = np.asarray(high, dtype=np.float64)[:3]
+        self.resolution = float(resolution)
+        self.yaw_bins = int(yaw_bins)
+        self.yaw_step = 2 * pi / self.yaw_bins
+        self.shape = np.ceil((self.high - self.low) / self.resolution).astype(int)
+
+        self.free_bits = free_bits
+        self.colliding_bits = colliding_bits
+        self.env_hash = env_hash
+        self.robot_hash = robot_hash
+
+        self.stats = Thread_stats()
+        # plain python copies for lookup
+        self._low = tuple(float(c) for c in self.low)
+        self._shape = tuple(int(n) for n in self.shape)
+
+    @property
+    def hits(self):
+        return self.stats.get("hits")
+
+    @property
+    def misses(self):
+        return self.stats.get("misses")
+
+    @property
+    def n_cells(self):
+        return int(np.prod(self.shape)) * self.yaw_bins
+
+    def cell_centers(self):
+        axes = [self.low[i] + (np.arange(self.shape[i]) + 0.5) * self.resolution for i in range(3)]
+        return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    @classmethod
+    def build(cls, checker, low, high, resolution=0.1, yaw_bins=16):
+        """
+        Build the map for the box low..high (x, y, z) with the checker's environment and robot.
+
+        Cells are certified free with fcl distance queries (or the checker's SDF when it
+        has one), certified colliding only through the SDF.
+        """
+        cmap = cls(low, high, resolution, yaw_bins, None, None,
+                   checker.env.content_hash, checker.robot.content_hash)
+
+        centers = cmap.cell_centers()
+        margin = resolution * sqrt(3) / 2 + checker.robot_radius * cmap.yaw_step / 2
+        n = len(centers)
+        free = np.zeros((yaw_bins, n), dtype=bool)
+        colliding = np.zeros((yaw_bins, n), dtype=bool)
+
+        sdf = checker.sdf
+        if sdf is not None:
+            # the bounding sphere does not depend on the yaw
+            sphere_free = sdf.query(centers) - sdf.error - checker.robot_radius > margin
+
+        for k in range(yaw_bins):
+            yaw = -pi + (k + 0.5) * cmap.yaw_step
+
+            todo = np.arange(n)
+            if sdf is not None:
+                free[k] = sphere_free
+
+                pts = rotate_points(quaternions_wxyz([yaw]), checker.robot.verts)[0]
+                d = sdf.query((centers[:, None, :] + pts[None, :, :]).reshape(-1, 3)).reshape(n, -1)
+                colliding[k] = np.any(d < -(sdf.error + margin), axis=1)
+
+                todo = np.flatnonzero(~free[k] & ~colliding[k])
+
+            for i in todo:
+                free[k, i] = checker.distance(centers[i], yaw) > margin
+
+        cmap.free_bits = np.packbits(free.reshape(-1))
+        cmap.colliding_bits = np.packbits(colliding.reshape(-1))
+
+        return cmap
+
+    def save(self, path):
+        np.savez(path, low=self.low, high=self.high, resolution=self.resolution,
+                 yaw_bins=self.yaw_bins, free_bits=self.free_bits,
+                 colliding_bits=self.colliding_bits,
+                 env_hash=str(self.env_hash), robot_hash=str(self.robot_hash))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["low"], data["high"], float(data["resolution"]), int(data["yaw_bins"]),
+                       data["free_bits"], data["colliding_bits"],
+                       str(data["env_hash"]), str(data["robot_hash"]))
+
+    def lookup_batch(self, positions, yaws):
+        """
+        Returns an (N,) int8 array of SDF_FREE, SDF_COLLIDING or SDF_UNKNOWN (outside the map too).
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        yaws = np.asarray(yaws, dtype=np.float64).reshape(-1)
+
+        idx = np.floor((positions - self.low) / self.resolution).astype(int)
+        inside = np.all((idx >= 0) & (idx < self.shape), axis=1)
+        k = np.floor(np.mod(yaws + pi, 2 * pi) / self.yaw_step).astype(int) % self.yaw_bins
+
+        flat = (k * int(np.prod(self.shape)) +
+                np.ravel_multi_index(tuple(np.clip(idx, 0, self.shape - 1).T), tuple(self.shape)))
+        # np.packbits stores the first element in the most significant bit
+        byte, shift = flat >> 3, 7 - (flat & 7)
+        is_free = (self.free_bits[byte] >> shift) & 1
+        is_colliding = (self.colliding_bits[byte] >> shift) & 1
+
+        answer = np.full(len(positions), SDF_UNKNOWN, dtype=np.int8)
+        answer[inside & (is_free == 1)] = SDF_FREE
+        answer[inside & (is_colliding == 1)] = SDF_COLLIDING
+
+        known = int(np.count_nonzero(answer != SDF_UNKNOWN))
+        self.stats.add("hits", known)
+        self.stats.add("misses", len(answer) - known)
+
+        return answer
+
+    def lookup(self, x, y, z, yaw):
+        """
+        Single pose lookup_batch in plain python (no arrays are allocated), so it stays
+        cheaper than the fcl query it is meant to skip.
+        """
+        nx, ny, nz = self._shape
+        i = floor((float(x) - self._low[0]) / self.resolution)
+        j = floor((float(y) - self._low[1]) / self.resolution)
+        k = floor((float(z) - self._low[2]) / self.resolution)
+        if not (0 <= i < nx and 0 <= j < ny and 0 <= k < nz):
+            self.stats.add("misses")
+            return SDF_UNKNOWN
+
+        b = floor(((float(yaw) + pi) % (2 * pi)) / self.yaw_step) % self.yaw_bins
+        flat = ((b * nx + i) * ny + j) * nz + k
+        # np.packbits stores the first element in the most significant bit
+        byte, shift = flat >> 3, 7 - (flat & 7)
+        if (int(self.colliding_bits[byte]) >> shift) & 1:
+            answer = SDF_COLLIDING
+        elif (int(self.free_bits[byte]) >> shift) & 1:
+            answer = SDF_FREE
+        else:
+            self.stats.add("misses")
+            return SDF_UNKNOWN
+
+        self.stats.add("hits")
+        return answer
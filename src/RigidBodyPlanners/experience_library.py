@@ -0,0 +1,141 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+try:
+    from .file_utils import atomic_write
+except ImportError:
+    from file_utils import atomic_write
+
+# bump when the layout of the stored arrays changes
+EXPERIENCE_FORMAT_VERSION = 1
+
+DEFAULT_EXPERIENCE_DIR = os.path.join(
+    os.path.expanduser("~"), ".ros", "drone_path_planning", "experience")
+
+
+def state_distance(a, b, yaw_weight=0.5):
+    """
+    Distance between (..., 4) x, y, z, yaw states, the yaw difference is wrapped to [-pi, pi].
+    """
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    dyaw = (a[..., 3] - b[..., 3] + np.pi) % (2 * np.pi) - np.pi
+
+    return np.linalg.norm(a[..., :3] - b[..., :3], axis=-1) + yaw_weight * np.abs(dyaw)
+
+
+class Experience_library():
+    """
+    Past solutions of one (environment, robot) pair, in the spirit of OMPL's Lightning framework.
+
+    Paths are stored as (N, 4) state arrays in one .npz file per key. retrieve() returns the
+    stored paths whose end points are closest to a new start/goal (a path may be used in
+    either direction), the caller repairs them against the collision checker. The library
+    holds at most max_paths paths, the least recently used one is evicted first, and a new
+    path replaces a stored one with (nearly) the same start and goal.
+    """
+
+    def __init__(self, env_hash, robot_hash, directory=DEFAULT_EXPERIENCE_DIR, max_paths=200,
+                 duplicate_tolerance=0.1, use_disk=True) -> None:
+        self.env_hash, self.robot_hash = env_hash, robot_hash
+        self.key = hashlib.sha1("{}_{}_v{}".format(
+            env_hash, robot_hash, EXPERIENCE_FORMAT_VERSION).encode()).hexdigest()
+        self.directory = directory
+        self.max_paths = max_paths
+        self.duplicate_tolerance = duplicate_tolerance
+        self.use_disk = use_disk
+
+        self.paths, self.last_used, self.uses = [], [], []
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.load()
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def file_name(self):
+        return os.path.join(self.directory, self.key + ".npz")
+
+    def load(self):
+        if not self.use_disk or not os.path.isfile(self.file_name):
+            return
+
+        try:
+            with np.load(self.file_name) as data:
+                offsets = data["offsets"]
+                self.paths = [data["states"][offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+                self.last_used = list(data["last_used"])
+                self.uses = list(data["uses"])
+        except Exception as e:
+            print("Ignoring unreadable experience library {}: {}".format(self.file_name, e))
+
+    def save(self):
+        if not self.use_disk:
+            return
+
+        offsets = np.cumsum([0] + [len(p) for p in self.paths])
+        states = np.concatenate(self.paths) if self.paths else np.zeros((0, 4))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write(self.file_name,
+                         lambda path: np.savez(path, states=states, offsets=offsets,
+                                               last_used=np.array(self.last_used, dtype=np.float64),
+                                               uses=np.array(self.uses, dtype=np.int64)),
+                         suffix=".npz")
+        except OSError as e:
+            print("Could not write experience library to {}: {}".format(self.directory, e))
+
+    def add(self, states):
+        states = np.asarray(states, dtype=np.float64).reshape(-1, 4)
+
+        duplicates = [i for i, p in enumerate(self.paths)
+                      if state_distance(p[0], states[0]) < self.duplicate_tolerance and
+                      state_distance(p[-1], states[-1]) < self.duplicate_tolerance]
+        for i in reversed(duplicates):
+            self._remove(i)
+
+        self.paths.append(states)
+        self.last_used.append(time.time())
+        self.uses.append(0)
+
+        while len(self.paths) > self.max_paths:
+            self._remove(int(np.argmin(self.last_used)))
+            self.evictions += 1
+
+        self.save()
+
+    def _remove(self, i):
+        del self.paths[i], self.last_used[i], self.uses[i]
+
+    def retrieve(self, start, goal, k=3):
+        """
+        Up to k (index, states) candidates, ordered by the distance of their end points to
+        start and goal. The states are reversed when the path was stored the other way round.
+        """
+        if not self.paths:
+            return []
+
+        firsts = np.array([p[0] for p in self.paths])
+        lasts = np.array([p[-1] for p in self.paths])
+        forward = state_distance(firsts, start) + state_distance(lasts, goal)
+        backward = state_distance(lasts, start) + state_distance(firsts, goal)
+
+        scores = np.minimum(forward, backward)
+        candidates = []
+        for i in np.argsort(scores)[:k]:
+            states = self.paths[i] if forward[i] <= backward[i] else self.paths[i][::-1]
+            candidates.append((int(i), states))
+
+        return candidates
+
+    def mark_used(self, i):
+        self.last_used[i] = time.time()
+        self.uses[i] += 1
+        self.hits += 1
+        self.save()
+
+    def stats(self):
+        return {"paths": len(self.paths), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
@@ -3,24 +3,68 @@ from matplotlib import pyplot as plt
 from mpl_toolkits import mplot3d
 import fcl
 import numpy as np
-from simplejson import load
 from stl import mesh
-import tf.transformations
 import os
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .mesh_cache import registry, file_hash
+    from .mesh_indexing import index_stl
+    from .sdf import Sdf_grid, sdf_path, SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN
+    from .thread_stats import Thread_stats
+    from .octree_env import Fcl_octree, POINT_CLOUD_EXTENSIONS
+except ImportError:
+    from mesh_cache import registry, file_hash
+    from mesh_indexing import index_stl
+    from sdf import Sdf_grid, sdf_path, SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN
+    from thread_stats import Thread_stats
+    from octree_env import Fcl_octree, POINT_CLOUD_EXTENSIONS
 print(os.getcwd())
 
 
 class Fcl_mesh():
-    def __init__(self, filename) -> None:
-        self.load_stl(filename)
-        self.create_indexed_triangles(self.verts, self.vecs)
-        self.create_fcl_mesh()
+    def __init__(self, filename, decimals=2, use_cache=True, vectorized=True) -> None:
+        """
+        filename: STL file of the mesh
+
+        decimals: vertices are rounded to this many decimals before being deduplicated
+
+        use_cache: load the preprocessed mesh from the mesh registry (shared BVH + on-disk cache)
 
-    def load_stl(self, filename):
+        vectorized: index the triangles chunk by chunk in near linear time (see mesh_indexing),
+        otherwise use the original per corner search
+        """
+        self.filename = filename
+        self.decimals = decimals
+        self.vectorized = vectorized
+
+        if use_cache:
+            entry = registry.get(filename, decimals, self.build_tables)
+            self.verts, self.tris = entry.verts, entry.tris
+            self.bounds = entry.bounds
+            self.content_hash = entry.content_hash
+            self.create_collision_object(entry.bvh)
+        else:
+            self.build_tables(filename, decimals)
+            self.bounds = np.array([self.verts.min(axis=0), self.verts.max(axis=0)])
+            self.content_hash = file_hash(filename)
+            self.create_fcl_mesh()
+
+    def build_tables(self, filename, decimals=2):
+        if self.vectorized:
+            self.verts, self.tris = index_stl(filename, decimals)
+        else:
+            self.load_stl(filename, decimals)
+            self.create_indexed_triangles(self.verts, self.vecs)
+
+        return self.verts, self.tris
+
+    def load_stl(self, filename, decimals=2):
         env_mesh = mesh.Mesh.from_file(filename)
-        verts = np.around(np.unique(env_mesh.vectors.reshape(
-            [int(env_mesh.vectors.size/3), 3]), axis=0), 2)
-        vecs = np.around(env_mesh.vectors, 2)
+        vecs = np.around(env_mesh.vectors, decimals)
+        verts = np.unique(vecs.reshape([int(vecs.size/3), 3]), axis=0)
         self.verts, self.vecs = verts, vecs
 
         return verts, vecs
@@ -30,11 +74,11 @@ class Fcl_mesh():
         Create an indexed triangle mesh from a list of vertices and a list of vectors.
         """
         # Create indexed triangles
-        tris = np.zeros([len(vectors),  3])
+        tris = np.zeros([len(vectors),  3], dtype=np.int32)
         for i, vec in enumerate(vectors):
             for j, p in enumerate(vec):
                 index = np.where(np.all(p == vertices, axis=1))
-                tris[i][j] = index[0]
+                tris[i][j] = index[0][0]
 
         self.tris = tris
         return tris
@@ -45,11 +89,16 @@ class Fcl_mesh():
         m.addSubModel(self.verts, self.tris)
         m.endModel()
 
-        T = t = fcl.Transform()
+        self.create_collision_object(m)
+
+        return m
+
+    def create_collision_object(self, m):
+        T = fcl.Transform()
         self.m = m
         self.collision_object = fcl.CollisionObject(m, T)
 
-        return m
+        return self.collision_object
 
     def set_transform(self, T=[0, 0, 0], q=[0, 0, 0, 1]):
 
@@ -58,6 +107,29 @@ class Fcl_mesh():
 
         self.collision_object.setTransform(tf)
 
+    @property
+    def collision_objects(self):
+        return [self.collision_object]
+
+    def collide(self, robot_object, request, result):
+        """
+        Environment interface used by Fcl_checker (shared with octree_env.Fcl_octree).
+        """
+        return fcl.collide(robot_object, self.collision_object, request, result)
+
+    def distance(self, robot_object):
+        return fcl.distance(robot_object, self.collision_object,
+                            fcl.DistanceRequest(), fcl.DistanceResult())
+
+    def make_collision_objects(self):
+        return [fcl.CollisionObject(self.m, fcl.Transform())]
+
+    def part_transforms(self, q, T):
+        """
+        q: WXYZ quaternion, the whole mesh is a single part in the robot frame
+        """
+        return [fcl.Transform(q, T)]
+
 
 def visualize_meshes(filenames):
     # Create a new plot
@@ -82,25 +154,307 @@ def visualize_meshes(filenames):
     plt.show()
 
 
+def quaternions_wxyz(yaws_or_quats):
+    """
+    Convert (N,) / (N, 1) yaw angles or (N, 4) XYZW quaternions to an (N, 4) WXYZ array (fcl order).
+    """
+    a = np.asarray(yaws_or_quats, dtype=np.float64)
+    if a.ndim == 2 and a.shape[1] == 4:
+        return np.ascontiguousarray(a[:, [3, 0, 1, 2]])
+
+    yaws = a.reshape(-1)
+    quats = np.zeros((len(yaws), 4))
+    quats[:, 0] = np.cos(yaws / 2)
+    quats[:, 3] = np.sin(yaws / 2)
+
+    return quats
+
+
 class Fcl_checker():
-    def __init__(self, env_mesh_file, robot_mesh_file) -> None:
-        self.env = Fcl_mesh(env_mesh_file)
-        self.robot = Fcl_mesh(robot_mesh_file)
+    def __init__(self, env_mesh_file, robot_mesh_file, env_resolution=0.05) -> None:
+        """
+        env_mesh_file: STL file of the environment, or a point cloud file (.npy, .xyz, .txt,
+        .csv, .pcd) that is voxelized into an octree of env_resolution sized leaves
+
+        robot_mesh_file: STL file of the robot or a robot geometry object
+        (e.g. robot_geometry.Formation_geometry) used in place of the mesh
+
+        env_mesh_file can also be an environment object (e.g. scene_env.Fcl_scene, whose
+        obstacles can be moved between plans)
+        """
+        if not isinstance(env_mesh_file, str):
+            self.env = env_mesh_file
+        elif env_mesh_file.lower().endswith(POINT_CLOUD_EXTENSIONS):
+            self.env = Fcl_octree(env_mesh_file, env_resolution)
+        else:
+            self.env = Fcl_mesh(env_mesh_file)
+        if isinstance(robot_mesh_file, str):
+            self.robot = Fcl_mesh(robot_mesh_file)
+        else:
+            self.robot = robot_mesh_file
 
         self.request = fcl.CollisionRequest()
         self.result = fcl.CollisionResult()
 
+        # every thread gets its own robot collision object, request and result, the
+        # environment BVH is only read and is shared by all of them
+        self._local = threading.local()
+        self.stats = Thread_stats()
+
+        # radius of the sphere around the robot origin that contains the whole robot
+        self.robot_radius = float(getattr(self.robot, "bounding_radius", None) or
+                                  np.linalg.norm(self.robot.verts, axis=1).max())
+
+        self.set_sdf(None)
+
+    def _thread_state(self):
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = SimpleNamespace()
+            if threading.current_thread() is threading.main_thread():
+                # the main thread keeps using the robot's own objects
+                state.robot_objects = self.robot.collision_objects
+                state.request, state.result = self.request, self.result
+            else:
+                state.robot_objects = self.robot.make_collision_objects()
+                state.request, state.result = fcl.CollisionRequest(), fcl.CollisionResult()
+            state.query_objects = self.robot.make_collision_objects()
+            state.robot_pose = None
+            self._local.state = state
+
+        return state
+
+    @property
+    def robot_pose(self):
+        return self._thread_state().robot_pose
+
+    @property
+    def sdf_free(self):
+        return self.stats.get("sdf_free")
+
+    @property
+    def sdf_colliding(self):
+        return self.stats.get("sdf_colliding")
+
+    @property
+    def sdf_unknown(self):
+        return self.stats.get("sdf_unknown")
+
     def check_collision(self, T=None, q=[0, 0, 0, 1]):
         if T != None:
-            self.robot.set_transform(T, q)
-
-        is_collision = fcl.collide(
-            self.robot.collision_object, self.env.collision_object, self.request, self.result)
+            self.set_robot_transform(T, q)
+
+        state = self._thread_state()
+        if self.sdf is not None and state.robot_pose is not None:
+            T, q = state.robot_pose
+            answer = self.sdf.classify_one(T, [q[3], q[0], q[1], q[2]], self.robot.verts, self.robot_radius)
+            if answer == SDF_FREE:
+                self.stats.add("sdf_free")
+                return 0
+            if answer == SDF_COLLIDING:
+                self.stats.add("sdf_colliding")
+                return 1
+            self.stats.add("sdf_unknown")
+
+        is_collision = 0
+        for robot_object in state.robot_objects:
+            is_collision = self.env.collide(robot_object, state.request, state.result)
+            if is_collision:
+                break
 
         return is_collision
 
+    def _set_pose(self, objects, q, T):
+        """
+        q: WXYZ quaternion
+        """
+        for obj, transform in zip(objects, self.robot.part_transforms(q, T)):
+            obj.setTransform(transform)
+
     def set_robot_transform(self, T, q=[0, 0, 0, 1]):
-        self.robot.set_transform(T, q)
+        """
+        Set the robot pose of the calling thread.
+        """
+        state = self._thread_state()
+        q_wxyz = [q[3], q[0], q[1], q[2]]  # from XYZW to WXYZ
+        self._set_pose(state.robot_objects, q_wxyz, T)
+        state.robot_pose = (T, q)
+
+    def set_sdf(self, sdf: Sdf_grid):
+        """
+        Use a signed distance field of the environment as a pre-filter, only poses it
+        cannot decide fall through to fcl. check_collision and check_collision_batch
+        classify the poses the same way. Pass None to disable it.
+        """
+        self.sdf = sdf
+
+    def load_sdf(self, voxel_size=0.05, path=None):
+        """
+        Load the field built offline by sdf.py for the environment mesh.
+        """
+        path = path or sdf_path(self.env.content_hash, voxel_size)
+        sdf = Sdf_grid.load(path)
+        if sdf.content_hash is not None and sdf.content_hash != self.env.content_hash:
+            raise ValueError("SDF {} was built for a different environment mesh".format(path))
+
+        self.set_sdf(sdf)
+        return sdf
+
+    def sdf_classify(self, positions, quats):
+        """
+        positions: (N, 3), quats: (N, 4) WXYZ
+        """
+        answer = self.sdf.classify(positions, quats, self.robot.verts, self.robot_radius)
+        self.stats.add("sdf_free", int(np.count_nonzero(answer == SDF_FREE)))
+        self.stats.add("sdf_colliding", int(np.count_nonzero(answer == SDF_COLLIDING)))
+        self.stats.add("sdf_unknown", int(np.count_nonzero(answer == SDF_UNKNOWN)))
+
+        return answer
+
+    def check_collision_batch(self, positions, yaws_or_quats, n_threads=1):
+        """
+        Check N robot poses in one call.
+
+        positions: (N, 3) array
+
+        yaws_or_quats: (N,) yaw angles or (N, 4) XYZW quaternions
+
+        n_threads: split the poses across a thread pool, the queries use per-thread
+        robot collision objects so the robot pose set with set_robot_transform is left untouched
+
+        Returns an (N,) bool array, True where the robot collides with the environment.
+        """
+        positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 3)
+        quats = quaternions_wxyz(yaws_or_quats)
+        if len(quats) != len(positions):
+            raise ValueError("Got {} positions and {} orientations".format(len(positions), len(quats)))
+
+        if self.sdf is not None:
+            answer = self.sdf_classify(positions, quats)
+            unknown = np.flatnonzero(answer == SDF_UNKNOWN)
+
+            collisions = answer == SDF_COLLIDING
+            collisions[unknown] = self._check_poses(positions[unknown], quats[unknown], n_threads)
+            return collisions
+
+        return self._check_poses(positions, quats, n_threads)
+
+    def _check_poses(self, positions, quats, n_threads):
+        n = len(positions)
+        collisions = np.zeros(n, dtype=bool)
+        n_threads = max(1, min(n_threads, n))
+        if n == 0:
+            return collisions
+
+        if n_threads == 1:
+            self._check_range(positions, quats, collisions, 0, n)
+            return collisions
+
+        bounds = np.linspace(0, n, n_threads + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            futures = [pool.submit(self._check_range, positions, quats,
+                                   collisions, bounds[k], bounds[k+1]) for k in range(n_threads)]
+            for future in futures:
+                future.result()
+
+        return collisions
+
+    def distance(self, T, yaw):
+        """
+        Minimum distance between the robot at (T, yaw) and the environment, 0 when they collide.
+        """
+        q = quaternions_wxyz([yaw])[0]
+        query_objects = self._thread_state().query_objects
+        self._set_pose(query_objects, q, np.asarray(T, dtype=np.float64))
+
+        d = min(self.env.distance(obj) for obj in query_objects)
+        # primitives report a negative distance when they collide
+        return max(d, 0.0)
+
+    def distance_batch(self, positions, yaws_or_quats):
+        """
+        Minimum distances between the robot at N poses and the environment, 0 where they
+        collide. Takes the same arguments as check_collision_batch.
+
+        Returns an (N,) array.
+        """
+        positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 3)
+        quats = quaternions_wxyz(yaws_or_quats)
+        if len(quats) != len(positions):
+            raise ValueError("Got {} positions and {} orientations".format(len(positions), len(quats)))
+
+        query_objects = self._thread_state().query_objects
+        env = self.env
+        distances = np.zeros(len(positions))
+
+        if not hasattr(self.robot, "part_transforms_batch"):
+            for i in range(len(positions)):
+                self._set_pose(query_objects, quats[i], positions[i])
+                distances[i] = min(env.distance(obj) for obj in query_objects)
+        else:
+            parts = self.robot.part_transforms_batch(quats, positions)
+            for i in range(len(positions)):
+                for obj, (R, T) in zip(query_objects, parts):
+                    obj.setTransform(fcl.Transform(R[i], T[i]))
+                distances[i] = min(env.distance(obj) for obj in query_objects)
+
+        # primitives report a negative distance when they collide
+        return np.maximum(distances, 0.0)
+
+    def check_motion(self, start, end, tolerance=1e-3, max_iterations=200):
+        """
+        Check the straight (x, y, z, yaw) motion from start to end with conservative advancement.
+
+        While the robot is d away from the environment no robot point can reach it before
+        the motion parameter advances by d / (|dpos| + robot_radius * |dyaw|), so each
+        distance query clears a whole stretch of the edge instead of a fixed resolution step.
+        Poses closer than `tolerance` count as collisions and so does running out of iterations,
+        which keeps the answer conservative.
+
+        Returns (valid, t_free): t_free is the motion parameter in [0, 1] up to which the
+        motion is known to be collision free.
+        """
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        delta = end - start
+
+        # bound on how far any robot point moves per unit of the motion parameter
+        speed_bound = np.linalg.norm(delta[:3]) + self.robot_radius * abs(delta[3])
+
+        t = 0.0
+        for _ in range(max_iterations):
+            s = start + delta * t
+            d = self.distance(s[:3], s[3])
+            if d <= tolerance:
+                return False, float(t)
+
+            if speed_bound == 0:
+                return True, 1.0
+
+            t += d / speed_bound
+            if t >= 1.0:
+                return True, 1.0
+
+        return False, float(t)
+
+    def _check_range(self, positions, quats, out, start, stop):
+        robot_objects = self._thread_state().query_objects
+        env = self.env
+        request = fcl.CollisionRequest()
+        result = fcl.CollisionResult()
+
+        if not hasattr(self.robot, "part_transforms_batch"):
+            for i in range(start, stop):
+                self._set_pose(robot_objects, quats[i], positions[i])
+                out[i] = any(env.collide(obj, request, result) > 0 for obj in robot_objects)
+            return
+
+        # composite robots: compose the part poses of the whole range in one numpy call
+        parts = self.robot.part_transforms_batch(quats[start:stop], positions[start:stop])
+        for i in range(stop - start):
+            for obj, (R, T) in zip(robot_objects, parts):
+                obj.setTransform(fcl.Transform(R[i], T[i]))
+            out[start + i] = any(env.collide(obj, request, result) > 0 for obj in robot_objects)
 
 
 if __name__ == '__main__':
@@ -126,6 +480,8 @@ if __name__ == '__main__':
 
     robot_mesh_name = "src/drone_path_planning/resources/stl/robot-scene-triangle.stl"
 
+    import tf.transformations
+
     coll_checker = Fcl_checker(env_mesh_name, robot_mesh_name)
     q = tf.transformations.quaternion_from_euler(-pi/2, 0, 0)
     print(q)
@@ -0,0 +1,17 @@
+import os
+
+
+def atomic_write(path, write, suffix=""):
+    """
+    Call write(tmp_path) and move the file into place, so a crashed node never leaves a half
+    written cache behind.
+
+    suffix: extension the writer appends on its own (np.savez adds ".npz")
+    """
+    tmp_path = "{}.tmp.{}{}".format(path, os.getpid(), suffix)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+
+import fcl
+import numpy as np
+
+try:
+    from .file_utils import atomic_write
+except ImportError:
+    from file_utils import atomic_write
+
+# bump when the layout of the cached arrays changes
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".ros", "drone_path_planning", "mesh_cache")
+
+
+def file_hash(filename, block_size=1 << 20):
+    """
+    SHA1 of the file contents, read in blocks so big scans don't have to fit in memory.
+    """
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+class Mesh_entry():
+    """
+    Preprocessed collision mesh: deduplicated vertices, integer triangle indices and bounds.
+
+    The fcl.BVHModel is built lazily and shared by every Fcl_mesh that loads the same file,
+    each of them only owns its fcl.CollisionObject (and therefore its transform).
+    """
+
+    def __init__(self, key, content_hash, verts, tris) -> None:
+        self.key = key
+        self.content_hash = content_hash
+        self.verts = np.ascontiguousarray(verts, dtype=np.float64)
+        self.tris = np.ascontiguousarray(tris, dtype=np.int32)
+        self.bounds = np.array([self.verts.min(axis=0), self.verts.max(axis=0)])
+
+        self._bvh = None
+        self._lock = threading.Lock()
+
+    @property
+    def bvh(self):
+        with self._lock:
+            if self._bvh is None:
+                m = fcl.BVHModel()
+                m.beginModel(len(self.verts), len(self.tris))
+                m.addSubModel(self.verts, self.tris)
+                m.endModel()
+                self._bvh = m
+
+        return self._bvh
+
+
+class Mesh_registry():
+    """
+    Process wide registry of preprocessed meshes with a persistent on-disk cache.
+
+    Entries are keyed by the file content hash and the rounding settings, so an edited STL
+    or a different `decimals` never hits a stale cache file. A warm start only hashes the
+    file and loads the cached arrays, the STL itself is not parsed.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, use_disk=True) -> None:
+        self.cache_dir = cache_dir
+        self.use_disk = use_disk
+
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+
+    def make_key(self, content_hash, decimals):
+        return "{}_d{}_v{}".format(content_hash, decimals, CACHE_FORMAT_VERSION)
+
+    def cache_file(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, filename, decimals, build_fn) -> Mesh_entry:
+        """
+        Return the Mesh_entry of `filename`.
+
+        build_fn(filename, decimals) -> (verts, tris) is only called on a cold start.
+        """
+        content_hash = file_hash(filename)
+        key = self.make_key(content_hash, decimals)
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            entry = self.load_from_disk(key, content_hash)
+            if entry is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                verts, tris = build_fn(filename, decimals)
+                entry = Mesh_entry(key, content_hash, verts, tris)
+                self.save_to_disk(entry)
+
+            self.entries[key] = entry
+
+        return entry
+
+    def load_from_disk(self, key, content_hash):
+        if not self.use_disk:
+            return None
+
+        path = self.cache_file(key)
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                return Mesh_entry(key, content_hash, data["verts"], data["tris"])
+        except Exception as e:
+            print("Ignoring unreadable mesh cache {}: {}".format(path, e))
+            return None
+
+    def save_to_disk(self, entry: Mesh_entry):
+        if not self.use_disk:
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(self.cache_file(entry.key),
+                         lambda path: np.savez(path, verts=entry.verts, tris=entry.tris, bounds=entry.bounds),
+                         suffix=".npz")
+        except OSError as e:
+            print("Could not write mesh cache to {}: {}".format(self.cache_dir, e))
+
+    def clear(self):
+        """
+        Drop the in-memory entries (the on-disk cache is kept).
+        """
+        with self._lock:
+            self.entries = {}
+
+
+# registry shared by every Fcl_mesh of the process
+registry = Mesh_registry()
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+from stl import mesh
+
+# layout of one triangle record of a binary STL file
+STL_RECORD_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vectors", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+STL_HEADER_SIZE = 84
+
+
+def is_binary_stl(filename):
+    size = os.path.getsize(filename)
+    if size < STL_HEADER_SIZE:
+        return False
+
+    with open(filename, "rb") as f:
+        f.seek(80)
+        n_tris = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+
+    return size == STL_HEADER_SIZE + n_tris * STL_RECORD_DTYPE.itemsize
+
+
+def iter_stl_chunks(filename, chunk_size=200000):
+    """
+    Yield the triangles of an STL file as (k, 3, 3) float32 arrays of at most chunk_size triangles.
+
+    Binary files are memory mapped so only one chunk is resident at a time,
+    ASCII files are parsed by numpy-stl and then split.
+    """
+    if is_binary_stl(filename):
+        records = np.memmap(filename, dtype=STL_RECORD_DTYPE, mode="r",
+                            offset=STL_HEADER_SIZE)
+        for start in range(0, len(records), chunk_size):
+            yield np.array(records["vectors"][start:start+chunk_size])
+        del records
+    else:
+        vectors = mesh.Mesh.from_file(filename).vectors
+        for start in range(0, len(vectors), chunk_size):
+            yield vectors[start:start+chunk_size]
+
+
+def _row_keys(q):
+    """
+    View every row of an (N, 3) int64 array as a single opaque key so rows can be sorted and searched.
+    """
+    q = np.ascontiguousarray(q)
+    return q.view(np.dtype((np.void, q.dtype.itemsize * q.shape[1]))).ravel()
+
+
+class Vertex_indexer():
+    """
+    Incrementally builds the vertex / triangle tables of a triangle soup.
+
+    Vertices are snapped to `decimals` decimals and deduplicated through a sorted key
+    table, so every chunk costs O(k log V) and the whole mesh near linear time.
+    Memory is bounded by the unique vertices plus one chunk.
+    """
+
+    def __init__(self, decimals=2) -> None:
+        self.decimals = decimals
+        self.scale = 10.0 ** decimals
+
+        self._sorted_keys = np.empty(0, dtype=np.dtype((np.void, 24)))
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._vert_chunks = []
+        self._tri_chunks = []
+        self.n_verts = 0
+
+    def add(self, vectors):
+        """
+        vectors: (k, 3, 3) array with the corners of k triangles
+        """
+        q = np.round(np.asarray(vectors, dtype=np.float64).reshape(-1, 3) * self.scale).astype(np.int64)
+        keys = _row_keys(q)
+
+        uniq_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        # look the chunk's vertices up in the table of the already known ones
+        pos = np.searchsorted(self._sorted_keys, uniq_keys)
+        found = np.zeros(len(uniq_keys), dtype=bool)
+        in_range = pos < len(self._sorted_keys)
+        found[in_range] = self._sorted_keys[pos[in_range]] == uniq_keys[in_range]
+
+        ids = np.empty(len(uniq_keys), dtype=np.int64)
+        ids[found] = self._sorted_ids[pos[found]]
+
+        new = ~found
+        n_new = int(new.sum())
+        ids[new] = np.arange(self.n_verts, self.n_verts + n_new)
+        self.n_verts += n_new
+
+        if n_new:
+            self._vert_chunks.append(q[first[new]] / self.scale)
+            # uniq_keys is sorted, so inserting at the searchsorted positions keeps the table sorted
+            self._sorted_keys = np.insert(self._sorted_keys, pos[new], uniq_keys[new])
+            self._sorted_ids = np.insert(self._sorted_ids, pos[new], ids[new])
+
+        self._tri_chunks.append(ids[inverse.ravel()].reshape(-1, 3).astype(np.int32))
+
+    def tables(self):
+        """
+        Return (verts, tris): (V, 3) float64 vertices and (F, 3) int32 triangle indices.
+        """
+        verts = np.concatenate(self._vert_chunks) if self._vert_chunks else np.zeros((0, 3))
+        tris = np.concatenate(self._tri_chunks) if self._tri_chunks else np.zeros((0, 3), dtype=np.int32)
+
+        return verts, tris
+
+
+def index_stl(filename, decimals=2, chunk_size=200000):
+    """
+    Build the indexed triangle tables of an STL file chunk by chunk.
+    """
+    indexer = Vertex_indexer(decimals)
+    for vectors in iter_stl_chunks(filename, chunk_size):
+        indexer.add(vectors)
+
+    return indexer.tables()
@@ -0,0 +1,52 @@
+try:
+    from .ompl_bindings import ob
+except ImportError:
+    from ompl_bindings import ob
+
+try:
+    from .thread_stats import Thread_stats
+except ImportError:
+    from thread_stats import Thread_stats
+
+
+class ContinuousMotionValidator(ob.MotionValidator):
+    """
+    Validates a whole (x, y, z, yaw) edge in one call with Fcl_checker.check_motion
+    (conservative advancement) instead of discretizing it at the state validity resolution.
+    """
+
+    def __init__(self, si, checker, tolerance=1e-3, max_iterations=200):
+        super(ContinuousMotionValidator, self).__init__(si)
+        self.si = si
+        self.checker = checker
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+        self.stats = Thread_stats()
+
+    def checkMotion(self, s1, s2, lastValid=None):
+        start = [s1[0], s1[1], s1[2], s1[3]]
+        end = [s2[0], s2[1], s2[2], s2[3]]
+
+        valid, t_free = self.checker.check_motion(
+            start, end, self.tolerance, self.max_iterations)
+
+        self.stats.add("motions_checked")
+        if not valid:
+            self.stats.add("motions_invalid")
+
+            if lastValid is not None:
+                # last state known to be free on the edge
+                if lastValid.first is not None:
+                    self.si.getStateSpace().interpolate(s1, s2, t_free, lastValid.first)
+                lastValid.second = t_free
+
+        return valid
+
+    @property
+    def motions_checked(self):
+        return self.stats.get("motions_checked")
+
+    @property
+    def motions_invalid(self):
+        return self.stats.get("motions_invalid")
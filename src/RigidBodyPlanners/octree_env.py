@@ -0,0 +1,214 @@
+import hashlib
+import os
+from itertools import islice
+
+import fcl
+import numpy as np
+
+try:
+    from .mesh_cache import file_hash
+except ImportError:
+    from mesh_cache import file_hash
+
+POINT_CLOUD_EXTENSIONS = (".npy", ".xyz", ".txt", ".csv", ".pcd")
+
+# voxel coordinates are packed in 21 bits each
+KEY_BITS = 21
+KEY_MASK = (1 << KEY_BITS) - 1
+
+
+def iter_point_chunks(filename, chunk_size=1000000):
+    """
+    Yield the points of a point cloud file as (k, 3) float64 arrays of at most chunk_size points.
+
+    .npy files are memory mapped, text files (.xyz/.txt/.csv, x y z in the first columns)
+    and .pcd files (ascii or binary, x y z fields) are read chunk by chunk.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".npy":
+        points = np.load(filename, mmap_mode="r")
+        for start in range(0, len(points), chunk_size):
+            yield np.asarray(points[start:start+chunk_size, :3], dtype=np.float64)
+    elif ext == ".pcd":
+        yield from _iter_pcd_chunks(filename, chunk_size)
+    else:
+        delimiter = "," if ext == ".csv" else None
+        with open(filename) as f:
+            yield from _iter_text_chunks(f, (0, 1, 2), chunk_size, delimiter)
+
+
+def _iter_text_chunks(f, cols, chunk_size, delimiter=None):
+    while True:
+        lines = list(islice(f, chunk_size))
+        if not lines:
+            break
+        if isinstance(lines[0], bytes):
+            lines = [line.decode("ascii") for line in lines]
+        yield np.loadtxt(lines, delimiter=delimiter, usecols=cols, ndmin=2)
+
+
+def _iter_pcd_chunks(filename, chunk_size):
+    with open(filename, "rb") as f:
+        header = {}
+        while True:
+            line = f.readline().decode("ascii").strip()
+            if not line or line.startswith("#"):
+                continue
+            key, _, value = line.partition(" ")
+            header[key.upper()] = value.split()
+            if key.upper() == "DATA":
+                break
+
+        fields = header["FIELDS"]
+        n_points = int(header["POINTS"][0])
+        cols = [fields.index(c) for c in ("x", "y", "z")]
+
+        if header["DATA"][0] == "ascii":
+            yield from _iter_text_chunks(f, cols, chunk_size)
+        elif header["DATA"][0] == "binary":
+            sizes = [int(s) for s in header["SIZE"]]
+            types = header["TYPE"]
+            counts = [int(c) for c in header.get("COUNT", ["1"] * len(fields))]
+            dtype = np.dtype([(name, "<{}{}".format(t.lower(), s), (c,))
+                              for name, s, t, c in zip(fields, sizes, types, counts)])
+            records = np.memmap(filename, dtype=dtype, mode="r", offset=f.tell(), shape=(n_points,))
+            for start in range(0, n_points, chunk_size):
+                r = records[start:start+chunk_size]
+                yield np.stack([r["x"][:, 0], r["y"][:, 0], r["z"][:, 0]], axis=1).astype(np.float64)
+        else:
+            raise ValueError("Unsupported PCD data type: {}".format(header["DATA"][0]))
+
+
+def pack_keys(idx):
+    return (idx[:, 0] << (2 * KEY_BITS)) | (idx[:, 1] << KEY_BITS) | idx[:, 2]
+
+
+def unpack_keys(keys):
+    return np.stack([(keys >> (2 * KEY_BITS)) & KEY_MASK, (keys >> KEY_BITS) & KEY_MASK,
+                     keys & KEY_MASK], axis=1)
+
+
+def voxelize_point_cloud(filename, resolution, crop_low=None, crop_high=None, chunk_size=1000000):
+    """
+    Occupied voxels of a point cloud, streamed so memory is bounded by the occupied voxels.
+
+    Returns (origin, keys): keys are the sorted packed integer coordinates of the voxels
+    of side `resolution` relative to origin. crop_low / crop_high drop points outside a box.
+    """
+    if crop_low is not None and crop_high is not None:
+        origin = np.asarray(crop_low, dtype=np.float64)
+    else:
+        # first pass for the lower corner, voxel coordinates have to be non negative
+        origin = np.full(3, np.inf)
+        for chunk in iter_point_chunks(filename, chunk_size):
+            origin = np.minimum(origin, chunk.min(axis=0))
+    origin = np.floor(origin / resolution) * resolution
+
+    keys = np.empty(0, dtype=np.int64)
+    for chunk in iter_point_chunks(filename, chunk_size):
+        if crop_low is not None:
+            chunk = chunk[np.all(chunk >= crop_low, axis=1)]
+        if crop_high is not None:
+            chunk = chunk[np.all(chunk <= crop_high, axis=1)]
+
+        idx = np.floor((chunk - origin) / resolution).astype(np.int64)
+        if len(idx) and (idx.min() < 0 or idx.max() > KEY_MASK):
+            raise ValueError("Point cloud spans more than {} voxels per axis".format(KEY_MASK + 1))
+
+        keys = np.union1d(keys, pack_keys(idx))
+
+    return origin, keys
+
+
+# octomap keys have 16 bits per axis, the tree root is centered on the origin
+OCTOMAP_DEPTH = 16
+OCTOMAP_CENTER_KEY = 1 << (OCTOMAP_DEPTH - 1)
+
+
+def morton_codes(coords):
+    """
+    Interleave the bits of (N, 3) integer coordinates, x in the lowest bit of every triple
+    (the child index order of octomap: x + 2y + 4z).
+    """
+    codes = np.zeros(len(coords), dtype=np.uint64)
+    for bit in range(OCTOMAP_DEPTH):
+        for axis in range(3):
+            codes |= ((coords[:, axis] >> bit) & 1).astype(np.uint64) << np.uint64(3 * bit + axis)
+
+    return codes
+
+
+def octomap_binary(coords):
+    """
+    Serialize the occupied leaves at the (N, 3) octomap keys in the format read by
+    octomap::OcTree::readBinaryData: every inner node in depth-first order as 2 bytes,
+    2 bits per child (10: occupied leaf, 11: inner node, 00: unknown).
+
+    Built level by level with numpy, the nodes are put in depth-first order by sorting
+    their key prefixes.
+    """
+    children = np.unique(morton_codes(coords))
+    node_codes, node_levels, node_children = [], [], []
+    for level in range(OCTOMAP_DEPTH - 1, -1, -1):
+        parents, inverse = np.unique(children >> np.uint64(3), return_inverse=True)
+        code = 2 if level == OCTOMAP_DEPTH - 1 else 3
+        bits = np.uint64(code) << (np.uint64(2) * (children & np.uint64(7)))
+
+        packed = np.zeros(len(parents), dtype=np.uint64)
+        np.bitwise_or.at(packed, inverse.ravel(), bits)
+
+        # left aligned prefix, a node sorts before its descendants and after its left siblings
+        node_codes.append(parents << np.uint64(3 * (OCTOMAP_DEPTH - level)))
+        node_levels.append(np.full(len(parents), level))
+        node_children.append(packed)
+        children = parents
+
+    order = np.lexsort((np.concatenate(node_levels), np.concatenate(node_codes)))
+    # byte 0: children 0-3, byte 1: children 4-7
+    return np.concatenate(node_children)[order].astype("<u2").tobytes()
+
+
+class Fcl_octree():
+    """
+    Environment built from a point cloud: the occupied voxels in an fcl.OcTree (octomap),
+    which stores a few bytes per node and is traversed by fcl like a BVH.
+
+    Exposes the same collide / distance / content_hash interface as an environment Fcl_mesh,
+    so Fcl_checker and PlannerSepCollision use it unchanged.
+    """
+
+    def __init__(self, filename, resolution=0.05, crop_low=None, crop_high=None,
+                 chunk_size=1000000) -> None:
+        self.filename = filename
+        self.resolution = resolution
+
+        origin, keys = voxelize_point_cloud(filename, resolution, crop_low, crop_high, chunk_size)
+        self.n_voxels = len(keys)
+
+        # voxel coordinates to octomap keys, the origin is a multiple of the resolution
+        coords = unpack_keys(keys) + np.round(origin / resolution).astype(np.int64) + OCTOMAP_CENTER_KEY
+        if len(coords) and (coords.min() < 0 or coords.max() >= 1 << OCTOMAP_DEPTH):
+            raise ValueError("Point cloud does not fit in an octree of {} leaves per axis around the origin"
+                             .format(1 << OCTOMAP_DEPTH))
+
+        # octomap binary data of the tree, what a .bt file holds after its header
+        self.data = octomap_binary(coords)
+        # fcl copies the data into a std::vector<char>
+        self.tree = fcl.OcTree(resolution, np.frombuffer(self.data, dtype=np.int8).tolist())
+        self.collision_object = fcl.CollisionObject(self.tree, fcl.Transform())
+
+        corners = (coords - OCTOMAP_CENTER_KEY) * resolution
+        self.bounds = np.array([corners.min(axis=0), corners.max(axis=0) + resolution])
+        key = "{}_{}_{}_{}".format(file_hash(filename), resolution, crop_low, crop_high)
+        self.content_hash = hashlib.sha1(key.encode()).hexdigest()
+
+    @property
+    def collision_objects(self):
+        return [self.collision_object]
+
+    def collide(self, robot_object, request, result):
+        return fcl.collide(robot_object, self.collision_object, request, result)
+
+    def distance(self, robot_object):
+        return fcl.distance(robot_object, self.collision_object,
+                            fcl.DistanceRequest(), fcl.DistanceResult())
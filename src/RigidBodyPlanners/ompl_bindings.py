@@ -0,0 +1,23 @@
+import numpy as np
+
+try:
+    from ompl import base as ob
+    from ompl import geometric as og
+    from ompl import util as ou
+except ImportError:
+    # if the ompl module is not in the PYTHONPATH assume it is installed in a
+    # subdirectory of the parent directory called "py-bindings."
+    import sys
+    from os.path import abspath, dirname, join
+    sys.path.insert(
+        0, join(dirname(dirname(abspath(__file__))), 'py-bindings'))
+    from ompl import base as ob
+    from ompl import geometric as og
+    from ompl import util as ou
+
+
+def ompl_rng():
+    """
+    numpy Generator seeded from the OMPL generator, so ou.RNG.setSeed makes its samples reproducible.
+    """
+    return np.random.default_rng(ou.RNG().uniformInt(0, 2**31 - 1))
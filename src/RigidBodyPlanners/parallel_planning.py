@@ -0,0 +1,265 @@
+import multiprocessing
+import queue
+import time
+from math import ceil
+
+import numpy as np
+
+try:
+    from .ompl_bindings import ob, og, ou
+except ImportError:
+    from ompl_bindings import ob, og, ou
+
+PLANNERS = {
+    "RRT": og.RRT,
+    "RRTConnect": og.RRTConnect,
+    "BITstar": og.BITstar,
+    "KPIECE1": og.KPIECE1,
+    "PRMstar": og.PRMstar,
+}
+
+DEFAULT_RACE = ["RRT", "RRTConnect", "BITstar", "KPIECE1", "PRMstar"]
+
+# time given to the losers to leave their solve() after being cancelled
+CANCEL_GRACE = 2.0
+
+# roadmap planners keep their graph between the queries of a Query_pool worker
+MULTI_QUERY_PLANNERS = (og.PRM, og.LazyPRM, og.SPARS, og.SPARStwo)
+
+
+class Race_result():
+    def __init__(self, name, seed, states, cost, elapsed, table) -> None:
+        # winning planner, its seed and simplified solution ((N, 4) states), None without a solution
+        self.name = name
+        self.seed = seed
+        self.states = states
+        self.cost = cost
+        self.elapsed = elapsed
+        # name -> {"solved", "cost", "time"} of every planner that reported back
+        self.table = table
+
+    def __repr__(self):
+        rows = ["{:>12}: {}, cost {:.3f}, {:.3f} sec".format(
+            name, "solved" if row["solved"] else "no solution", row["cost"], row["time"])
+            for name, row in self.table.items()]
+        head = "Race won by {} in {:.3f} sec".format(self.name, self.elapsed) if self.name \
+            else "Race: no solution found"
+        return head + "\n" + "\n".join(rows)
+
+
+def _race_worker(planner, name, seed, timeout, stop_on_first, cancel, results):
+    # a fresh OMPL RNG seed for the samplers of this process, it has to be set before they exist
+    ou.RNG.setSeed(seed)
+
+    # own planner and collision checker on the (forked) environment and robot
+    racer = planner.clone()
+    racer.set_planner(PLANNERS[name])
+    if stop_on_first:
+        # any solution satisfies the objective, so the optimizing planners return at the first one
+        racer.ss.getOptimizationObjective().setCostThreshold(ob.Cost(float("inf")))
+
+    ptc = ob.plannerOrTerminationCondition(
+        ob.timedPlannerTerminationCondition(timeout),
+        ob.PlannerTerminationCondition(ob.PlannerTerminationConditionFn(cancel.is_set)))
+
+    t0 = time.time()
+    racer.ss.solve(ptc)
+    elapsed = time.time() - t0
+
+    if not racer.ss.haveExactSolutionPath():
+        results.put((name, seed, None, float("inf"), elapsed))
+        return
+
+    racer.ss.simplifySolution()
+    path = racer.ss.getSolutionPath()
+    cost = path.cost(racer.ss.getOptimizationObjective()).value()
+    states = np.array([[s[i] for i in range(4)] for s in path.getStates()])
+
+    results.put((name, seed, states, cost, elapsed))
+
+
+def race_planners(planner, timeout=15.0, planners=None, mode="first", seeds=None):
+    """
+    Solve the problem of a PlannerSepCollision (start, goal, bounds, obstacles, objective,
+    collision settings and samplers, see PlannerSepCollision.clone) with several planners at
+    once, one process each with its own checker and RNG seed.
+
+    planners: names of PLANNERS, default DEFAULT_RACE
+
+    mode: "first" returns the first exact solution and cancels the others, "best" lets every
+    planner run until the deadline and returns the cheapest solution
+
+    The workers are forked, so the parent's environment, C-space map and backend are
+    inherited without being pickled or rebuilt.
+
+    Returns a Race_result.
+    """
+    if mode not in ("first", "best"):
+        raise ValueError("Unknown race mode: {}".format(mode))
+
+    planners = planners or DEFAULT_RACE
+    if seeds is None:
+        seeds = [int(s) for s in np.random.SeedSequence().generate_state(len(planners))]
+
+    ctx = multiprocessing.get_context("fork")
+    cancel = ctx.Event()
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_race_worker, daemon=True,
+                           args=(planner, name, seed, timeout, mode == "first", cancel, results))
+               for name, seed in zip(planners, seeds)]
+
+    t0 = time.time()
+    for worker in workers:
+        worker.start()
+
+    table, best = {}, None
+    deadline = t0 + timeout + CANCEL_GRACE
+    while len(table) < len(workers):
+        try:
+            name, seed, states, cost, elapsed = results.get(timeout=max(deadline - time.time(), 0.01))
+        except queue.Empty:
+            break
+
+        table[name] = {"solved": states is not None, "cost": cost, "time": elapsed}
+        if states is not None and (best is None or cost < best[3]):
+            best = (name, seed, states, cost, time.time() - t0)
+            if mode == "first":
+                break
+
+    cancel.set()
+    for worker in workers:
+        worker.join(CANCEL_GRACE)
+        if worker.is_alive():
+            worker.terminate()
+
+    if best is None:
+        return Race_result(None, None, None, float("inf"), time.time() - t0, table)
+
+    return Race_result(*best, table)
+
+
+class Query_result():
+    def __init__(self, index, start, goal, states=None, cost=float("inf"), elapsed=0.0, stats=None,
+                 error=None) -> None:
+        self.index = index
+        self.start, self.goal = start, goal
+        # simplified and interpolated (N, 4) solution, None when the query failed
+        self.states = states
+        self.cost = cost
+        self.elapsed = elapsed
+        # states and motions checked while solving this query
+        self.stats = stats or {}
+        # exception raised by the worker, the other queries are not affected
+        self.error = error
+
+    @property
+    def solved(self):
+        return self.states is not None
+
+    def __repr__(self):
+        if self.error is not None:
+            return "Query {}: failed with {}".format(self.index, self.error)
+        if not self.solved:
+            return "Query {}: no solution in {:.3f} sec".format(self.index, self.elapsed)
+        return "Query {}: cost {:.3f} in {:.3f} sec, {}".format(self.index, self.cost, self.elapsed, self.stats)
+
+
+# planner of a Query_pool worker process, built once by _init_query_worker
+_worker_planner = None
+
+
+def _init_query_worker(planner, planner_class):
+    global _worker_planner
+
+    _worker_planner = planner.clone()
+    _worker_planner.set_planner(planner_class)
+
+
+def _solve_query(query):
+    index, start, goal, timeout = query
+    planner = _worker_planner
+    t0 = time.time()
+    try:
+        states_before, motions_before = planner.states_tried, planner.motion_counts()
+
+        if isinstance(planner.ss.getPlanner(), MULTI_QUERY_PLANNERS):
+            # keep the roadmap of the previous queries, only forget their start and goal
+            planner.ss.getPlanner().clearQuery()
+            planner.ss.getProblemDefinition().clearSolutionPaths()
+        else:
+            planner.ss.clear()
+        planner.set_start_goal_states(start, goal)
+        planner.ss.solve(timeout)
+
+        motions = planner.motion_counts()
+        stats = {"states_checked": planner.states_tried - states_before,
+                 "motions_checked": motions[0] - motions_before[0]}
+        if not planner.ss.haveExactSolutionPath():
+            return Query_result(index, start, goal, elapsed=time.time() - t0, stats=stats)
+
+        planner.ss.simplifySolution()
+        path = planner.ss.getSolutionPath()
+        cost = path.cost(planner.ss.getOptimizationObjective()).value()
+        path.interpolate(50)
+        states = np.array([[s[i] for i in range(4)] for s in path.getStates()])
+
+        return Query_result(index, start, goal, states, cost, time.time() - t0, stats)
+    except Exception as e:
+        return Query_result(index, start, goal, elapsed=time.time() - t0, error=repr(e))
+
+
+class Query_pool():
+    """
+    Pool of forked worker processes, each one builds its planner (a PlannerSepCollision.clone
+    of `planner`) once and then answers start/goal queries. Roadmap planners
+    (MULTI_QUERY_PLANNERS) grow one graph over all the queries of their worker.
+
+    The workers are a snapshot of the planner at creation time, close the pool after
+    changing the environment.
+    """
+
+    def __init__(self, planner, n_workers=None, planner_class=og.RRT) -> None:
+        self.planner_class = planner_class
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self._initargs = (planner, planner_class)
+        self.pool = self._start_pool()
+
+    def _start_pool(self):
+        ctx = multiprocessing.get_context("fork")
+        return ctx.Pool(self.n_workers, initializer=_init_query_worker, initargs=self._initargs)
+
+    def solve(self, starts, goals, timeout=15.0):
+        """
+        starts, goals: sequences of (x, y, z, yaw)
+
+        Returns one Query_result per query, in the order of the queries. A query whose
+        worker did not answer in time (stuck or crashed) gets a failed Query_result and the
+        workers are restarted.
+        """
+        if len(starts) != len(goals):
+            raise ValueError("Got {} starts and {} goals".format(len(starts), len(goals)))
+
+        queries = [(i, list(start), list(goal), timeout) for i, (start, goal) in enumerate(zip(starts, goals))]
+        t0 = time.time()
+        pending = [self.pool.apply_async(_solve_query, (query,)) for query in queries]
+        # every worker answers its share of the queries one after the other
+        deadline = t0 + timeout * ceil(len(queries) / self.n_workers) + CANCEL_GRACE
+
+        results, lost = [], False
+        for (index, start, goal, _), result in zip(queries, pending):
+            try:
+                results.append(result.get(max(0.0, deadline - time.time())))
+            except multiprocessing.TimeoutError:
+                results.append(Query_result(index, start, goal, elapsed=time.time() - t0,
+                                            error="no answer from the worker"))
+                lost = True
+
+        if lost:
+            self.close()
+            self.pool = self._start_pool()
+
+        return results
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
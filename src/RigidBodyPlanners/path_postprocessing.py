@@ -0,0 +1,126 @@
+import numpy as np
+
+
+def point_motion(a, b, robot_radius=0.0):
+    """
+    Bound on how far a robot point moves along the straight (x, y, z, yaw) motion a -> b.
+    """
+    return np.linalg.norm(b[..., :3] - a[..., :3], axis=-1) + robot_radius * np.abs(b[..., 3] - a[..., 3])
+
+
+def segment_samples(a, b, resolution, robot_radius=0.0):
+    """
+    States along a -> b so that no robot point moves more than resolution between two of them.
+    """
+    n = max(2, int(np.ceil(point_motion(a, b, robot_radius) / resolution)) + 1)
+    return a + (b - a) * np.linspace(0, 1, n)[:, None]
+
+
+def shortcut_path(states, check_states, resolution=0.02, robot_radius=0.0, max_lookahead=None,
+                  coarse_factor=8):
+    """
+    Greedy shortcutting: from every kept state jump to the farthest later state that is
+    reachable in a straight line. The candidate segments of a state are sampled together and
+    checked in batch calls, first at coarse_factor * resolution to discard the blocked ones
+    cheaply, then the remaining ones at resolution.
+
+    check_states: (N, 4) states -> (N,) bool, True when colliding
+
+    The edges of the input path are assumed valid, so the next state is always reachable.
+    """
+    states = np.asarray(states, dtype=np.float64)
+    n = len(states)
+    kept = [0]
+    i = 0
+    while i < n - 1:
+        last = n - 1 if max_lookahead is None else min(n - 1, i + max_lookahead)
+        candidates = np.arange(i + 2, last + 1)
+        for step in (coarse_factor * resolution, resolution):
+            candidates = candidates[~segments_blocked(states[i], states[candidates], check_states,
+                                                      step, robot_radius)]
+
+        best = int(candidates[-1]) if len(candidates) else i + 1
+        kept.append(best)
+        i = best
+
+    return states[kept]
+
+
+def segments_blocked(start, ends, check_states, resolution, robot_radius=0.0):
+    """
+    (M,) bool, True where the straight motion start -> ends[m] hits an obstacle, one batch call.
+    """
+    if len(ends) == 0:
+        return np.zeros(0, dtype=bool)
+
+    samples = [segment_samples(start, end, resolution, robot_radius) for end in ends]
+    owners = np.repeat(np.arange(len(ends)), [len(s) for s in samples])
+    collisions = np.asarray(check_states(np.concatenate(samples)), dtype=bool)
+
+    blocked = np.zeros(len(ends), dtype=bool)
+    np.logical_or.at(blocked, owners, collisions)
+    return blocked
+
+
+def resample_path(states, clearances, min_step=0.05, max_step=0.5, clearance_gain=1.0,
+                  max_yaw_step=0.3):
+    """
+    Place waypoints along the path with a spacing that follows the clearance: a step of
+    clearance_gain * clearance (clipped to min_step..max_step), so the waypoints are dense
+    near obstacles and sparse in the open. A step never turns the yaw by more than
+    max_yaw_step. The vertices of the path are always kept.
+
+    The edges are walked in lockstep, every step asks for the clearance of the current
+    point of all the unfinished edges in one call.
+
+    clearances: (N, 3) positions, (N,) yaws -> (N,) distances to the environment
+    (e.g. Fcl_checker.distance_batch)
+    """
+    states = np.asarray(states, dtype=np.float64)
+    a, b = states[:-1], states[1:]
+    lengths = np.linalg.norm(b[:, :3] - a[:, :3], axis=1)
+    yaw_changes = np.abs(b[:, 3] - a[:, 3])
+    moving = (yaw_changes > 0) & (lengths > 0)
+    yaw_limits = np.full(len(a), np.inf)
+    yaw_limits[moving] = max_yaw_step * lengths[moving] / yaw_changes[moving]
+
+    # arc length of the current point and of the inserted waypoints of every edge
+    s = np.zeros(len(a))
+    inserted = [[] for _ in range(len(a))]
+    active = np.flatnonzero(lengths > 0)
+    while len(active):
+        u = s[active] / lengths[active]
+        p = a[active] + (b[active] - a[active]) * u[:, None]
+        steps = np.clip(clearance_gain * np.asarray(clearances(p[:, :3], p[:, 3]), dtype=np.float64),
+                        min_step, max_step)
+
+        s[active] += np.minimum(steps, yaw_limits[active])
+        done = s[active] >= lengths[active] - min_step / 2
+        for e in active[~done]:
+            inserted[e].append(s[e])
+        active = active[~done]
+
+    out = [states[0]]
+    for e in range(len(a)):
+        out.extend(a[e] + (b[e] - a[e]) * (sk / lengths[e]) for sk in inserted[e])
+        out.append(b[e])
+
+    # a pure rotation in place (length 0) is split by yaw alone
+    result = [out[0]]
+    for p in out[1:]:
+        turns = int(np.ceil(abs(p[3] - result[-1][3]) / max_yaw_step))
+        if np.allclose(p[:3], result[-1][:3]) and turns > 1:
+            result.extend(result[-1] + (p - result[-1]) * np.linspace(0, 1, turns + 1)[1:-1, None])
+        result.append(p)
+
+    return np.array(result)
+
+
+def postprocess_path(states, check_states, clearances, robot_radius=0.0, resolution=0.02, **kwargs):
+    """
+    Shortcut the path with batch checks, then re-sample it adaptively (see resample_path).
+
+    Returns the (N, 4) waypoints for the trajectory generator.
+    """
+    short = shortcut_path(states, check_states, resolution, robot_radius)
+    return resample_path(short, clearances, **kwargs)
@@ -0,0 +1,105 @@
+import glob
+import hashlib
+import json
+import os
+
+try:
+    from .ompl_bindings import ob
+    from .file_utils import atomic_write
+except ImportError:
+    from ompl_bindings import ob
+    from file_utils import atomic_write
+
+# bump when the stored graphs or their metadata change meaning
+ROADMAP_FORMAT_VERSION = 1
+
+DEFAULT_ROADMAP_DIR = os.path.join(
+    os.path.expanduser("~"), ".ros", "drone_path_planning", "roadmaps")
+
+
+class Roadmap_store():
+    """
+    Multi-query roadmaps (PRM / LazyPRM planner data) on disk, one per
+    (environment, robot, bounds, planner) key.
+
+    Every graph has a json sidecar with the hashes it was built for. Loading a roadmap for
+    a robot and bounds whose environment hash changed deletes the stale graphs, a LazyPRM
+    graph is never used for a PRM (its edges were not checked).
+    """
+
+    def __init__(self, directory=DEFAULT_ROADMAP_DIR) -> None:
+        self.directory = directory
+
+    def make_meta(self, env_hash, robot_hash, bounds, planner_name):
+        return {"env_hash": env_hash, "robot_hash": robot_hash,
+                "bounds": [[round(float(v), 6) for v in b] for b in bounds],
+                "planner": planner_name, "version": ROADMAP_FORMAT_VERSION}
+
+    def make_key(self, meta):
+        return hashlib.sha1(json.dumps(meta, sort_keys=True).encode()).hexdigest()
+
+    def graph_file(self, key):
+        return os.path.join(self.directory, key + ".graph")
+
+    def meta_file(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, si, env_hash, robot_hash, bounds, planner_name):
+        """
+        ob.PlannerData of the stored roadmap or None when there is none for this key.
+        """
+        meta = self.make_meta(env_hash, robot_hash, bounds, planner_name)
+        self.invalidate_stale(meta)
+
+        path = self.graph_file(self.make_key(meta))
+        if not os.path.isfile(path):
+            return None
+
+        data = ob.PlannerData(si)
+        try:
+            ob.PlannerDataStorage().load(path, data)
+        except Exception as e:
+            print("Ignoring unreadable roadmap {}: {}".format(path, e))
+            return None
+
+        print("Loaded roadmap {} ({} vertices, {} edges)".format(
+            path, data.numVertices(), data.numEdges()))
+        return data
+
+    def save(self, ss, env_hash, robot_hash, bounds, planner_name):
+        meta = self.make_meta(env_hash, robot_hash, bounds, planner_name)
+        key = self.make_key(meta)
+
+        data = ob.PlannerData(ss.getSpaceInformation())
+        ss.getPlannerData(data)
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # the graph is written first so a readable sidecar always has its graph
+            atomic_write(self.graph_file(key), lambda path: ob.PlannerDataStorage().store(data, path))
+            with open(self.meta_file(key), "w") as f:
+                json.dump(meta, f)
+        except OSError as e:
+            print("Could not write roadmap to {}: {}".format(self.directory, e))
+
+        return data
+
+    def invalidate_stale(self, meta):
+        """
+        Delete the roadmaps of the same robot, bounds and planner built for another environment.
+        """
+        for meta_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(meta_path) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            same_problem = all(other.get(k) == meta[k] for k in ("robot_hash", "bounds", "planner"))
+            if same_problem and (other.get("env_hash") != meta["env_hash"] or
+                                 other.get("version") != meta["version"]):
+                key = os.path.splitext(os.path.basename(meta_path))[0]
+                print("Removing stale roadmap", self.graph_file(key))
+                for path in (self.graph_file(key), meta_path):
+                    if os.path.isfile(path):
+                        os.remove(path)
@@ -0,0 +1,120 @@
+import hashlib
+
+import fcl
+import numpy as np
+
+
+def quaternion_matrix_wxyz(q):
+    w, x, y, z = q
+    return np.array([
+        [1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)],
+        [2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)],
+        [2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)]])
+
+
+def z_to_direction(d):
+    """
+    Rotation matrix that maps the z axis onto the unit vector d (fcl capsules are built along z).
+    """
+    z = np.array([0.0, 0.0, 1.0])
+    v = np.cross(z, d)
+    c = np.dot(z, d)
+    if np.linalg.norm(v) < 1e-12:
+        return np.eye(3) if c > 0 else np.diag([1.0, -1.0, -1.0])
+
+    vx = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+    return np.eye(3) + vx + vx @ vx / (1 + c)
+
+
+class Formation_geometry():
+    """
+    Robot made of fcl primitives generated from a formation description.
+
+    Every drone is a sphere of drone_radius at its offset (like `drone_positions` in
+    drones_traj_generator.py). Without a payload consecutive drones are joined by capsules,
+    with one every drone is joined to a box shaped payload at payload_offset.
+    Primitive vs BVH tests are much cheaper than the mesh vs mesh ones of an STL robot.
+    """
+
+    def __init__(self, drone_positions, drone_radius=0.15, link_radius=0.02,
+                 payload_size=None, payload_offset=[0, 0, 0]) -> None:
+        self.drone_positions = np.asarray(drone_positions, dtype=np.float64).reshape(-1, 3)
+        self.drone_radius = drone_radius
+        self.link_radius = link_radius
+        self.payload_size = payload_size
+        self.payload_offset = np.asarray(payload_offset, dtype=np.float64)
+
+        # fcl geometries with their pose in the robot frame
+        self.geometries, self.local_R, self.local_T = [], [], []
+        # points of the robot (used by the SDF pre-filter and the bounding radius)
+        points = []
+
+        for p in self.drone_positions:
+            # a zero length capsule is the sphere: the sphere vs BVH mesh tests of fcl miss
+            # contacts and return garbage distances
+            self.add_part(fcl.Capsule(drone_radius, 0.0), np.eye(3), p)
+            points.extend(p + drone_radius * np.vstack([np.eye(3), -np.eye(3)]))
+
+        if payload_size is not None:
+            half = np.asarray(payload_size, dtype=np.float64) / 2
+            self.add_part(fcl.Box(*payload_size), np.eye(3), self.payload_offset)
+            corners = np.array([[sx, sy, sz] for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)])
+            points.extend(self.payload_offset + corners * half)
+            links = [(p, self.payload_offset) for p in self.drone_positions]
+        else:
+            links = list(zip(self.drone_positions[:-1], self.drone_positions[1:]))
+
+        for a, b in links:
+            length = np.linalg.norm(b - a)
+            if length > 0:
+                self.add_part(fcl.Capsule(link_radius, length),
+                              z_to_direction((b - a) / length), (a + b) / 2)
+
+        self.verts = np.array(points)
+        # radius of the sphere around the robot origin that contains every part
+        self.bounding_radius = max(
+            [np.linalg.norm(p) + drone_radius for p in self.drone_positions] +
+            [np.linalg.norm(v) for v in self.verts] +
+            [np.linalg.norm(p) + link_radius for link in links for p in link])
+        self.collision_objects = self.make_collision_objects()
+
+        params = repr((self.drone_positions.round(6).tolist(), drone_radius, link_radius,
+                       payload_size, self.payload_offset.round(6).tolist()))
+        self.content_hash = hashlib.sha1(params.encode()).hexdigest()
+
+    def add_part(self, geometry, R, T):
+        self.geometries.append(geometry)
+        self.local_R.append(np.asarray(R, dtype=np.float64))
+        self.local_T.append(np.asarray(T, dtype=np.float64))
+
+    def make_collision_objects(self):
+        return [fcl.CollisionObject(g, fcl.Transform(R, T))
+                for g, R, T in zip(self.geometries, self.local_R, self.local_T)]
+
+    def part_transforms(self, q, T):
+        """
+        World transforms of the parts for the robot pose (q WXYZ, T).
+        """
+        R = quaternion_matrix_wxyz(q)
+        T = np.asarray(T, dtype=np.float64)
+
+        return [fcl.Transform(R @ R_i, R @ T_i + T) for R_i, T_i in zip(self.local_R, self.local_T)]
+
+    def part_transforms_batch(self, quats, positions):
+        """
+        Vectorized part_transforms for (N, 4) WXYZ quats and (N, 3) positions.
+
+        Returns a list over the parts of ((N, 3, 3) rotations, (N, 3) translations).
+        """
+        w, x, y, z = quats.T
+        R = np.stack([
+            np.stack([1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)], axis=-1),
+            np.stack([2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)], axis=-1),
+            np.stack([2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)], axis=-1)], axis=1)
+
+        return [(R @ R_i, R @ T_i + positions) for R_i, T_i in zip(self.local_R, self.local_T)]
+
+    def set_transform(self, T=[0, 0, 0], q=[0, 0, 0, 1]):
+        q = [q[3], q[0], q[1], q[2]]  # from XYZW to WXYZ
+        for obj, tf in zip(self.collision_objects, self.part_transforms(q, T)):
+            obj.setTransform(tf)
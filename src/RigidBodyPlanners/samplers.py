@@ -0,0 +1,143 @@
+import numpy as np
+
+try:
+    from .ompl_bindings import ob, ompl_rng
+except ImportError:
+    from ompl_bindings import ob, ompl_rng
+
+try:
+    from .thread_stats import Thread_stats
+except ImportError:
+    from thread_stats import Thread_stats
+
+STRATEGIES = ("gaussian", "bridge", "obstacle")
+
+
+class Narrow_passage_sampler(ob.ValidStateSampler):
+    """
+    Valid (x, y, z, yaw) states concentrated near the obstacles, for narrow passages like the
+    ones of the env-scene-hole scenes:
+
+        gaussian: pairs of a uniform state and a gaussian neighbour, the valid one of the pairs
+            with exactly one valid state is kept (Boor et al.)
+        bridge: pairs of invalid states whose midpoint is valid, i.e. gaps between obstacles
+            (bridge test, Hsu et al.)
+        obstacle: from an invalid uniform state walk in a random direction until the first
+            valid state, which lies on the obstacle boundary (OBPRM)
+
+    The candidates are generated and checked a batch at a time with the batch collision API
+    (check_states(states) -> (N,) bool, True when colliding), the accepted states are then
+    handed out one by one. Used by the planners that draw valid samples (og.PRM, og.PRMstar,
+    og.LazyPRM, ...).
+
+    stats: Thread_stats with the "candidates", "checks" and "accepted" counters
+    """
+
+    def __init__(self, si, check_states, low, high, strategy="bridge", stddev=0.15, yaw_stddev=0.3,
+                 batch_size=512, max_batches=50, stats=None):
+        super(Narrow_passage_sampler, self).__init__(si)
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown sampling strategy: {}".format(strategy))
+
+        self.name_ = strategy + " sampler"
+        self.check_states = check_states
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.strategy = strategy
+        self.stddev = np.array([stddev, stddev, stddev, yaw_stddev])
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.stats = stats if stats is not None else Thread_stats()
+
+        self.rng = ompl_rng()
+        self.pending = np.zeros((0, 4))
+
+    def sample(self, state):
+        if len(self.pending) == 0:
+            self.refill()
+            if len(self.pending) == 0:
+                return False
+
+        s, self.pending = self.pending[-1], self.pending[:-1]
+        for i in range(4):
+            state[i] = s[i]
+
+        return True
+
+    def sampleNear(self, state, near, distance):
+        center = np.array([near[i] for i in range(4)])
+        candidates = np.clip(center + self.rng.uniform(-distance, distance, (self.batch_size // 8, 4)),
+                             self.low, self.high)
+        valid = ~self.check(candidates)
+        if not valid.any():
+            return False
+
+        s = candidates[np.argmax(valid)]
+        for i in range(4):
+            state[i] = s[i]
+
+        return True
+
+    def check(self, states):
+        if len(states) == 0:
+            return np.zeros(0, dtype=bool)
+
+        self.stats.add("checks", len(states))
+        return np.asarray(self.check_states(states), dtype=bool)
+
+    def uniform(self, n):
+        return self.rng.uniform(self.low, self.high, (n, 4))
+
+    def neighbours(self, states):
+        return np.clip(states + self.rng.normal(0, 1, states.shape) * self.stddev, self.low, self.high)
+
+    def refill(self):
+        for _ in range(self.max_batches):
+            accepted = getattr(self, "_" + self.strategy)(self.uniform(self.batch_size))
+            self.stats.add("candidates", self.batch_size)
+            self.stats.add("accepted", len(accepted))
+            if len(accepted):
+                self.pending = accepted
+                return
+
+    def _gaussian(self, x):
+        y = self.neighbours(x)
+        x_valid, y_valid = ~self.check(x), ~self.check(y)
+
+        return np.concatenate([x[x_valid & ~y_valid], y[y_valid & ~x_valid]])
+
+    def _bridge(self, x):
+        x = x[self.check(x)]
+        y = self.neighbours(x)
+        both_invalid = self.check(y)
+        x, y = x[both_invalid], y[both_invalid]
+        m = (x + y) / 2
+        # the yaw of the midpoint is in the middle of the shorter arc
+        dyaw = (y[:, 3] - x[:, 3] + np.pi) % (2 * np.pi) - np.pi
+        m[:, 3] = (x[:, 3] + dyaw / 2 + np.pi) % (2 * np.pi) - np.pi
+
+        return m[~self.check(m)]
+
+    def _obstacle(self, x, n_steps=10):
+        x = x[self.check(x)]
+        directions = self.rng.normal(0, 1, x.shape) * self.stddev
+        directions /= np.linalg.norm(directions / self.stddev, axis=1, keepdims=True)
+
+        accepted = []
+        for k in range(1, n_steps + 1):
+            if len(x) == 0:
+                break
+            s = np.clip(x + k * directions, self.low, self.high)
+            valid = ~self.check(s)
+            accepted.append(s[valid])
+            x, directions = x[~valid], directions[~valid]
+
+        return np.concatenate(accepted) if accepted else np.zeros((0, 4))
+
+
+def acceptance_stats(stats: Thread_stats):
+    totals = stats.totals()
+    candidates = totals.get("candidates", 0)
+    totals["acceptance"] = totals.get("accepted", 0) / candidates if candidates else 0.0
+
+    return totals
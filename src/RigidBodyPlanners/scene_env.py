@@ -0,0 +1,124 @@
+import hashlib
+
+import fcl
+import numpy as np
+
+try:
+    from .mesh_cache import registry
+    from .mesh_indexing import index_stl
+except ImportError:
+    from mesh_cache import registry
+    from mesh_indexing import index_stl
+
+
+def _build_tables(filename, decimals):
+    return index_stl(filename, decimals)
+
+
+def first_collision_callback(o1, o2, cdata):
+    """
+    Broadphase collide callback that stops the traversal at the first colliding pair.
+    """
+    if not cdata.done and fcl.collide(o1, o2, cdata.request, cdata.result):
+        cdata.done = True
+
+    return cdata.done
+
+
+class Fcl_scene():
+    """
+    Environment made of named, independently transformable objects (STL meshes or fcl
+    primitives) in a DynamicAABBTree broadphase manager.
+
+    Moving, adding or removing an obstacle only touches that object: its transform is set
+    and its node of the tree is refitted, the other BVHs are left as they are. Meshes come
+    from the mesh registry, so re-adding a door or a parked vehicle between missions does
+    not parse its STL again.
+
+    Exposes the same collide / distance / content_hash interface as an environment Fcl_mesh.
+    The scene must not be changed while a planner is querying it.
+    """
+
+    def __init__(self, static_mesh_file=None, decimals=2) -> None:
+        """
+        static_mesh_file: optional STL of the fixed part of the environment, added as "static"
+        """
+        self.decimals = decimals
+
+        # name -> fcl.CollisionObject
+        self.objects = {}
+        # name -> (geometry hash, T, q XYZW), used for the scene content hash
+        self.poses = {}
+
+        self.manager = fcl.DynamicAABBTreeCollisionManager()
+        self.manager.setup()
+        self._update_hash()
+
+        if static_mesh_file is not None:
+            self.add_mesh("static", static_mesh_file)
+
+    def add_mesh(self, name, filename, T=[0, 0, 0], q=[0, 0, 0, 1]):
+        entry = registry.get(filename, self.decimals, _build_tables)
+        return self._add(name, entry.bvh, entry.content_hash, T, q)
+
+    def add_object(self, name, geometry, T=[0, 0, 0], q=[0, 0, 0, 1]):
+        """
+        geometry: fcl primitive (fcl.Box, fcl.Cylinder, ...) in the object frame
+        """
+        params = {k: np.round(getattr(geometry, k), 6).tolist()
+                  for k in ("side", "radius", "lz") if hasattr(geometry, k)}
+        return self._add(name, geometry, "{}{}".format(type(geometry).__name__, params), T, q)
+
+    def _add(self, name, geometry, geometry_hash, T, q):
+        if name in self.objects:
+            raise ValueError("Scene already has an object named {}".format(name))
+
+        obj = fcl.CollisionObject(geometry, self._transform(T, q))
+        self.objects[name] = obj
+        self.poses[name] = (geometry_hash, list(T), list(q))
+
+        self.manager.registerObject(obj)
+        self.manager.update()
+        self._update_hash()
+
+        return obj
+
+    def move_object(self, name, T, q=[0, 0, 0, 1]):
+        obj = self.objects[name]
+        obj.setTransform(self._transform(T, q))
+        self.manager.update(obj)
+
+        self.poses[name] = (self.poses[name][0], list(T), list(q))
+        self._update_hash()
+
+    def remove_object(self, name):
+        obj = self.objects.pop(name)
+        del self.poses[name]
+
+        self.manager.unregisterObject(obj)
+        self.manager.update()
+        self._update_hash()
+
+    def _transform(self, T, q):
+        return fcl.Transform([q[3], q[0], q[1], q[2]], np.asarray(T, dtype=np.float64))  # XYZW to WXYZ
+
+    def _update_hash(self):
+        # changes with every edit, so SDFs and C-space maps of an older scene are rejected
+        key = repr(sorted((name, g, np.round(T, 6).tolist(), np.round(q, 6).tolist())
+                          for name, (g, T, q) in self.poses.items()))
+        self.content_hash = hashlib.sha1(key.encode()).hexdigest()
+
+    def collide(self, robot_object, request, result):
+        data = fcl.CollisionData(request, fcl.CollisionResult())
+        self.manager.collide(robot_object, data, first_collision_callback)
+
+        return int(data.result.is_collision)
+
+    def distance(self, robot_object):
+        if not self.objects:
+            return np.inf
+
+        data = fcl.DistanceData()
+        self.manager.distance(robot_object, data, fcl.defaultDistanceCallback)
+
+        return data.result.min_distance
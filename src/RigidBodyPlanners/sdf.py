@@ -0,0 +1,218 @@
+import json
+import os
+from math import floor, sqrt
+
+import numpy as np
+
+try:
+    from .mesh_cache import DEFAULT_CACHE_DIR
+except ImportError:
+    from mesh_cache import DEFAULT_CACHE_DIR
+
+# answers of Sdf_grid.classify
+SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN = 0, 1, -1
+
+
+def rotate_points(quats, points):
+    """
+    Rotate the (P, 3) points by each of the (N, 4) WXYZ quaternions, returns an (N, P, 3) array.
+    """
+    w, v = quats[:, :1, None], quats[:, None, 1:]
+    p = points[None, :, :]
+    # p' = p + 2w (v x p) + 2 v x (v x p)
+    vxp = np.cross(v, p)
+    return p + 2 * w * vxp + 2 * np.cross(v, vxp)
+
+
+def sample_triangles(verts, tris, spacing):
+    """
+    Points on the triangles so that every surface point is within `spacing` of a sample.
+    """
+    corners = verts[tris]
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    longest = np.max([np.linalg.norm(b - a, axis=1), np.linalg.norm(c - b, axis=1),
+                      np.linalg.norm(a - c, axis=1)], axis=0)
+    steps = np.maximum(1, np.ceil(longest / spacing)).astype(int)
+
+    samples = []
+    # triangles with the same subdivision are sampled together on one barycentric lattice
+    for n in np.unique(steps):
+        i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+        keep = i + j <= n
+        u, v = i[keep] / n, j[keep] / n
+        sel = steps == n
+        pts = (a[sel, None, :] * (1 - u - v)[None, :, None] +
+               b[sel, None, :] * u[None, :, None] + c[sel, None, :] * v[None, :, None])
+        samples.append(pts.reshape(-1, 3))
+
+    return np.concatenate(samples)
+
+
+class Sdf_grid():
+    """
+    Voxel signed distance field of the environment, negative inside closed obstacles.
+
+    The grid is stored as a plain .npy file (plus a .json header) so it can be memory mapped,
+    a lookup is a nearest voxel read. `error` bounds the difference between a looked up value
+    and the true distance at the query point, `classify` only answers when the robot is
+    certainly free or certainly colliding given that bound.
+    """
+
+    def __init__(self, grid, origin, voxel_size, content_hash=None) -> None:
+        self.grid = grid
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel_size = float(voxel_size)
+        self.content_hash = content_hash
+        self.shape = np.array(grid.shape)
+        # plain python copies for query_one
+        self._origin = tuple(float(c) for c in self.origin)
+        self._shape = tuple(int(n) for n in grid.shape)
+
+        # surface sampling + voxel center discretization + nearest voxel lookup
+        self.error = 1.5 * sqrt(3) * self.voxel_size
+
+    @classmethod
+    def build(cls, verts, tris, voxel_size=0.05, padding=2.5, content_hash=None):
+        """
+        Build the field of a triangle mesh (offline, needs scipy).
+
+        Space enclosed by the mesh counts as inside, so obstacles should be closed surfaces.
+        padding should be at least the robot radius so every relevant query falls in the grid.
+        """
+        from scipy import ndimage
+
+        lower = verts.min(axis=0) - padding
+        upper = verts.max(axis=0) + padding
+        shape = np.ceil((upper - lower) / voxel_size).astype(int) + 1
+
+        samples = sample_triangles(verts, tris, voxel_size / 2)
+        idx = np.round((samples - lower) / voxel_size).astype(int)
+        surface = np.zeros(shape, dtype=bool)
+        surface[idx[:, 0], idx[:, 1], idx[:, 2]] = True
+
+        solid = ndimage.binary_fill_holes(surface)
+        outside = ndimage.distance_transform_edt(~solid) * voxel_size
+        inside = ndimage.distance_transform_edt(solid) * voxel_size
+        grid = np.where(solid, -inside, outside).astype(np.float32)
+
+        return cls(grid, lower, voxel_size, content_hash)
+
+    @classmethod
+    def from_mesh(cls, fcl_mesh, voxel_size=0.05, padding=2.5):
+        return cls.build(fcl_mesh.verts, fcl_mesh.tris, voxel_size, padding, fcl_mesh.content_hash)
+
+    def save(self, path):
+        """
+        Write path.npy (the grid) and path.json (origin, voxel size, mesh hash).
+        """
+        np.save(path + ".npy", np.asarray(self.grid, dtype=np.float32))
+        with open(path + ".json", "w") as f:
+            json.dump({"origin": self.origin.tolist(), "voxel_size": self.voxel_size,
+                       "content_hash": self.content_hash}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path + ".json") as f:
+            header = json.load(f)
+        grid = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+
+        return cls(grid, header["origin"], header["voxel_size"], header["content_hash"])
+
+    def query(self, points):
+        """
+        Signed distance at the (N, 3) points, nan outside the grid.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        idx = np.round((points - self.origin) / self.voxel_size).astype(int)
+        inside = np.all((idx >= 0) & (idx < self.shape), axis=1)
+
+        values = np.full(len(points), np.nan)
+        i = idx[inside]
+        values[inside] = self.grid[i[:, 0], i[:, 1], i[:, 2]]
+
+        return values
+
+    def query_one(self, x, y, z):
+        """
+        Signed distance at one point, nan outside the grid. Plain python (no arrays are
+        allocated) so it stays cheaper than the fcl query it is meant to skip.
+        """
+        i = floor((float(x) - self._origin[0]) / self.voxel_size + 0.5)
+        j = floor((float(y) - self._origin[1]) / self.voxel_size + 0.5)
+        k = floor((float(z) - self._origin[2]) / self.voxel_size + 0.5)
+        if not (0 <= i < self._shape[0] and 0 <= j < self._shape[1] and 0 <= k < self._shape[2]):
+            return float("nan")
+
+        return float(self.grid[i, j, k])
+
+    def classify_one(self, position, quat, robot_points, robot_radius):
+        """
+        classify for a single pose, quat: WXYZ. The bounding sphere test runs in plain python,
+        the robot points are only tested (with arrays) close to an obstacle.
+        """
+        center = self.query_one(position[0], position[1], position[2])
+        if center - self.error > robot_radius:
+            return SDF_FREE
+        if center != center:
+            return SDF_UNKNOWN
+
+        pts = rotate_points(np.asarray(quat, dtype=np.float64).reshape(1, 4), robot_points)[0] + position
+        if self._buried(pts[None, :, :])[0]:
+            return SDF_COLLIDING
+
+        return SDF_UNKNOWN
+
+    def classify(self, positions, quats, robot_points, robot_radius):
+        """
+        positions: (N, 3), quats: (N, 4) WXYZ, robot_points: (P, 3) points of the robot in its frame
+
+        Returns an (N,) int8 array of SDF_FREE, SDF_COLLIDING or SDF_UNKNOWN.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        answer = np.full(len(positions), SDF_UNKNOWN, dtype=np.int8)
+
+        # the whole robot lies in a sphere of robot_radius around its origin
+        center = self.query(positions)
+        free = center - self.error > robot_radius
+        answer[free] = SDF_FREE
+
+        rest = np.flatnonzero(~free & ~np.isnan(center))
+        if len(rest):
+            pts = rotate_points(quats[rest], robot_points) + positions[rest, None, :]
+            answer[rest[self._buried(pts)]] = SDF_COLLIDING
+
+        return answer
+
+    def _buried(self, pts):
+        """
+        pts: (N, P, 3) robot points of N poses, True where some point is inside an obstacle even in the worst case.
+        """
+        d = self.query(pts.reshape(-1, 3)).reshape(pts.shape[:2])
+        return np.any(d < -self.error, axis=1)
+
+
+def sdf_path(content_hash, voxel_size, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, "{}_sdf_{:g}".format(content_hash, voxel_size))
+
+
+if __name__ == '__main__':
+    # offline builder: python sdf.py env-scene-hole.stl --voxel 0.05
+    import argparse
+    try:
+        from .fcl_checker import Fcl_mesh
+    except ImportError:
+        from fcl_checker import Fcl_mesh
+
+    parser = argparse.ArgumentParser(description="Build the signed distance field of an environment STL")
+    parser.add_argument("stl")
+    parser.add_argument("--voxel", type=float, default=0.05)
+    parser.add_argument("--padding", type=float, default=2.5)
+    parser.add_argument("--out", default=None, help="output prefix, defaults to the mesh cache")
+    args = parser.parse_args()
+
+    env = Fcl_mesh(args.stl)
+    sdf = Sdf_grid.from_mesh(env, args.voxel, args.padding)
+    out = args.out or sdf_path(env.content_hash, args.voxel)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    sdf.save(out)
+    print("Saved {} grid to {}.npy".format(sdf.grid.shape, out))
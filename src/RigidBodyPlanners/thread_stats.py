@@ -0,0 +1,64 @@
+import threading
+
+
+class Thread_stats():
+    """
+    Counters that many threads can update without locks.
+
+    Every thread only writes to its own dict, reading a counter sums the dicts of all threads.
+    The lock is only taken once per thread, when its dict is registered, and by the readers.
+    The dicts of finished threads (e.g. the workers of a short lived thread pool) are folded
+    into one when the next thread registers, so they do not pile up.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        # (thread, counters) of the threads that may still write
+        self._per_thread = []
+        # summed counters of the finished threads
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _counters(self):
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = {}
+            self._local.counters = counters
+            with self._lock:
+                self._retire_finished()
+                self._per_thread.append((threading.current_thread(), counters))
+
+        return counters
+
+    def _retire_finished(self):
+        alive = []
+        for thread, counters in self._per_thread:
+            if thread.is_alive():
+                alive.append((thread, counters))
+                continue
+            for name, value in counters.items():
+                self._retired[name] = self._retired.get(name, 0) + value
+        self._per_thread = alive
+
+    def add(self, name, value=1):
+        counters = self._counters()
+        counters[name] = counters.get(name, 0) + value
+
+    def get(self, name):
+        with self._lock:
+            return self._retired.get(name, 0) + sum(counters.get(name, 0) for _, counters in self._per_thread)
+
+    def totals(self):
+        with self._lock:
+            totals = dict(self._retired)
+            for _, counters in self._per_thread:
+                for name, value in list(counters.items()):
+                    totals[name] = totals.get(name, 0) + value
+
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for _, counters in self._per_thread:
+                counters.clear()
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from math import floor, pi
+
+
+class Validity_cache():
+    """
+    Bounded LRU cache of state validity results keyed on quantized (x, y, z, yaw) poses.
+
+    Every pose inside the same (pos_resolution^3 x yaw_resolution) cell shares one answer,
+    the one of the first pose checked in it. In conservative mode a hit is only trusted when
+    the pose is farther than `boundary_margin` (fraction of a cell) from the cell faces,
+    otherwise it is reported as uncertain and the caller checks the pose itself.
+    """
+
+    def __init__(self, pos_resolution=0.01, yaw_resolution=0.01, max_size=100000,
+                 conservative=False, boundary_margin=0.25) -> None:
+        self.pos_resolution = pos_resolution
+        self.yaw_resolution = yaw_resolution
+        self.max_size = max_size
+        self.conservative = conservative
+        self.boundary_margin = boundary_margin
+
+        self.entries = OrderedDict()
+        # the LRU order is mutated by every lookup, so unlike the checker this needs a lock
+        self._lock = threading.Lock()
+
+        self.hits, self.misses, self.uncertain, self.evictions = 0, 0, 0, 0
+
+    def quantize(self, x, y, z, yaw):
+        """
+        Returns (key, near_boundary).
+        """
+        # wrap the yaw so -pi and pi fall in the same cell
+        yaw = (yaw + pi) % (2 * pi) - pi
+        scaled = (x / self.pos_resolution, y / self.pos_resolution,
+                  z / self.pos_resolution, yaw / self.yaw_resolution)
+        key = tuple(floor(v) for v in scaled)
+
+        near_boundary = False
+        if self.conservative:
+            m = self.boundary_margin
+            near_boundary = any(not (m <= v - k <= 1 - m) for v, k in zip(scaled, key))
+
+        return key, near_boundary
+
+    def get(self, x, y, z, yaw):
+        """
+        Cached validity of the pose or None when it has to be checked.
+        """
+        key, near_boundary = self.quantize(x, y, z, yaw)
+        with self._lock:
+            valid = self.entries.get(key)
+            if valid is None:
+                self.misses += 1
+                return None
+
+            if near_boundary:
+                self.uncertain += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return valid
+
+    def put(self, x, y, z, yaw, valid):
+        key, _ = self.quantize(x, y, z, yaw)
+        with self._lock:
+            self.entries[key] = bool(valid)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "uncertain": self.uncertain,
+                "evictions": self.evictions, "size": len(self.entries)}
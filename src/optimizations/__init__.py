@@ -1,2 +1,5 @@
 from .uav_trajectory import *
 from .calculatingTrajectories import calculate_trajectory4D
+from .trajectory_verification import verify_trajectory, Verification_result
+from .trajectory_repair import repair_trajectory, Repair_result
+from .waypoint_thinning import thin_waypoints, thin_indices
@@ -3,6 +3,7 @@ import numpy as np
 from numpy.core.function_base import linspace
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from math import factorial
 from sympy import primitive
 
 try:
@@ -10,6 +11,11 @@ try:
 except:
     from .uav_trajectory import *
 
+try:
+    from scipy.linalg import solve_banded
+except ImportError:
+    solve_banded = None
+
 #################################POL GENERATOR OVERVIEW#######################################
 """
 A 7th rank polynomial is used (t^7)
@@ -33,14 +39,98 @@ Last wp(waipont) conditions:
 """
 ##############################################################################################
 
+# p!/(p-k)!, the factor of t^(p-k) in the k-th derivative of t^p
+FALLING_FACTORIALS = np.array([[factorial(p) // factorial(p - k) if p >= k else 0 for p in range(8)]
+                               for k in range(8)], dtype=np.float64)
+
+# lower and upper bandwidth of the constraint matrix, the rows of a waypoint only
+# involve the coefficients of the two polynomials around it
+BAND_LOWER, BAND_UPPER = 10, 11
+
 
-def calculate_trajectory1D(waypoints, wp_type=Waypoint.WP_TYPE_X):
+def derivative_rows(t):
+    """
+    (..., 8, 8) matrix whose row k gives the k-th derivative at (local) time t when multiplied
+    with the coefficients of a polynomial. Same rows as Polynomial.pol_coeffs_at_t of the
+    successive derivatives, for an array of times at once.
+    """
+    t = np.asarray(t, dtype=np.float64)[..., None, None]
+    powers = np.maximum(np.arange(8)[None, :] - np.arange(8)[:, None], 0)
+
+    return FALLING_FACTORIALS * t**powers
+
+
+def solve_trajectory_banded(times, values, start_derivatives=None, end_derivatives=None):
+    """
+    Solve the constraints of calculate_trajectory1D (same rows, same order) stored in LAPACK
+    banded form: O(n) memory and time instead of the O(n^2) / O(n^3) of the dense matrix.
+
+    times, values: (m,) times and values of the waypoints
+
+    Returns the (8n, 1) polynomial coefficients.
+    """
+    n = len(times) - 1
+    durations = np.diff(times)
+    ab = np.zeros((BAND_LOWER + BAND_UPPER + 1, 8*n))
+    b = np.zeros((8*n, 1))
+
+    def put(rows, cols, block):
+        # A[rows, cols] = block in the banded storage: ab[u + i - j, j] = A[i, j]
+        ab[BAND_UPPER + rows - cols, cols] = block
+
+    cols = np.arange(8)
+    start = derivative_rows(times[0])
+    end = derivative_rows(durations[-1])
+    next_rows = derivative_rows(0.0)
+
+    # start/end constraints
+    put(np.arange(4)[:, None], cols, start[:4])
+    put(8*n - 4 + np.arange(4)[:, None], 8*(n-1) + cols, end[:4])
+    b[:4, 0] = [values[0], 0, 0, 0] if start_derivatives is None else [values[0], *start_derivatives]
+    b[-4:, 0] = [values[-1], 0, 0, 0] if end_derivatives is None else [values[-1], *end_derivatives]
+
+    # continuity and waypoint constraints of the interior waypoints i = 1..n-1
+    i = np.arange(1, n)[:, None, None]
+    prev_rows = derivative_rows(durations[:-1])
+    startl = 4 + (i-1)*8
+    r = np.arange(6)[:, None]
+
+    put(startl + r, 8*(i-1) + cols, prev_rows[:, 1:7, :])
+    put(startl + r, 8*i + cols, -next_rows[1:7, :])
+    put(startl + 6, 8*(i-1) + cols, prev_rows[:, :1, :])
+    put(startl + 7, 8*i + cols, next_rows[:1, :])
+
+    b[4+(np.arange(1, n)-1)*8 + 6, 0] = values[1:-1]
+    b[4+(np.arange(1, n)-1)*8 + 7, 0] = values[1:-1]
+
+    return solve_banded((BAND_LOWER, BAND_UPPER), ab, b)
+
+
+def calculate_trajectory1D(waypoints, wp_type=Waypoint.WP_TYPE_X, start_derivatives=None, end_derivatives=None,
+                           solver="banded"):
     """
     waypoints: list of Point_Time
 
     wp_type: specifies the type of waypoint (x,y,z or yaw)
 
+    start_derivatives, end_derivatives: 1st, 2nd and 3rd derivative at the first/last
+    waypoint (default 0, the trajectory starts and ends at rest)
+
+    solver: "banded" solves the block banded system in O(n) (solve_trajectory_banded, falls back
+    to "dense" without scipy), "dense" assembles the full 8n x 8n matrix, kept for cross-checking
+
     """
+    if solver not in ("banded", "dense"):
+        raise ValueError("Unknown solver: {}".format(solver))
+
+    if solver == "banded" and solve_banded is not None:
+        times = np.array([p.t for p in waypoints], dtype=np.float64)
+        values = np.array([p.wp.getType(wp_type) for p in waypoints], dtype=np.float64)
+        polynomials_coefficients = solve_trajectory_banded(times, values, start_derivatives, end_derivatives)
+
+        piece_pols = [Polynomial(polynomials_coefficients[8*i:8*(i+1)]) for i in range(len(waypoints) - 1)]
+        return piece_pols, PiecewisePolynomial(piece_pols, np.diff(times).tolist())
+
     # If m is the number of waypoints, n is the number of polynomials
     m = len(waypoints)
     n = m - 1
@@ -79,7 +169,10 @@ def calculate_trajectory1D(waypoints, wp_type=Waypoint.WP_TYPE_X):
                     A[ind, 8*(i-1):8*(i)] = arr
                 pol = pol.derivative()
 
-            tmp = np.array([wp, 0, 0, 0]).reshape((4, 1))
+            tmp = np.array([wp, 0, 0, 0], dtype=np.float64).reshape((4, 1))
+            derivatives = start_derivatives if i == 0 else end_derivatives
+            if derivatives is not None:
+                tmp[1:, 0] = derivatives
 
             if i == 0:
                 b[0:4] = tmp
@@ -197,13 +290,22 @@ def calculate_trajectory1D(waypoints, wp_type=Waypoint.WP_TYPE_X):
     return piece_pols, total_pol
 
 
-def calculate_trajectory4D(waypoints):
+def calculate_trajectory4D(waypoints, start_derivatives=None, end_derivatives=None, solver="banded"):
     # waypoints:list of Point_time instances
+    # start_derivatives, end_derivatives: optional (4, 3) x, y, z, yaw rows of 1st-3rd derivatives
+    # solver: "banded" or "dense", see calculate_trajectory1D
+
+    def axis(derivatives, wp_type):
+        return None if derivatives is None else derivatives[wp_type]
 
-    polx, pc_polx = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_X)
-    poly, pc_poly = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_Y)
-    polz, pc_polz = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_Z)
-    polyaw, pc_polyaw = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_YAW)
+    polx, pc_polx = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_X,
+                                           axis(start_derivatives, 0), axis(end_derivatives, 0), solver)
+    poly, pc_poly = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_Y,
+                                           axis(start_derivatives, 1), axis(end_derivatives, 1), solver)
+    polz, pc_polz = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_Z,
+                                           axis(start_derivatives, 2), axis(end_derivatives, 2), solver)
+    polyaw, pc_polyaw = calculate_trajectory1D(waypoints, Waypoint.WP_TYPE_YAW,
+                                               axis(start_derivatives, 3), axis(end_derivatives, 3), solver)
 
     pols_coeffs = [polx, poly, polz, polyaw]
     pc_pols = [pc_polx, pc_poly, pc_polz, pc_polyaw]
@@ -270,4 +372,7 @@ if __name__ == "__main__":
     for i, point in enumerate(test_data):
         traj_points.append(Point_time(Waypoint(point[0], point[1], point[2], point[3]), t=i*timestep))
 
-    calculate_trajectory1D(traj_points, Waypoint.WP_TYPE_X)
+    # cross-check the banded solver against the dense one
+    dense_pols, _ = calculate_trajectory1D(traj_points, Waypoint.WP_TYPE_X, solver="dense")
+    banded_pols, _ = calculate_trajectory1D(traj_points, Waypoint.WP_TYPE_X, solver="banded")
+    print("max coefficient difference:", max(np.abs(d.p - b.p).max() for d, b in zip(dense_pols, banded_pols)))
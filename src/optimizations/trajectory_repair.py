@@ -0,0 +1,129 @@
+import time
+from math import ceil, floor
+
+import numpy as np
+
+try:
+    from uav_trajectory import *
+    from calculatingTrajectories import calculate_trajectory4D
+    from trajectory_verification import verify_trajectory, trajectory_coefficients, derivative_coefficients
+except:
+    from .uav_trajectory import *
+    from .calculatingTrajectories import calculate_trajectory4D
+    from .trajectory_verification import verify_trajectory, trajectory_coefficients, derivative_coefficients
+
+
+def piece_derivatives(pc_pols, piece, t):
+    """
+    (4, 3) array with the 1st, 2nd and 3rd derivative of x, y, z, yaw of a piece at local time t.
+    """
+    coeffs, _ = trajectory_coefficients(pc_pols)
+    c = coeffs[piece:piece+1]
+    powers = t ** np.arange(c.shape[-1])
+
+    derivatives = np.zeros((4, 3))
+    for k in range(3):
+        c = derivative_coefficients(c)
+        derivatives[:, k] = c[0] @ powers
+
+    return derivatives
+
+
+def splice_pieces(pc_pols, first, stop, new_pc_pols):
+    """
+    Replace the pieces first..stop-1 of the [x, y, z, yaw] PiecewisePolynomials by new_pc_pols.
+    """
+    return [PiecewisePolynomial(old.pols[:first] + new.pols + old.pols[stop:],
+                                list(old.time_durations[:first]) + list(new.time_durations) +
+                                list(old.time_durations[stop:]))
+            for old, new in zip(pc_pols, new_pc_pols)]
+
+
+def midpoint(p1: Point_time, p2: Point_time):
+    wp = Waypoint(*[(p1.wp.getType(k) + p2.wp.getType(k)) / 2 for k in range(4)])
+    return Point_time(wp, (p1.t + p2.t) / 2)
+
+
+class Repair_result():
+    def __init__(self, pc_pols, points, verification, iterations, elapsed) -> None:
+        # [x, y, z, yaw] PiecewisePolynomials and the Point_time list they go through
+        self.pc_pols = pc_pols
+        self.points = points
+        # trajectory_verification.Verification_result of the final trajectory
+        self.verification = verification
+        self.iterations = iterations
+        self.elapsed = elapsed
+
+    @property
+    def valid(self):
+        return self.verification.valid
+
+    def __repr__(self):
+        return "{} after {} repair iterations ({:.3f} s, {} waypoints)".format(
+            self.verification, self.iterations, self.elapsed, len(self.points))
+
+
+def repair_trajectory(path_points, checker, indices=None, window=1, max_iterations=20,
+                      time_budget=1.0, **verify_kwargs):
+    """
+    Fit the min-snap trajectory through path_points[indices] and repair it until it is
+    collision free or the budget (iterations or seconds) runs out.
+
+    Every iteration verifies the trajectory (see verify_trajectory) and inserts a waypoint
+    into the first violating piece: the original path point closest to the middle of the piece
+    when the piece skips some, otherwise the midpoint of the two waypoints, which lies on a
+    straight edge of the original (collision free) path. Only the `window` pieces on each side
+    of the insertion are solved again, with the derivatives of the kept pieces as boundary
+    conditions, so the splice is continuous up to the jerk.
+
+    path_points: the original path as a list of Point_time (e.g. every pose of the
+    PlannerSepCollision path with its time)
+
+    indices: increasing indices of the points the trajectory is fitted through, must contain
+    the first and the last one (default all of them)
+
+    verify_kwargs: passed to verify_trajectory (clearance, max_speed, ...)
+
+    Returns a Repair_result.
+    """
+    t0 = time.perf_counter()
+    if indices is None:
+        indices = range(len(path_points))
+
+    # fitted waypoints and their position along the original path (fractional for midpoints)
+    points = [path_points[i] for i in indices]
+    sources = [float(i) for i in indices]
+
+    _, pc_pols = calculate_trajectory4D(points)
+    verification = verify_trajectory(pc_pols, checker, **verify_kwargs)
+
+    iterations = 0
+    while not verification.valid and iterations < max_iterations and time.perf_counter() - t0 < time_budget:
+        iterations += 1
+        k = verification.segment
+
+        skipped = range(floor(sources[k]) + 1, ceil(sources[k+1]))
+        if len(skipped):
+            i = skipped[len(skipped) // 2]
+            points.insert(k + 1, path_points[i])
+            sources.insert(k + 1, float(i))
+        else:
+            points.insert(k + 1, midpoint(points[k], points[k+1]))
+            sources.insert(k + 1, (sources[k] + sources[k+1]) / 2)
+
+        # waypoints lo..hi of the new list replace the pieces lo..hi-2 of the old trajectory
+        lo = max(0, k - window)
+        hi = min(len(points) - 1, k + 2 + window)
+        start_derivatives = piece_derivatives(pc_pols, lo, 0.0) if lo > 0 else None
+        end_derivatives = None
+        if hi < len(points) - 1:
+            end_derivatives = piece_derivatives(pc_pols, hi - 2, pc_pols[0].time_durations[hi - 2])
+
+        t_lo = points[lo].t
+        window_points = [Point_time(p.wp, p.t - t_lo) for p in points[lo:hi+1]]
+        _, window_pc_pols = calculate_trajectory4D(window_points, start_derivatives, end_derivatives)
+
+        pc_pols = splice_pieces(pc_pols, lo, hi - 1, window_pc_pols)
+        verification = verify_trajectory(pc_pols, checker, **verify_kwargs)
+
+    return Repair_result(pc_pols, points, verification, iterations, time.perf_counter() - t0)
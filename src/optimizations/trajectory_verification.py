@@ -0,0 +1,128 @@
+import numpy as np
+
+try:
+    from uav_trajectory import *
+except:
+    from .uav_trajectory import *
+
+
+def trajectory_coefficients(traj):
+    """
+    Stack the pieces of a trajectory into arrays.
+
+    traj: Trajectory (loaded from a csv) or the [x, y, z, yaw] list of PiecewisePolynomial
+    returned by calculate_trajectory4D
+
+    Returns (coeffs, durations): coeffs is (n, 4, 8) with the x, y, z, yaw coefficients of
+    every piece in ascending order, durations is (n,).
+    """
+    if isinstance(traj, Trajectory):
+        coeffs = np.array([[np.ravel(pol.p) for pol in (p.px, p.py, p.pz, p.pyaw)]
+                           for p in traj.polynomials], dtype=np.float64)
+        durations = np.array([p.duration for p in traj.polynomials], dtype=np.float64)
+    else:
+        coeffs = np.array([[np.ravel(pc_pol.pols[j].p) for pc_pol in traj]
+                           for j in range(traj[0].nOfPols)], dtype=np.float64)
+        durations = np.asarray(traj[0].time_durations, dtype=np.float64)
+
+    return coeffs, durations
+
+
+def derivative_coefficients(coeffs):
+    """
+    Coefficients of the time derivative, same (n, 4, 8) layout (the last one is zero).
+    """
+    d = np.zeros_like(coeffs)
+    d[..., :-1] = coeffs[..., 1:] * np.arange(1, coeffs.shape[-1])
+
+    return d
+
+
+def evaluate_pieces(coeffs, durations, times):
+    """
+    Evaluate the (n, 4, 8) pieces at the (N,) global times in one einsum.
+
+    Returns (states, segments): (N, 4) x, y, z, yaw values and the (N,) piece indices.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+
+    segments = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, len(durations) - 1)
+    t = times - starts[segments]
+    powers = t[:, None] ** np.arange(coeffs.shape[-1])
+
+    return np.einsum("nk,njk->nj", powers, coeffs[segments]), segments
+
+
+def max_point_speed(coeffs, durations, robot_radius=0.0, samples_per_piece=64):
+    """
+    Largest speed of a robot point along the trajectory: |velocity| + robot_radius * |yaw rate|,
+    taken over samples_per_piece samples of every piece.
+    """
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    u = np.linspace(0, 1, samples_per_piece)
+    times = (starts[:, None] + durations[:, None] * u).ravel()
+
+    vel, _ = evaluate_pieces(derivative_coefficients(coeffs), durations, times)
+    return float(np.max(np.linalg.norm(vel[:, :3], axis=1) + robot_radius * np.abs(vel[:, 3])))
+
+
+class Verification_result():
+    def __init__(self, valid, t=None, segment=None, state=None, n_samples=0, dt=0.0) -> None:
+        self.valid = valid
+        # first violating time, its piece index and (x, y, z, yaw), None when valid
+        self.t = t
+        self.segment = segment
+        self.state = state
+        # number of samples checked and the sampling step
+        self.n_samples = n_samples
+        self.dt = dt
+
+    def __bool__(self):
+        return self.valid
+
+    def __repr__(self):
+        if self.valid:
+            return "Trajectory valid ({} samples, dt={:.4f} s)".format(self.n_samples, self.dt)
+        return "Trajectory collides at t={:.4f} s, segment {}, state {}".format(
+            self.t, self.segment, np.round(self.state, 4).tolist())
+
+
+def verify_trajectory(traj, checker, clearance=0.02, max_speed=None, robot_radius=None,
+                      chunk_size=4096):
+    """
+    Check a min-snap trajectory against the environment by dense sampling.
+
+    The step is dt = clearance / max_speed, so no robot point moves more than `clearance`
+    between two consecutive samples. max_speed defaults to the largest point speed of the
+    trajectory (see max_point_speed). The samples are evaluated in one NumPy call and checked
+    in time order, chunk by chunk, so a collision near the start returns early.
+
+    checker: anything with a batch check, e.g. Fcl_checker (check_collision_batch) or
+    a collision_backends.Collision_backend (check_states), taking (N, 3) positions and (N,) yaws
+
+    robot_radius: defaults to checker.robot_radius when the checker has one
+
+    Returns a Verification_result.
+    """
+    coeffs, durations = trajectory_coefficients(traj)
+    if robot_radius is None:
+        robot_radius = getattr(checker, "robot_radius", 0.0)
+    if max_speed is None:
+        max_speed = max_point_speed(coeffs, durations, robot_radius)
+
+    total = float(np.sum(durations))
+    n = max(2, int(np.ceil(total * max_speed / clearance)) + 1)
+    times = np.linspace(0, total, n)
+    states, segments = evaluate_pieces(coeffs, durations, times)
+
+    check = getattr(checker, "check_states", None) or checker.check_collision_batch
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        collisions = np.asarray(check(states[start:stop, :3], states[start:stop, 3]), dtype=bool)
+        if collisions.any():
+            i = start + int(np.argmax(collisions))
+            return Verification_result(False, float(times[i]), int(segments[i]), states[i],
+                                       i + 1, times[1] - times[0])
+
+    return Verification_result(True, n_samples=n, dt=times[1] - times[0])
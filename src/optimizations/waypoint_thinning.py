@@ -0,0 +1,115 @@
+import numpy as np
+
+try:
+    from uav_trajectory import *
+    from calculatingTrajectories import calculate_trajectory4D
+    from trajectory_verification import trajectory_coefficients, evaluate_pieces
+except:
+    from .uav_trajectory import *
+    from .calculatingTrajectories import calculate_trajectory4D
+    from .trajectory_verification import trajectory_coefficients, evaluate_pieces
+
+
+def points_array(traj_points):
+    """
+    (N, 4) x, y, z, yaw array and (N,) times of a list of Point_time.
+    """
+    states = np.array([[p.wp.getType(k) for k in range(4)] for p in traj_points], dtype=np.float64)
+    times = np.array([p.t for p in traj_points], dtype=np.float64)
+
+    return states, times
+
+
+def polyline_distance(points, polyline):
+    """
+    Distance of every (M, 3) point to the (N, 3) polyline.
+    """
+    a, b = polyline[:-1], polyline[1:]
+    ab = b - a
+    lengths = np.maximum(np.einsum("ij,ij->i", ab, ab), 1e-12)
+
+    u = np.clip(np.einsum("mij,ij->mi", points[:, None, :] - a, ab) / lengths, 0, 1)
+    closest = a + u[..., None] * ab
+
+    return np.linalg.norm(points[:, None, :] - closest, axis=-1).min(axis=1)
+
+
+def thin_line(states, clearance=0.05, yaw_tolerance=0.1):
+    """
+    Greedy thinning against the straight line: from every kept waypoint skip to the farthest one
+    such that all the waypoints in between are within clearance of the chord (and their yaw within
+    yaw_tolerance of the interpolated one).
+
+    Returns the kept indices, the first and last waypoint are always kept.
+    """
+    n = len(states)
+    kept = [0]
+    i = 0
+    while i < n - 1:
+        j = i + 1
+        while j + 1 < n:
+            a, b = states[i], states[j + 1]
+            inner = states[i+1:j+1]
+
+            ab = b[:3] - a[:3]
+            u = np.clip((inner[:, :3] - a[:3]) @ ab / max(ab @ ab, 1e-12), 0, 1)
+            deviation = np.linalg.norm(inner[:, :3] - (a[:3] + u[:, None] * ab), axis=1)
+            yaw_deviation = np.abs(inner[:, 3] - (a[3] + u * (b[3] - a[3])))
+
+            if deviation.max() > clearance or yaw_deviation.max() > yaw_tolerance:
+                break
+            j += 1
+
+        kept.append(j)
+        i = j
+
+    return kept
+
+
+def thin_indices(traj_points, clearance=0.05, yaw_tolerance=0.1, fitted=True, samples_per_piece=20,
+                 max_iterations=50):
+    """
+    Drop the waypoints the min-snap trajectory does not need while it stays inside the corridor
+    of radius `clearance` around the (collision free) input path.
+
+    The waypoints are first thinned against straight chords (thin_line). With fitted=True the
+    min-snap trajectory through the kept ones is then sampled and, while a sample is farther
+    than clearance from the input path, the skipped waypoint in the middle of the offending
+    piece is put back.
+
+    traj_points: list of Point_time, the kept ones keep their original times
+
+    Returns the increasing indices of the kept waypoints (e.g. for trajectory_repair).
+    """
+    states, _ = points_array(traj_points)
+    kept = thin_line(states, clearance, yaw_tolerance)
+
+    for _ in range(max_iterations if fitted else 0):
+        _, pc_pols = calculate_trajectory4D([traj_points[i] for i in kept])
+        coeffs, durations = trajectory_coefficients(pc_pols)
+
+        starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+        u = np.linspace(0, 1, samples_per_piece)
+        sample_times = (starts[:, None] + durations[:, None] * u).ravel()
+        samples, pieces = evaluate_pieces(coeffs, durations, sample_times)
+
+        outside = np.flatnonzero(polyline_distance(samples[:, :3], states[:, :3]) > clearance)
+        # pieces without a skipped waypoint cannot be refined
+        outside = [k for k in pieces[outside] if kept[k + 1] - kept[k] > 1]
+        if not outside:
+            break
+
+        k = outside[0]
+        kept.insert(k + 1, (kept[k] + kept[k + 1]) // 2)
+
+    return kept
+
+
+def thin_waypoints(traj_points, clearance=0.05, yaw_tolerance=0.1, fitted=True, samples_per_piece=20,
+                   max_iterations=50):
+    """
+    The list of Point_time kept by thin_indices.
+    """
+    kept = thin_indices(traj_points, clearance, yaw_tolerance, fitted, samples_per_piece, max_iterations)
+
+    return [traj_points[i] for i in kept]
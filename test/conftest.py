@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STL_DIR = os.path.join(ROOT, "resources", "stl")
+
+# the modules are imported flat (their ImportError fallback), the package __init__ needs ROS
+sys.path.insert(0, os.path.join(ROOT, "src", "RigidBodyPlanners"))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+def stl(name):
+    return os.path.join(STL_DIR, name)
+
+
+def random_poses(n, low, high, seed=0):
+    """
+    n random positions of the box low..high and yaws, as (n, 3) and (n,) arrays.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(low, high, (n, 3)), rng.uniform(-np.pi, np.pi, n)
+
+
+@pytest.fixture
+def planner():
+    """
+    PlannerSepCollision of one drone in the hole scene, skipped without OMPL and ROS.
+    """
+    pytest.importorskip("ompl")
+    rospy = pytest.importorskip("rospy")
+    pytest.importorskip("tf")
+    from RB_planning_sep_coll_check import PlannerSepCollision
+    from robot_geometry import Formation_geometry
+    from scene_env import Fcl_scene
+
+    rospy.rostime.set_rostime_initialized(True)
+    return PlannerSepCollision(Fcl_scene(stl("env-scene-hole.stl")), Formation_geometry([[0, 0, 0]], 0.1))
+
+
+def add_block(planner):
+    """
+    Add the runtime obstacle of the planner tests, a wall across the hole at y = 2.
+    """
+    import fcl
+
+    planner.add_obstacle("block", fcl.Box(0.4, 1.2, 2.2), [0.0, 2.0, 1.5])
+
+
+def pytest_configure(config):
+    # keep the tests out of the on-disk mesh cache of the user
+    from mesh_cache import registry
+    registry.use_disk = False
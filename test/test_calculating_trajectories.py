@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+# without scipy the banded solver falls back to the dense one
+pytest.importorskip("scipy")
+
+from optimizations.calculatingTrajectories import calculate_trajectory1D, calculate_trajectory4D
+from optimizations.uav_trajectory import Point_time, Waypoint
+
+
+def random_path(n, seed=0):
+    rng = np.random.default_rng(seed)
+    states = np.cumsum(rng.uniform(-0.5, 0.5, (n, 4)), axis=0)
+    times = np.concatenate([[0.0], np.cumsum(rng.uniform(0.2, 1.5, n - 1))])
+    return [Point_time(Waypoint(*s), t=t) for s, t in zip(states, times)]
+
+
+def coefficients(pols):
+    return np.concatenate([p.p for p in pols])
+
+
+@pytest.mark.parametrize("n", [2, 3, 10, 60])
+def test_banded_matches_dense(n):
+    points = random_path(n, seed=n)
+    for wp_type in range(4):
+        dense, _ = calculate_trajectory1D(points, wp_type, solver="dense")
+        banded, _ = calculate_trajectory1D(points, wp_type, solver="banded")
+
+        expected = coefficients(dense)
+        assert np.allclose(coefficients(banded), expected, rtol=1e-9, atol=1e-9 * np.abs(expected).max())
+
+
+def test_banded_matches_dense_with_end_derivatives():
+    points = random_path(20, seed=1)
+    rng = np.random.default_rng(2)
+    start, end = rng.normal(size=(4, 3)), rng.normal(size=(4, 3))
+
+    dense, _ = calculate_trajectory4D(points, start, end, solver="dense")
+    banded, _ = calculate_trajectory4D(points, start, end, solver="banded")
+
+    for d, b in zip(dense, banded):
+        expected = coefficients(d)
+        assert np.allclose(coefficients(b), expected, rtol=1e-9, atol=1e-9 * np.abs(expected).max())
+
+
+def test_unknown_solver():
+    with pytest.raises(ValueError):
+        calculate_trajectory1D(random_path(3), solver="sparse")
@@ -0,0 +1,32 @@
+import numpy as np
+
+from conftest import stl
+from collision_backends import Fcl_bvh_backend, Primitive_backend, calibrate_backends, surface_states
+from fcl_checker import Fcl_checker
+from robot_geometry import Formation_geometry
+
+
+def test_surface_states_are_close_to_the_obstacles():
+    backend = Fcl_bvh_backend(Fcl_checker(stl("env-scene-hole.stl"), stl("custom_triangle_robot.stl")))
+    low, high = backend.checker.env.bounds
+    positions, yaws = surface_states(backend, low, high, 300, band=0.1, rng=np.random.default_rng(0))
+
+    assert len(positions) == 300
+    distances = backend.distances(positions, yaws)
+    assert np.all(distances <= 0.1)
+    assert np.any(backend.check_states(positions, yaws))
+    assert not np.all(backend.check_states(positions, yaws))
+
+
+def test_backends_of_another_robot_are_not_selected():
+    mesh = Fcl_bvh_backend(Fcl_checker(stl("env-scene-hole.stl"), stl("custom_triangle_robot.stl")))
+    drones = Primitive_backend(stl("env-scene-hole.stl"), Formation_geometry([[0, 0, 0]], 0.05))
+    low, high = mesh.checker.env.bounds
+
+    result = calibrate_backends([mesh, drones], low, high, n_samples=200)
+    assert result.best is mesh
+    assert np.isnan(result.table[drones.name]["agreement"])
+
+    # and the other way around
+    result = calibrate_backends([drones, mesh], low, high, n_samples=200)
+    assert result.best is drones
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ompl")
+
+from conftest import stl, add_block
+from corridor import Coarse_grid, find_corridor, CELL_UNKNOWN, CELL_FREE
+from fcl_checker import Fcl_checker
+from robot_geometry import Formation_geometry
+
+LOW, HIGH = [-3.0, -2.0, -2.0], [3.0, 2.0, 2.0]
+
+
+@pytest.fixture(scope="module")
+def check_states():
+    checker = Fcl_checker(stl("env-scene-hole.stl"), Formation_geometry([[0, 0, 0], [0.5, 0, 0]], 0.15))
+    return lambda states: checker.check_collision_batch(states[:, :3], states[:, 3])
+
+
+def test_lazy_cells_match_the_checker(check_states):
+    grid = Coarse_grid.build(check_states, LOW, HIGH, resolution=0.25, yaw_bins=8)
+    path = find_corridor(grid, [-2.0, -1.5, 0.0, 0.0], [2.0, 1.5, 0.5, 1.0])
+
+    assert path is not None
+    checked = np.argwhere(grid.cells != CELL_UNKNOWN)
+    assert grid.checked == len(checked) < grid.cells.size
+    free = ~check_states(grid.centers(checked))
+    assert np.array_equal(grid.cells[tuple(checked.T)] == CELL_FREE, free)
+    # the path goes through the hole of the wall, over free cells only
+    assert grid.classify(path[1:-1]).all()
+
+
+def test_open_space_query_checks_few_cells(check_states):
+    grid = Coarse_grid.build(check_states, LOW, HIGH, resolution=0.25, yaw_bins=8)
+    path = find_corridor(grid, [-2.0, -1.0, -1.0, 3.0], [-1.0, -1.0, -1.0, -3.0])
+
+    assert path is not None
+    assert grid.checked < 0.01 * grid.cells.size
+
+
+@pytest.mark.parametrize("mode", ["sampler", "bounds"])
+def test_obstacle_drops_the_corridor(planner, mode):
+    planner.set_bounds([-2.0, 1.0, 0.5], [2.0, 3.0, 2.5])
+    planner.set_start_goal_states([-1.5, 2.0, 1.5, 0.0], [1.5, 2.0, 1.5, 0.0])
+    assert planner.plan_corridor(mode=mode) is not None
+
+    add_block(planner)
+    assert planner.corridor is None and planner.corridor_bias is None
+    assert planner.bounds_before_corridor is None
+    bounds = planner.space.getBounds()
+    assert [bounds.low[i] for i in range(3)] == [-2.0, 1.0, 0.5]
+    assert [bounds.high[i] for i in range(3)] == [2.0, 3.0, 2.5]
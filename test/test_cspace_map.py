@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from conftest import stl, random_poses
+from cspace_map import Cspace_map
+from fcl_checker import Fcl_checker
+from sdf import Sdf_grid, SDF_FREE, SDF_COLLIDING, SDF_UNKNOWN
+
+LOW, HIGH = [-2.0, -1.0, -1.0], [2.0, 1.0, 1.0]
+
+
+@pytest.fixture(scope="module")
+def checker():
+    return Fcl_checker(stl("env-scene-hole.stl"), stl("custom_triangle_robot.stl"))
+
+
+@pytest.fixture(scope="module")
+def cspace_map(checker):
+    checker.set_sdf(Sdf_grid.from_mesh(checker.env, voxel_size=0.05, padding=1.0))
+    try:
+        return Cspace_map.build(checker, LOW, HIGH, resolution=0.2, yaw_bins=8)
+    finally:
+        checker.set_sdf(None)
+
+
+# poses around the map, some of them outside
+POSE_LOW, POSE_HIGH = np.array(LOW) - 0.3, np.array(HIGH) + 0.3
+
+
+def test_lookup_matches_lookup_batch(cspace_map):
+    positions, yaws = random_poses(3000, POSE_LOW, POSE_HIGH)
+    expected = cspace_map.lookup_batch(positions, yaws)
+    answers = np.array([cspace_map.lookup(*p, yaw) for p, yaw in zip(positions, yaws)])
+
+    assert np.array_equal(answers, expected)
+    assert cspace_map.hits + cspace_map.misses == 2 * len(positions)
+
+
+def test_map_agrees_with_fcl(checker, cspace_map):
+    positions, yaws = random_poses(3000, POSE_LOW, POSE_HIGH, seed=1)
+    answers = cspace_map.lookup_batch(positions, yaws)
+    collisions = checker.check_collision_batch(positions, yaws)
+
+    assert np.count_nonzero(answers == SDF_FREE) > 0
+    assert not np.any(collisions[answers == SDF_FREE])
+    # colliding cells are certified through the SDF, which also counts a robot buried in the wall
+    colliding = answers == SDF_COLLIDING
+    assert np.all(collisions[colliding] | (checker.env.bounds[0][1] < positions[colliding, 1]) &
+                  (positions[colliding, 1] < checker.env.bounds[1][1]))
+
+
+def test_save_load_round_trip(cspace_map, tmp_path):
+    path = str(tmp_path / "map.npz")
+    cspace_map.save(path)
+    loaded = Cspace_map.load(path)
+
+    positions, yaws = random_poses(500, POSE_LOW, POSE_HIGH, seed=2)
+    assert np.array_equal(loaded.lookup_batch(positions, yaws), cspace_map.lookup_batch(positions, yaws))
+    assert loaded.env_hash == cspace_map.env_hash
+    assert loaded.robot_hash == cspace_map.robot_hash
+
+
+def test_planner_rejects_a_map_of_another_robot(cspace_map):
+    pytest.importorskip("ompl")
+    pytest.importorskip("rospy")
+    pytest.importorskip("tf")
+    from RB_planning_sep_coll_check import PlannerSepCollision
+    from robot_geometry import Formation_geometry
+
+    planner = PlannerSepCollision(stl("env-scene-hole.stl"), Formation_geometry([[0, 0, 0]], 0.1))
+    with pytest.raises(ValueError):
+        planner.set_cspace_map(cspace_map)
@@ -0,0 +1,43 @@
+import fcl
+import numpy as np
+
+from conftest import stl, add_block
+from experience_library import Experience_library
+from robot_geometry import Formation_geometry
+from scene_env import Fcl_scene
+
+PATH = np.array([[-1.5, 2.0, 1.5, 0.0], [0.0, 2.0, 1.5, 0.0], [1.5, 2.0, 1.5, 0.0]])
+
+
+def test_library_is_reloaded_for_the_same_scene(tmp_path):
+    scene = Fcl_scene(stl("env-scene-hole.stl"))
+    robot = Formation_geometry([[0, 0, 0]], 0.1)
+
+    Experience_library(scene.content_hash, robot.content_hash, directory=str(tmp_path)).add(PATH)
+    library = Experience_library(scene.content_hash, robot.content_hash, directory=str(tmp_path))
+
+    assert len(library) == 1
+    assert np.array_equal(library.retrieve(PATH[0], PATH[-1])[0][1], PATH)
+
+
+def test_obstacle_changes_the_library(tmp_path):
+    scene = Fcl_scene(stl("env-scene-hole.stl"))
+    robot = Formation_geometry([[0, 0, 0]], 0.1)
+    Experience_library(scene.content_hash, robot.content_hash, directory=str(tmp_path)).add(PATH)
+
+    scene.add_object("block", fcl.Box(0.4, 1.2, 2.2), [0.0, 2.0, 1.5])
+    library = Experience_library(scene.content_hash, robot.content_hash, directory=str(tmp_path))
+    assert len(library) == 0
+
+    scene.remove_object("block")
+    library = Experience_library(scene.content_hash, robot.content_hash, directory=str(tmp_path))
+    assert len(library) == 1
+
+
+def test_planner_drops_the_stale_library(planner, tmp_path):
+    planner.use_experience(directory=str(tmp_path))
+    planner.experience.add(PATH)
+
+    add_block(planner)
+    assert planner.experience.env_hash == planner.checker.env.content_hash
+    assert planner.experience.retrieve(PATH[0], PATH[-1]) == []
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from conftest import stl, random_poses
+from fcl_checker import Fcl_checker
+from robot_geometry import Formation_geometry
+
+ROBOTS = {"mesh": lambda: stl("custom_triangle_robot.stl"),
+          "formation": lambda: Formation_geometry([[0, 0, 0], [0.5, 0, 0]], 0.15)}
+
+
+@pytest.fixture(scope="module", params=sorted(ROBOTS))
+def checker(request):
+    return Fcl_checker(stl("env-scene-hole.stl"), ROBOTS[request.param]())
+
+
+# around the hole scene
+LOW, HIGH = [-3.0, -1.5, -2.0], [3.0, 1.5, 2.0]
+
+
+def test_distance_batch_matches_distance(checker):
+    positions, yaws = random_poses(200, LOW, HIGH)
+    expected = [checker.distance(p, yaw) for p, yaw in zip(positions, yaws)]
+
+    distances = checker.distance_batch(positions, yaws)
+    assert np.allclose(distances, expected)
+    # fcl reports ~0 (not always exactly 0) for the colliding poses
+    assert np.array_equal(distances < 1e-9, checker.check_collision_batch(positions, yaws))
+
+
+def dense_first_collision(checker, start, end, resolution=0.005):
+    """
+    Motion parameter of the first colliding sample of start -> end, None when all are free.
+    """
+    motion = np.linalg.norm(end[:3] - start[:3]) + checker.robot_radius * abs(end[3] - start[3])
+    ts = np.linspace(0, 1, max(2, int(np.ceil(motion / resolution)) + 1))
+    states = start + (end - start) * ts[:, None]
+    collisions = checker.check_collision_batch(states[:, :3], states[:, 3])
+
+    return float(ts[np.argmax(collisions)]) if collisions.any() else None
+
+
+def test_check_motion_is_conservative(checker):
+    rng = np.random.default_rng(1)
+    starts, _ = random_poses(150, LOW, HIGH, seed=2)
+    starts = np.column_stack([starts, rng.uniform(-np.pi, np.pi, len(starts))])
+    ends = starts + np.column_stack([rng.normal(0, 0.6, (len(starts), 3)), rng.normal(0, 0.5, len(starts))])
+
+    agree = 0
+    for start, end in zip(starts, ends):
+        valid, t_free = checker.check_motion(start, end)
+        first = dense_first_collision(checker, start, end)
+
+        if first is not None:
+            assert not valid
+            assert t_free <= first
+        agree += valid == (first is None)
+
+    # only the edges grazing an obstacle within the tolerance may be rejected
+    assert agree >= 0.95 * len(starts)
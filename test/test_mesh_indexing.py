@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from conftest import stl
+from fcl_checker import Fcl_mesh
+from mesh_indexing import Vertex_indexer, index_stl, iter_stl_chunks
+
+
+@pytest.mark.parametrize("name", ["custom_triangle_robot.stl", "env-scene-hole.stl"])
+def test_index_stl_matches_create_indexed_triangles(name):
+    legacy = Fcl_mesh(stl(name), use_cache=False, vectorized=False)
+    verts, tris = index_stl(stl(name))
+
+    # same vertices and triangles, the vertex order differs
+    assert len(verts) == len(legacy.verts)
+    assert np.allclose(np.unique(verts, axis=0), legacy.verts, atol=1e-6)
+    assert tris.shape == legacy.tris.shape
+    assert np.allclose(verts[tris], legacy.verts[legacy.tris], atol=1e-6)
+
+
+def test_chunks_share_their_vertices():
+    name = stl("env-scene-hole.stl")
+    expected = index_stl(name)
+
+    indexer = Vertex_indexer()
+    for vectors in iter_stl_chunks(name, chunk_size=7):
+        indexer.add(vectors)
+    verts, tris = indexer.tables()
+
+    # a vertex shared by two chunks is stored once
+    assert len(verts) == len(expected[0])
+    assert np.array_equal(verts[tris], expected[0][expected[1]])
@@ -0,0 +1,65 @@
+import fcl
+import numpy as np
+import pytest
+
+from octree_env import Fcl_octree, voxelize_point_cloud
+
+
+@pytest.fixture(scope="module")
+def cloud(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    points = rng.uniform([-1, -2, 0], [3, 1, 2], (20000, 3))
+    path = str(tmp_path_factory.mktemp("cloud") / "cloud.npy")
+    np.save(path, points)
+    return path, points
+
+
+def sphere(center, radius):
+    return fcl.CollisionObject(fcl.Sphere(radius), fcl.Transform(np.asarray(center, dtype=np.float64)))
+
+
+def voxel_distance(voxels, resolution, center):
+    low = voxels * resolution
+    gap = np.maximum(np.maximum(low - center, 0), center - (low + resolution))
+    return np.linalg.norm(gap, axis=1).min()
+
+
+def test_octree_matches_the_voxels(cloud):
+    path, points = cloud
+    resolution = 0.1
+    octree = Fcl_octree(path, resolution)
+    voxels = np.unique(np.floor(points / resolution).astype(int), axis=0)
+    assert octree.n_voxels == len(voxels)
+
+    rng = np.random.default_rng(1)
+    for center in rng.uniform([-1.5, -2.5, -0.5], [3.5, 1.5, 2.5], (500, 3)):
+        d = voxel_distance(voxels, resolution, center)
+        colliding = octree.collide(sphere(center, 0.03), fcl.CollisionRequest(), fcl.CollisionResult())
+        assert bool(colliding) == (d < 0.03)
+        if not colliding:
+            assert octree.distance(sphere(center, 0.03)) == pytest.approx(d - 0.03, abs=1e-6)
+
+
+def test_octree_is_compact(tmp_path):
+    # one voxel thick 10 x 10 m floor, nothing to prune
+    g = np.arange(-5, 5, 0.05) + 0.025
+    x, y = np.meshgrid(g, g)
+    path = str(tmp_path / "floor.npy")
+    np.save(path, np.stack([x.ravel(), y.ravel(), np.full(x.size, 0.01)], axis=1))
+
+    octree = Fcl_octree(path, 0.05)
+    assert octree.n_voxels == len(g) ** 2
+    # 2 bytes per inner node
+    assert len(octree.data) < 2 * octree.n_voxels
+
+    assert octree.collide(sphere([1.0, 2.0, 0.05], 0.1), fcl.CollisionRequest(), fcl.CollisionResult())
+    assert octree.distance(sphere([1.0, 2.0, 0.5], 0.1)) == pytest.approx(0.35)
+
+
+def test_crop(cloud):
+    path, _ = cloud
+    origin, keys = voxelize_point_cloud(path, 0.1, crop_low=[0, 0, 0], crop_high=[1, 1, 1])
+    octree = Fcl_octree(path, 0.1, crop_low=[0, 0, 0], crop_high=[1, 1, 1])
+
+    assert octree.n_voxels == len(keys)
+    assert np.all(octree.bounds[0] >= -1e-9) and np.all(octree.bounds[1] <= 1.1 + 1e-9)
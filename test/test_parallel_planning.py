@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from conftest import add_block
+
+START, GOAL = [-1.5, 2.0, 1.5, 0.0], [1.5, 2.0, 1.5, 0.0]
+
+
+def dense_motion_valid(checker, states, step=0.01):
+    for a, b in zip(states[:-1], states[1:]):
+        n = max(2, int(np.ceil(np.linalg.norm(b[:3] - a[:3]) / step)) + 1)
+        poses = a + np.linspace(0, 1, n)[:, None] * (b - a)
+        if checker.check_collision_batch(poses[:, :3], poses[:, 3]).any():
+            return False
+
+    return True
+
+
+@pytest.fixture
+def blocked_planner(planner):
+    planner.set_bounds([-2.0, 1.0, 0.5], [2.0, 3.0, 2.5])
+    # wall between the start and the goal, only added at runtime
+    add_block(planner)
+    planner.set_start_goal_states(START, GOAL)
+    return planner
+
+
+def test_clone_keeps_the_runtime_obstacles_and_settings(blocked_planner):
+    planner = blocked_planner
+    planner.enable_validity_cache(pos_resolution=0.02)
+    clone = planner.clone()
+
+    bounds = clone.space.getBounds()
+    assert [bounds.low[i] for i in range(3)] == [-2.0, 1.0, 0.5]
+    assert [bounds.high[i] for i in range(3)] == [2.0, 3.0, 2.5]
+    assert clone.checker.env.content_hash == planner.checker.env.content_hash
+    assert clone.checker.check_collision([0.0, 2.0, 1.5])
+    assert clone.validity_cache is not planner.validity_cache
+    assert clone.validity_cache.pos_resolution == 0.02
+    assert clone.objective_class is planner.objective_class
+
+
+def test_race_avoids_the_runtime_obstacle(blocked_planner):
+    planner = blocked_planner
+    assert not dense_motion_valid(planner.checker, np.array([START, GOAL]))
+
+    result = planner.solve_race(timeout=10.0, planners=["RRTConnect", "RRT"], seeds=[1, 2])
+
+    assert result.states is not None
+    assert not planner.check_states(result.states).any()
+    assert dense_motion_valid(planner.checker, result.states)
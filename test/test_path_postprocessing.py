@@ -0,0 +1,33 @@
+import numpy as np
+
+from conftest import stl
+from fcl_checker import Fcl_checker
+from path_postprocessing import resample_path
+from robot_geometry import Formation_geometry
+
+PATH = np.array([[-2.0, -1.2, 0.0, 0.0], [0.0, -1.0, 0.0, 0.5], [0.0, 1.0, 0.2, 2.5], [2.0, 1.2, 0.5, 2.5]])
+
+
+def test_resample_follows_the_clearance():
+    checker = Fcl_checker(stl("env-scene-hole.stl"), Formation_geometry([[0, 0, 0]], 0.15))
+    calls = []
+
+    def clearances(positions, yaws):
+        calls.append(len(positions))
+        return checker.distance_batch(positions, yaws)
+
+    waypoints = resample_path(PATH, clearances, min_step=0.05, max_step=0.5, max_yaw_step=0.3)
+
+    # one call per step of the longest walk, not one per waypoint
+    assert len(calls) < len(waypoints) / 2
+    for vertex in PATH:
+        assert np.isclose(waypoints, vertex).all(axis=1).any()
+
+    steps = np.linalg.norm(np.diff(waypoints[:, :3], axis=0), axis=1)
+    # the last step of an edge may be down to min_step / 2
+    assert steps.min() >= 0.05 / 2 - 1e-9
+    assert steps.max() <= 0.5 + 0.05 / 2 + 1e-9
+    assert np.abs(np.diff(waypoints[:, 3])).max() <= 0.3 + 1e-9
+    # dense next to the wall (y = 0), sparse in the open
+    middle = (waypoints[1:, :3] + waypoints[:-1, :3]) / 2
+    assert steps[np.abs(middle[:, 1]) < 0.4].mean() < steps[np.abs(middle[:, 1]) > 0.8].mean()
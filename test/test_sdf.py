@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from conftest import stl, random_poses
+from fcl_checker import Fcl_checker, quaternions_wxyz
+from sdf import Sdf_grid, SDF_FREE, SDF_COLLIDING, rotate_points
+
+
+@pytest.fixture(scope="module")
+def checker():
+    checker = Fcl_checker(stl("env-scene-hole.stl"), stl("custom_triangle_robot.stl"))
+    checker.set_sdf(Sdf_grid.from_mesh(checker.env, voxel_size=0.05, padding=1.0))
+    return checker
+
+
+def poses_around(checker, n, seed=0):
+    low, high = checker.env.bounds
+    return random_poses(n, low - 0.5, high + 0.5, seed)
+
+
+def fcl_answers(checker, positions, yaws):
+    sdf, checker.sdf = checker.sdf, None
+    try:
+        return checker.check_collision_batch(positions, yaws)
+    finally:
+        checker.sdf = sdf
+
+
+def test_classify_agrees_with_fcl(checker):
+    positions, yaws = poses_around(checker, 2000)
+    expected = fcl_answers(checker, positions, yaws)
+
+    quats = quaternions_wxyz(yaws)
+    answer = checker.sdf_classify(positions, quats)
+    assert np.count_nonzero(answer == SDF_FREE) > 0
+    assert np.count_nonzero(answer == SDF_COLLIDING) > 0
+    assert not np.any(expected[answer == SDF_FREE])
+
+    # fcl only reports surface contacts, a robot buried inside the (closed) wall counts as
+    # colliding for the field only
+    points = rotate_points(quats, checker.robot.verts) + positions[:, None, :]
+    buried = np.all(checker.sdf.query(points.reshape(-1, 3)).reshape(len(positions), -1) < 0, axis=1)
+    assert np.all((expected | buried)[answer == SDF_COLLIDING])
+
+
+def test_check_collision_agrees_with_batch(checker):
+    positions, yaws = poses_around(checker, 500, seed=1)
+    expected = checker.check_collision_batch(positions, yaws)
+    assert np.any(checker.sdf_classify(positions, quaternions_wxyz(yaws)) == SDF_COLLIDING)
+
+    for p, yaw, e in zip(positions, yaws, expected):
+        q = [0, 0, np.sin(yaw / 2), np.cos(yaw / 2)]
+        assert bool(checker.check_collision(list(p), q)) == e
+
+
+def test_query_one_matches_query(checker):
+    positions, _ = poses_around(checker, 200, seed=2)
+    expected = checker.sdf.query(positions)
+    values = np.array([checker.sdf.query_one(*p) for p in positions])
+
+    assert np.array_equal(np.isnan(values), np.isnan(expected))
+    assert np.allclose(values[~np.isnan(values)], expected[~np.isnan(expected)])
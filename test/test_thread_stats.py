@@ -0,0 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from thread_stats import Thread_stats
+
+
+def test_finished_threads_are_folded():
+    stats = Thread_stats()
+    for _ in range(20):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: stats.add("calls"), range(8)))
+    stats.add("calls")
+
+    assert stats.get("calls") == 20 * 8 + 1
+    assert stats.totals() == {"calls": 20 * 8 + 1}
+    # the main thread and at most the workers of the last pool
+    assert len(stats._per_thread) <= 5
+
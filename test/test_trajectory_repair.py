@@ -0,0 +1,66 @@
+import numpy as np
+
+from optimizations.trajectory_repair import repair_trajectory, piece_derivatives
+from optimizations.trajectory_verification import verify_trajectory, evaluate_pieces, trajectory_coefficients
+from optimizations.calculatingTrajectories import calculate_trajectory4D
+from optimizations.uav_trajectory import Point_time, Waypoint
+
+
+class Box_checker():
+    """
+    A point robot and one axis aligned box obstacle.
+    """
+    robot_radius = 0.0
+
+    def __init__(self, low, high) -> None:
+        self.low, self.high = np.asarray(low), np.asarray(high)
+
+    def check_states(self, positions, yaws):
+        positions = np.asarray(positions).reshape(-1, 3)
+        return np.all((positions > self.low) & (positions < self.high), axis=1)
+
+
+# the obstacle fills the inside of the corner of an L shaped path, 0.1 away from it
+CHECKER = Box_checker([0.3, 0.1, -1.0], [1.9, 1.7, 1.0])
+
+
+def corner_path(step=0.1):
+    xs = np.arange(0, 2 + step / 2, step)
+    corners = [(x, 0.0) for x in xs] + [(2.0, y) for y in xs[1:]]
+    return [Point_time(Waypoint(x, y, 0.0, 0.0), t=i * step) for i, (x, y) in enumerate(corners)]
+
+
+def test_repair_makes_the_cut_corner_collision_free():
+    path = corner_path()
+    indices = [0, len(path) - 1]
+    _, pc_pols = calculate_trajectory4D([path[i] for i in indices])
+    assert not verify_trajectory(pc_pols, CHECKER).valid
+
+    repair = repair_trajectory(path, CHECKER, indices, max_iterations=50)
+    assert repair.valid
+    assert repair.iterations > 0
+
+    # the trajectory still goes through every waypoint at its time
+    coeffs, durations = trajectory_coefficients(repair.pc_pols)
+    states, _ = evaluate_pieces(coeffs, durations, np.array([p.t for p in repair.points]))
+    expected = np.array([[p.wp.getType(k) for k in range(4)] for p in repair.points])
+    assert np.allclose(states, expected, atol=1e-6)
+
+
+def test_splices_are_continuous_up_to_the_jerk():
+    path = corner_path()
+    # only the pieces around the cut corner are solved again, between kept pieces
+    indices = [0, 5, 10, 30, 35, 40]
+    _, pc_pols = calculate_trajectory4D([path[i] for i in indices])
+    assert not verify_trajectory(pc_pols, CHECKER).valid
+
+    repair = repair_trajectory(path, CHECKER, indices, window=1, max_iterations=50)
+    assert repair.valid
+    assert repair.iterations > 0
+    assert len(repair.points) < len(path)
+
+    durations = repair.pc_pols[0].time_durations
+    for j in range(len(durations) - 1):
+        before = piece_derivatives(repair.pc_pols, j, durations[j])
+        after = piece_derivatives(repair.pc_pols, j + 1, 0.0)
+        assert np.allclose(before, after, atol=1e-6 * max(1.0, np.abs(before).max()))
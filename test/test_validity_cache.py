@@ -0,0 +1,56 @@
+import numpy as np
+
+from conftest import add_block
+from validity_cache import Validity_cache
+
+
+def test_poses_of_a_cell_share_the_answer():
+    cache = Validity_cache(pos_resolution=0.1, yaw_resolution=0.1)
+    cache.put(0.01, 0.02, 0.03, 0.01, False)
+
+    assert cache.get(0.09, 0.05, 0.01, 0.09) is False
+    assert cache.get(0.11, 0.05, 0.01, 0.09) is None
+    # -pi and pi are the same yaw
+    cache.put(0.0, 0.0, 0.0, np.pi, True)
+    assert cache.get(0.0, 0.0, 0.0, -np.pi) is True
+
+
+def test_least_recently_used_is_evicted():
+    cache = Validity_cache(pos_resolution=1.0, max_size=2)
+    cache.put(0.5, 0.5, 0.5, 0.0, True)
+    cache.put(1.5, 0.5, 0.5, 0.0, True)
+    cache.get(0.5, 0.5, 0.5, 0.0)
+    cache.put(2.5, 0.5, 0.5, 0.0, True)
+
+    assert cache.get(1.5, 0.5, 0.5, 0.0) is None
+    assert cache.get(0.5, 0.5, 0.5, 0.0) is True
+    assert cache.stats()["evictions"] == 1
+
+
+def test_conservative_mode_checks_poses_near_the_faces():
+    cache = Validity_cache(pos_resolution=1.0, yaw_resolution=1.0, conservative=True, boundary_margin=0.25)
+    cache.put(0.5, 0.5, 0.5, 0.5, True)
+
+    assert cache.get(0.6, 0.4, 0.5, 0.5) is True
+    assert cache.get(0.9, 0.5, 0.5, 0.5) is None
+    assert cache.stats()["uncertain"] == 1
+
+
+def test_clear_forgets_the_answers():
+    cache = Validity_cache()
+    cache.put(0.0, 0.0, 0.0, 0.0, True)
+    cache.clear()
+
+    assert cache.get(0.0, 0.0, 0.0, 0.0) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_obstacle_invalidates_the_planner_cache(planner):
+    planner.enable_validity_cache(pos_resolution=0.05)
+    state = [0.0, 2.0, 1.5, 0.0]
+    assert planner.isStateValid(state)
+    assert planner.validity_cache.get(*state) is True
+
+    add_block(planner)
+    assert planner.validity_cache.get(*state) is None
+    assert not planner.isStateValid(state)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from optimizations.waypoint_thinning import thin_indices, points_array, polyline_distance
+from optimizations.trajectory_verification import trajectory_coefficients, evaluate_pieces
+from optimizations.calculatingTrajectories import calculate_trajectory4D
+from optimizations.uav_trajectory import Point_time, Waypoint
+
+CLEARANCE = 0.05
+
+
+def curved_path(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 10, n)
+    states = np.stack([2 * np.cos(t), np.sin(1.3 * t), 0.1 * t, 0.2 * np.sin(t)], axis=1)
+    states += rng.normal(0, 0.005, states.shape)
+    return [Point_time(Waypoint(*s), t=ti) for s, ti in zip(states, t)]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fitted_trajectory_stays_in_the_corridor(seed):
+    path = curved_path(seed=seed)
+    kept = thin_indices(path, clearance=CLEARANCE)
+
+    assert kept[0] == 0 and kept[-1] == len(path) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert len(kept) < len(path) / 4
+
+    # much denser than the samples thin_indices checks
+    _, pc_pols = calculate_trajectory4D([path[i] for i in kept])
+    coeffs, durations = trajectory_coefficients(pc_pols)
+    samples, _ = evaluate_pieces(coeffs, durations, np.linspace(0, np.sum(durations), 20000))
+
+    states, _ = points_array(path)
+    assert polyline_distance(samples[:, :3], states[:, :3]).max() <= CLEARANCE
+
+
+def test_dropped_waypoints_are_close_to_the_chords():
+    path = curved_path()
+    kept = thin_indices(path, clearance=CLEARANCE, yaw_tolerance=0.1, fitted=False)
+
+    states, _ = points_array(path)
+    for i, j in zip(kept[:-1], kept[1:]):
+        dropped = states[i+1:j]
+        if len(dropped):
+            assert polyline_distance(dropped[:, :3], states[[i, j], :3]).max() <= CLEARANCE